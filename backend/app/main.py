@@ -1,8 +1,54 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from .routers import chat, cosmos, files, web_search, workflows
+from .services.html_extract import html_extractor
+from .services.cosmos_metrics import CosmosUsageMiddleware
+from .services.metrics import MetricsMiddleware, metrics
+from .services.page_cache import page_cache
+from .services.page_reader import page_reader
+from .services.repository import get_repository
+from .services.resources import resources
+from .services.search_backends import search_backend
+from .services.search_cache import search_cache
+from .services.tracing import TRACE_ID_HEADER, TracingMiddleware, tracer
 
-app = FastAPI(title="Panta Flows API")
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+# Clients and provisioning steps, started in parallel by the lifespan
+storage = get_repository().register_resources(resources)
+resources.register("default_workflows", start=workflows.create_default_workflows, depends_on=(storage,))
+resources.register("workflow_configs", start=workflows.config_registry.refresh, depends_on=(storage,))
+resources.register("openai_chat", start=lambda: asyncio.to_thread(chat.get_client))
+resources.register("openai_files", start=lambda: asyncio.to_thread(files.get_client))
+# The HTML extraction worker pool starts on first use, it only needs stopping
+resources.register("html_extractor", stop=lambda: asyncio.to_thread(html_extractor.shutdown))
+# Export the spans still queued on shutdown
+resources.register("tracing", stop=lambda: asyncio.to_thread(tracer.shutdown))
+
+# Stats the services keep themselves, exported on /metrics next to the histograms
+metrics.register_stats("page_cache", page_cache.stats)
+metrics.register_stats("search_cache", search_cache.stats)
+metrics.register_stats("search_backend", search_backend.stats, label="backend")
+metrics.register_stats("page_download", page_reader.stats)
+metrics.register_stats("html_extraction", html_extractor.stats)
+metrics.register_stats("tracing", tracer.stats)
+metrics.register_stats("resource", lambda: {
+    name: {"up": resource["status"] == "ok", "startup_ms": resource["duration_ms"]}
+    for name, resource in resources.report()["resources"].items()
+}, label="resource")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await resources.start_all()
+    yield
+    await resources.stop_all()
+
+app = FastAPI(title="Panta Flows API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -11,8 +57,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Cosmos-Request-Charge", TRACE_ID_HEADER],
 )
 
+# Attribute Cosmos DB request charges to endpoints
+app.add_middleware(CosmosUsageMiddleware)
+
+# Request latency per route, and the start time the request_parse stage is measured from
+app.add_middleware(MetricsMiddleware)
+
+# Outermost, so the server span of a request covers everything else
+app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 app.include_router(cosmos.router, prefix="/api/cosmos", tags=["cosmos"])
@@ -22,4 +78,14 @@ app.include_router(workflows.router, prefix="/api", tags=["workflows"])
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Panta Flows API"} 
\ No newline at end of file
+    return {"message": "Welcome to Panta Flows API"} 
+
+@app.get("/health")
+async def health():
+    """Startup status and timing of every resource, 503 while any of them is unavailable"""
+    return JSONResponse(resources.report(), status_code=200 if resources.healthy() else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Stage latencies, token counts and service stats in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
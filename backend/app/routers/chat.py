@@ -1,19 +1,31 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from pydantic import BaseModel, Field
+from typing import TYPE_CHECKING, List, Optional, Dict, Any
+from functools import lru_cache
 import os
-from openai import AzureOpenAI
 import json
 import logging
 import traceback
 from .web_search import perform_search
+from .cosmos import ChatMessage as SessionMessage, append_messages, stamp_message
+from ..services.metrics import TOKEN_BUCKETS, metrics, record_request_parse, timed
+from ..services.payload_log import log_payload
+from ..services.repository import NotFoundError, get_repository
+from ..services.tracing import tracer
+
+if TYPE_CHECKING:
+    from openai import AzureOpenAI
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+LLM_TOKENS = metrics.histogram(
+    "llm_tokens", "Tokens of each chat completion call, by call and token kind",
+    ["call", "kind"], buckets=TOKEN_BUCKETS
+)
+
 class ChatMessage(BaseModel):
     role: str
     content: str
@@ -36,6 +48,12 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 800
     file_ids: Optional[List[str]] = None
+    # When both are set, messages holds only the new turn: the history is loaded from
+    # the stored session and the turn is saved there after responding
+    session_id: Optional[str] = None
+    user_id: Optional[str] = None
+    # Stored messages to load: 0 loads none, null loads the whole history
+    history_limit: Optional[int] = Field(20, ge=0)
 
 class ChatResponse(BaseModel):
     id: str
@@ -43,11 +61,19 @@ class ChatResponse(BaseModel):
     usage: ChatUsage
 
 # Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_API_KEY"),
-    api_version="2025-01-01-preview",
-    azure_endpoint=os.getenv("AZURE_ENDPOINT")
-)
+@lru_cache(maxsize=None)
+def get_client() -> "AzureOpenAI":
+    """
+    Create the Azure OpenAI client on first use. The app lifespan creates it at startup,
+    so importing this module stays cheap and never touches the network.
+    """
+    from openai import DEFAULT_CONNECTION_LIMITS, AzureOpenAI, DefaultHttpxClient
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_API_KEY"),
+        api_version="2025-01-01-preview",
+        azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+        http_client=DefaultHttpxClient(transport=tracer.httpx_transport("openai", limits=DEFAULT_CONNECTION_LIMITS))
+    )
 
 # Define available tools
 TOOLS = [
@@ -130,58 +156,93 @@ def convert_openai_response_to_dict(response) -> dict:
         }
     }
 
+def record_usage(call: str, response, span):
+    """
+    Record the prompt and completion tokens of a chat completion response.
+    """
+    if response.usage is not None:
+        LLM_TOKENS.observe(response.usage.prompt_tokens, call=call, kind="prompt")
+        LLM_TOKENS.observe(response.usage.completion_tokens, call=call, kind="completion")
+        span.set("llm.prompt_tokens", response.usage.prompt_tokens)
+        span.set("llm.completion_tokens", response.usage.completion_tokens)
+    if response.choices:
+        span.set("llm.finish_reason", response.choices[0].finish_reason)
+
+def format_web_search_results(search_results: List[Dict[str, Any]]) -> str:
+    """
+    Format web search results as a tool message, with clear instructions for the LLM.
+    """
+    results_text = "Here are the search results. Please analyze these thoroughly and provide a comprehensive summary of the information found, rather than just listing links. Extract and present the most relevant facts, figures, and details:\n\n"
+    
+    for i, result in enumerate(search_results, 1):
+        results_text += f"Result {i}:\n"
+        results_text += f"Title: {result['title']}\n"
+        results_text += f"URL: {result['url']}\n"
+        
+        # Include content summary if available
+        if result.get('content_summary'):
+            results_text += f"Content Summary: {result['content_summary']}\n"
+        
+        # Include key points if available
+        if result.get('key_points') and len(result['key_points']) > 0:
+            results_text += "Key Points:\n"
+            for point in result['key_points']:
+                results_text += f"- {point}\n"
+        
+        # Include snippet as fallback
+        if result.get('snippet'):
+            results_text += f"Snippet: {result['snippet']}\n"
+        
+        results_text += "\n"
+    return results_text
+
+def format_file_search_results(search_results: Dict[str, Any]) -> str:
+    """
+    Format the answer of a file search and its citations as a tool message.
+    """
+    results_text = "Here are the search results from the uploaded files. Please analyze these thoroughly and provide a comprehensive summary of the information found:\n\n"
+    
+    # Add the main response
+    results_text += f"Response: {search_results['content']}\n\n"
+    
+    # Add file citations if available
+    if search_results.get("file_citations"):
+        results_text += "File Citations:\n"
+        for citation in search_results["file_citations"]:
+            results_text += f"File ID: {citation['file_id']}\n"
+            results_text += f"Quote: {citation['quote']}\n\n"
+    return results_text
+
 async def process_tool_calls(tool_calls: List[Dict[str, Any]], file_ids: Optional[List[str]] = None) -> List[ChatMessage]:
     """
     Process tool calls and return results as chat messages.
     """
     try:
-        logger.debug(f"Processing tool calls: {json.dumps(tool_calls, indent=2)}")
-        logger.debug(f"File IDs for search: {file_ids}")
+        log_payload(logger, "Processing tool calls", tool_calls)
+        logger.debug("File IDs for search: %s", file_ids)
         tool_messages = []
         
         for tool_call in tool_calls:
-            logger.debug(f"Processing tool call: {json.dumps(tool_call, indent=2)}")
-            
             if tool_call["function"]["name"] == "web_search":
                 try:
                     args = json.loads(tool_call["function"]["arguments"])
                     query = args["query"]
                     max_results = args.get("max_results", 5)
                     
-                    logger.debug(f"Performing web search with query: {query}, max_results: {max_results}")
+                    logger.debug("Performing web search with query: %s, max_results: %s", query, max_results)
                     
                     # Perform web search asynchronously
-                    search_results = await perform_search(query, max_results)
-                    logger.debug(f"Search results: {json.dumps(search_results, indent=2)}")
+                    with tracer.span("tool.web_search") as span, timed("tool_web_search"):
+                        span.set("tool.call_id", tool_call["id"])
+                        span.set("search.query", query)
+                        search_results = await perform_search(query, max_results)
+                        span.set("search.results", len(search_results))
+                    log_payload(logger, "Search results", search_results)
                     
                     if search_results:
-                        # Format the results with clear instructions for the LLM
-                        results_text = "Here are the search results. Please analyze these thoroughly and provide a comprehensive summary of the information found, rather than just listing links. Extract and present the most relevant facts, figures, and details:\n\n"
-                        
-                        for i, result in enumerate(search_results, 1):
-                            results_text += f"Result {i}:\n"
-                            results_text += f"Title: {result['title']}\n"
-                            results_text += f"URL: {result['url']}\n"
-                            
-                            # Include content summary if available
-                            if result.get('content_summary'):
-                                results_text += f"Content Summary: {result['content_summary']}\n"
-                            
-                            # Include key points if available
-                            if result.get('key_points') and len(result['key_points']) > 0:
-                                results_text += "Key Points:\n"
-                                for point in result['key_points']:
-                                    results_text += f"- {point}\n"
-                            
-                            # Include snippet as fallback
-                            if result.get('snippet'):
-                                results_text += f"Snippet: {result['snippet']}\n"
-                            
-                            results_text += "\n"
-                        
                         tool_messages.append(ChatMessage(
                             role="tool",
-                            content=results_text,
+                            content=format_web_search_results(search_results),
                             name="web_search",
                             tool_call_id=tool_call["id"]
                         ))
@@ -208,7 +269,7 @@ async def process_tool_calls(tool_calls: List[Dict[str, Any]], file_ids: Optiona
                     # Use file_ids from the request if available, otherwise use any provided in the tool call
                     search_file_ids = file_ids if file_ids is not None else args.get("file_ids", [])
                     
-                    logger.debug(f"Performing file search with query: {query}, file_ids: {search_file_ids}")
+                    logger.debug("Performing file search with query: %s, file_ids: %s", query, search_file_ids)
                     
                     # Import the search_files function from files router
                     from .files import search_files
@@ -218,26 +279,16 @@ async def process_tool_calls(tool_calls: List[Dict[str, Any]], file_ids: Optiona
                     search_request = SearchRequest(query=query, file_ids=search_file_ids if search_file_ids else None)
                     
                     # Perform file search
-                    search_results = await search_files(search_request)
-                    logger.debug(f"File search results: {json.dumps(search_results, indent=2)}")
+                    with tracer.span("tool.file_search") as span, timed("tool_file_search"):
+                        span.set("tool.call_id", tool_call["id"])
+                        span.set("files.count", len(search_file_ids or []))
+                        search_results = await search_files(search_request)
+                    log_payload(logger, "File search results", search_results)
                     
                     if search_results and search_results.get("content"):
-                        # Format the results with clear instructions for the LLM
-                        results_text = "Here are the search results from the uploaded files. Please analyze these thoroughly and provide a comprehensive summary of the information found:\n\n"
-                        
-                        # Add the main response
-                        results_text += f"Response: {search_results['content']}\n\n"
-                        
-                        # Add file citations if available
-                        if search_results.get("file_citations"):
-                            results_text += "File Citations:\n"
-                            for citation in search_results["file_citations"]:
-                                results_text += f"File ID: {citation['file_id']}\n"
-                                results_text += f"Quote: {citation['quote']}\n\n"
-                        
                         tool_messages.append(ChatMessage(
                             role="tool",
-                            content=results_text,
+                            content=format_file_search_results(search_results),
                             name="file_search",
                             tool_call_id=tool_call["id"]
                         ))
@@ -264,16 +315,60 @@ async def process_tool_calls(tool_calls: List[Dict[str, Any]], file_ids: Optiona
         logger.error(traceback.format_exc())
         raise
 
+async def load_session_history(session_id: str, user_id: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Load the most recent messages of a stored chat session in OpenAI message format,
+    at most limit of them, or all of them when limit is None.
+    """
+    try:
+        session = await get_repository().get_session(session_id, user_id)
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    messages = session.get("messages", [])
+    if limit is None:
+        recent = messages
+    else:
+        recent = messages[-limit:] if limit > 0 else []
+    return [{"role": msg["role"], "content": msg["content"]} for msg in recent]
+
+async def persist_turn(session_id: str, user_id: str, messages: List[ChatMessage], assistant_content: Optional[str]):
+    """
+    Save the user and assistant messages of a chat turn to its session. System prompts
+    the client sends with every turn are not saved, so they don't pile up in the history.
+    Runs as a background task after the response is sent.
+    """
+    try:
+        turn = [
+            stamp_message(SessionMessage(role=msg.role, content=msg.content, userId=user_id))
+            for msg in messages if msg.role == "user"
+        ]
+        if assistant_content:
+            turn.append(stamp_message(SessionMessage(role="assistant", content=assistant_content, userId=user_id)))
+        if not turn:
+            return
+        await append_messages(session_id, user_id, [msg.dict() for msg in turn])
+        logger.debug("Persisted %d messages to session %s", len(turn), session_id)
+    except Exception as e:
+        logger.error(f"Error persisting chat turn to session {session_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+
 @router.post("/completions", response_model=ChatResponse)
-async def create_chat_completion(request: ChatRequest):
+async def create_chat_completion(request: ChatRequest, background_tasks: BackgroundTasks):
+    record_request_parse()
     try:
-        logger.debug("Received chat completion request")
-        logger.debug(f"Request messages: {json.dumps([msg.dict() for msg in request.messages], indent=2)}")
-        logger.debug(f"File IDs: {request.file_ids}")
+        log_payload(logger, "Request messages", lambda: [msg.dict() for msg in request.messages])
+        logger.debug("File IDs: %s", request.file_ids)
+
+        # Load the stored history when the client only sends the new turn
+        use_session = bool(request.session_id and request.user_id)
+        history = []
+        if use_session:
+            history = await load_session_history(request.session_id, request.user_id, request.history_limit)
+        conversation = history + [{"role": msg.role, "content": msg.content} for msg in request.messages]
 
         # Add a system message about available files if file_ids are provided
-        messages_for_openai = [{"role": msg.role, "content": msg.content} 
-                             for msg in request.messages]
+        messages_for_openai = list(conversation)
         
         if request.file_ids and len(request.file_ids) > 0:
             # Get file information from the database
@@ -297,17 +392,20 @@ async def create_chat_completion(request: ChatRequest):
 
         # First, let the model decide if it needs to use tools
         try:
-            logger.info(f"Using model: {os.getenv('AZURE_DEPLOYMENT_NAME')}")
-            initial_response = client.chat.completions.create(
-                model=os.getenv("AZURE_DEPLOYMENT_NAME"),
-                messages=messages_for_openai,
-                temperature=request.temperature,
-                max_tokens=request.max_tokens,
-                tools=TOOLS,
-                tool_choice="auto"
-            )
-            logger.debug("Got initial response from OpenAI")
-            logger.debug(f"Initial response: {json.dumps(initial_response.model_dump(), indent=2)}")
+            logger.debug("Using model: %s", os.getenv("AZURE_DEPLOYMENT_NAME"))
+            with tracer.span("llm.chat_completion") as span, timed("llm_first"):
+                span.set("llm.call", "first")
+                span.set("llm.messages", len(messages_for_openai))
+                initial_response = get_client().chat.completions.create(
+                    model=os.getenv("AZURE_DEPLOYMENT_NAME"),
+                    messages=messages_for_openai,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens,
+                    tools=TOOLS,
+                    tool_choice="auto"
+                )
+                record_usage("first", initial_response, span)
+            log_payload(logger, "Initial response", initial_response.model_dump)
         except Exception as e:
             logger.error(f"Error in initial OpenAI call: {str(e)}")
             logger.error(traceback.format_exc())
@@ -316,7 +414,6 @@ async def create_chat_completion(request: ChatRequest):
         try:
             # Convert the initial response to our format
             response_dict = convert_openai_response_to_dict(initial_response)
-            logger.debug(f"Converted response: {json.dumps(response_dict, indent=2)}")
         except Exception as e:
             logger.error(f"Error converting OpenAI response: {str(e)}")
             logger.error(traceback.format_exc())
@@ -324,19 +421,17 @@ async def create_chat_completion(request: ChatRequest):
 
         # Check if the model wants to use any tools
         if (response_dict["choices"][0]["message"].get("tool_calls")):
-            logger.debug("Tool calls detected, processing...")
             try:
                 # Process tool calls asynchronously
                 tool_messages = await process_tool_calls(
                     response_dict["choices"][0]["message"]["tool_calls"],
                     request.file_ids  # Pass file_ids to process_tool_calls
                 )
-                logger.debug(f"Tool messages: {json.dumps([msg.dict() for msg in tool_messages], indent=2)}")
+                log_payload(logger, "Tool messages", lambda: [msg.dict() for msg in tool_messages])
                 
                 # Create final response with tool results
                 final_messages = [
-                    *[{"role": msg.role, "content": msg.content} 
-                      for msg in request.messages],
+                    *conversation,
                     {
                         "role": "assistant",
                         "content": response_dict["choices"][0]["message"]["content"],
@@ -354,24 +449,40 @@ async def create_chat_completion(request: ChatRequest):
                     }
                 ]
 
-                logger.debug(f"Sending final messages: {json.dumps(final_messages, indent=2)}")
+                log_payload(logger, "Sending final messages", final_messages)
                 
-                final_response = client.chat.completions.create(
-                    model=os.getenv("AZURE_DEPLOYMENT_NAME"),
-                    messages=final_messages,
-                    temperature=request.temperature,
-                    max_tokens=request.max_tokens
-                )
+                with tracer.span("llm.chat_completion") as span, timed("llm_second"):
+                    span.set("llm.call", "second")
+                    span.set("llm.messages", len(final_messages))
+                    final_response = get_client().chat.completions.create(
+                        model=os.getenv("AZURE_DEPLOYMENT_NAME"),
+                        messages=final_messages,
+                        temperature=request.temperature,
+                        max_tokens=request.max_tokens
+                    )
+                    record_usage("second", final_response, span)
                 
-                return convert_openai_response_to_dict(final_response)
+                final_dict = convert_openai_response_to_dict(final_response)
+                if use_session:
+                    background_tasks.add_task(
+                        persist_turn, request.session_id, request.user_id, request.messages,
+                        final_dict["choices"][0]["message"]["content"]
+                    )
+                return final_dict
             except Exception as e:
                 logger.error(f"Error processing tool calls: {str(e)}")
                 logger.error(traceback.format_exc())
                 raise HTTPException(status_code=500, detail=f"Error processing tool calls: {str(e)}")
         
-        logger.debug("No tool calls needed, returning initial response")
+        if use_session:
+            background_tasks.add_task(
+                persist_turn, request.session_id, request.user_id, request.messages,
+                response_dict["choices"][0]["message"]["content"]
+            )
         return response_dict
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unhandled error in create_chat_completion: {str(e)}")
         logger.error(traceback.format_exc())
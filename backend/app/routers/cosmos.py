@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import os
-from azure.cosmos import CosmosClient, PartitionKey
+from ..services.change_feed import change_feed
+from ..services.cosmos_metrics import cosmos_metrics
+from ..services.repository import InvalidContinuationError, NotFoundError, PreconditionFailedError, get_repository
+from ..services.session_cache import session_cache
+from ..services.session_summaries import session_summaries
 
 router = APIRouter()
 
@@ -25,13 +29,20 @@ class ChatSession(BaseModel):
     updatedAt: Optional[str] = None
     messages: List[ChatMessage] = []
 
-# Initialize CosmosDB client
-client = CosmosClient(
-    os.getenv("COSMOS_ENDPOINT"),
-    os.getenv("COSMOS_KEY")
-)
-database = client.get_database_client(os.getenv("COSMOS_DATABASE", "chatview-db"))
-container = database.get_container_client(os.getenv("COSMOS_CONTAINER", "chat-history"))
+class ChatMessageBatch(BaseModel):
+    messages: List[ChatMessage]
+
+class ChatSessionSummary(BaseModel):
+    id: str
+    workflowId: Optional[str] = None
+    workflowTitle: Optional[str] = None
+    createdAt: Optional[str] = None
+    updatedAt: Optional[str] = None
+    messageCount: int = 0
+
+class ChatSessionSummaryPage(BaseModel):
+    items: List[ChatSessionSummary]
+    continuation: Optional[str] = None
 
 @router.post("/sessions", response_model=ChatSession)
 async def create_session(session: ChatSession):
@@ -50,11 +61,7 @@ async def create_session(session: ChatSession):
         if not session.messages:
             session.messages = []
         
-        # Convert to dict for Cosmos DB
-        session_dict = session.dict()
-        
-        # Create the session in Cosmos DB
-        container.create_item(body=session_dict)
+        await get_repository().create_session(session.dict())
         return session
     except Exception as e:
         print(f"Error creating session: {str(e)}")
@@ -63,40 +70,107 @@ async def create_session(session: ChatSession):
 @router.get("/sessions/{user_id}", response_model=List[ChatSession])
 async def get_chat_history(user_id: str, limit: int = 20):
     try:
-        query = f"SELECT * FROM c WHERE c.userId = @userId ORDER BY c.updatedAt DESC OFFSET 0 LIMIT @limit"
-        parameters = [
-            {"name": "@userId", "value": user_id},
-            {"name": "@limit", "value": limit}
-        ]
-        
-        items = list(container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        return items
+        return await get_repository().list_sessions(user_id, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/users/{user_id}/sessions", response_model=ChatSessionSummaryPage)
+async def list_session_summaries(user_id: str, limit: int = 20, continuation: Optional[str] = None):
+    """
+    List a user's sessions for the sidebar without their message bodies.
+    Pass the returned continuation token back to fetch the next page.
+    """
+    try:
+        return await get_repository().list_session_summaries(user_id, limit, continuation)
+    except InvalidContinuationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sessions/{session_id}/{user_id}", response_model=ChatSession)
 async def get_session(session_id: str, user_id: str):
     try:
-        item = container.read_item(item=session_id, partition_key=user_id)
-        return item
+        return await get_repository().get_session(session_id, user_id)
     except Exception as e:
         raise HTTPException(status_code=404, detail="Session not found")
 
+async def append_messages(session_id: str, user_id: str, messages: List[dict], etag: Optional[str] = None) -> Optional[str]:
+    """
+    Append messages to a session and return its new ETag. Pass etag to make the append
+    conditional on the session being unchanged.
+    """
+    return await get_repository().append_messages(session_id, user_id, messages, etag=etag)
+
+def stamp_message(message: ChatMessage) -> ChatMessage:
+    message.id = f"msg-{datetime.now().timestamp()}-{os.urandom(4).hex()}"
+    message.timestamp = datetime.now().isoformat()
+    return message
+
 @router.post("/sessions/{session_id}/{user_id}/messages", response_model=ChatMessage)
-async def add_message(session_id: str, user_id: str, message: ChatMessage):
+async def add_message(session_id: str, user_id: str, message: ChatMessage, response: Response,
+                      if_match: Optional[str] = Header(None)):
     try:
-        session = container.read_item(item=session_id, partition_key=user_id)
-        message.id = f"msg-{datetime.now().timestamp()}-{os.urandom(4).hex()}"
-        message.timestamp = datetime.now().isoformat()
-        
-        session["messages"].append(message.dict())
-        session["updatedAt"] = datetime.now().isoformat()
-        
-        container.replace_item(item=session_id, body=session)
+        stamp_message(message)
+        etag = await append_messages(session_id, user_id, [message.dict()], etag=if_match)
+        if etag:
+            response.headers["ETag"] = etag
         return message
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except PreconditionFailedError:
+        raise HTTPException(status_code=412, detail="Session was modified by another request")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/sessions/{session_id}/{user_id}/messages/batch", response_model=List[ChatMessage])
+async def add_messages(session_id: str, user_id: str, batch: ChatMessageBatch, response: Response,
+                       if_match: Optional[str] = Header(None)):
+    """
+    Append several messages (e.g. a user turn and the assistant reply) in one round-trip.
+    
+    Batches of up to 9 messages are appended all or nothing; a longer batch that fails
+    part way may leave its first messages in the session.
+    """
+    try:
+        messages = [stamp_message(message) for message in batch.messages]
+        if not messages:
+            return []
+        
+        etag = await append_messages(session_id, user_id, [message.dict() for message in messages], etag=if_match)
+        if etag:
+            response.headers["ETag"] = etag
+        return messages
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except PreconditionFailedError:
+        raise HTTPException(status_code=412, detail="Session was modified by another request")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache/stats")
+async def get_session_cache_stats():
+    """
+    Hit rate and request units saved by the session cache.
+    """
+    return session_cache.stats()
+
+@router.get("/summaries/stats")
+async def get_session_summary_stats():
+    """
+    Reads, builds and updates of the session summary view.
+    """
+    return session_summaries.stats()
+
+@router.get("/change-feed/stats")
+async def get_change_feed_stats():
+    """
+    Polls, changes applied and resets of each change feed followed by this worker.
+    """
+    return change_feed.stats()
+
+@router.get("/usage/stats")
+async def get_usage_stats():
+    """
+    Request units, latency and throttling of Cosmos DB calls per endpoint, operation and partition.
+    """
+    return cosmos_metrics.stats()
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import TYPE_CHECKING, List, Optional, Dict
+from functools import lru_cache
 import os
 import uuid
 import asyncio
 import logging
-from openai import AzureOpenAI
 from io import BytesIO
 import time
 import traceback
@@ -13,9 +13,12 @@ import json
 from pathlib import Path
 import tempfile
 import re
+from ..services.tracing import tracer
+
+if TYPE_CHECKING:
+    from openai import AzureOpenAI
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Suppress unnecessary logs from httpcore and other libraries
@@ -29,11 +32,18 @@ logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(l
 router = APIRouter()
 
 # Azure OpenAI configuration
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_API_KEY"),
-    api_version="2024-05-01-preview",
-    azure_endpoint=os.getenv("AZURE_ENDPOINT")
-)
+@lru_cache(maxsize=None)
+def get_client() -> "AzureOpenAI":
+    """
+    Azure OpenAI client for files and assistants, created on first use.
+    """
+    from openai import DEFAULT_CONNECTION_LIMITS, AzureOpenAI, DefaultHttpxClient
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_API_KEY"),
+        api_version="2024-05-01-preview",
+        azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+        http_client=DefaultHttpxClient(transport=tracer.httpx_transport("openai", limits=DEFAULT_CONNECTION_LIMITS))
+    )
 
 # Store vector store ID
 vector_store_id = None
@@ -46,7 +56,7 @@ def get_or_create_vector_store():
     
     try:
         # List existing vector stores
-        vector_stores = client.vector_stores.list()
+        vector_stores = get_client().vector_stores.list()
         for store in vector_stores:
             if store.name == "File Search Vector Store":
                 vector_store_id = store.id
@@ -54,7 +64,7 @@ def get_or_create_vector_store():
                 return vector_store_id
         
         # Create a new vector store if none exists
-        vector_store = client.vector_stores.create(
+        vector_store = get_client().vector_stores.create(
             name="File Search Vector Store"
         )
         vector_store_id = vector_store.id
@@ -70,7 +80,7 @@ def get_or_create_vector_store():
 # Helper function to wait for run completion
 async def wait_for_run_completion(thread_id: str, run_id: str, max_attempts: int = 10):
     for attempt in range(max_attempts):
-        run = client.beta.threads.runs.retrieve(
+        run = get_client().beta.threads.runs.retrieve(
             thread_id=thread_id,
             run_id=run_id
         )
@@ -117,7 +127,7 @@ async def upload_file(
             # Upload to OpenAI
             try:
                 with open(temp_file.name, 'rb') as f:
-                    openai_file = client.files.create(
+                    openai_file = get_client().files.create(
                         file=f,
                         purpose="assistants"
                     )
@@ -132,7 +142,7 @@ async def upload_file(
             # Add file to vector store
             try:
                 vector_store_id = get_or_create_vector_store()
-                file_batch = client.vector_stores.file_batches.create_and_poll(
+                file_batch = get_client().vector_stores.file_batches.create_and_poll(
                     vector_store_id=vector_store_id,
                     file_ids=[openai_file.id]
                 )
@@ -163,7 +173,7 @@ async def list_files():
     try:
         # List all files from OpenAI
         files = []
-        openai_files = client.files.list()
+        openai_files = get_client().files.list()
         
         for file in openai_files:
             files.append(FileInfo(
@@ -183,61 +193,72 @@ async def search_files(request: SearchRequest):
         logger.info(f"Received search request - Query: {request.query}, File IDs: {request.file_ids}")
         
         # Get vector store ID
-        vector_store_id = get_or_create_vector_store()
+        with tracer.span("files.vector_store"):
+            vector_store_id = get_or_create_vector_store()
         logger.info(f"Using vector store ID: {vector_store_id}")
         
         # Create an assistant with file search capabilities
-        assistant = client.beta.assistants.create(
-            name="File Search Assistant",
-            instructions="""You are a helpful assistant that can search through files to answer questions. 
+        with tracer.span("files.assistant_create"):
+            assistant = get_client().beta.assistants.create(
+                name="File Search Assistant",
+                instructions="""You are a helpful assistant that can search through files to answer questions. 
             When a user asks a question:
             1. If files are provided, use the file_search tool to find relevant information in those files
             2. If no files are provided or if the file search doesn't yield relevant results, respond based on your general knowledge
             3. Always prioritize information from the files when available
             4. If you find relevant information in the files, explicitly mention which file(s) the information came from""",
-            model="gpt-4o",
-            tools=[{"type": "file_search"}],
-            tool_resources={
-                "file_search": {
-                    "vector_store_ids": [vector_store_id]
+                model="gpt-4o",
+                tools=[{"type": "file_search"}],
+                tool_resources={
+                    "file_search": {
+                        "vector_store_ids": [vector_store_id]
+                    }
                 }
-            }
-        )
+            )
         logger.info(f"Created assistant with ID: {assistant.id}")
         
         # Create a thread
-        thread = client.beta.threads.create()
+        with tracer.span("files.thread_create"):
+            thread = get_client().beta.threads.create()
+            
+            # Add the user's message to the thread
+            message = get_client().beta.threads.messages.create(
+                thread_id=thread.id,
+                role="user",
+                content=request.query
+            )
         logger.info(f"Created thread with ID: {thread.id}")
         
-        # Add the user's message to the thread
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=request.query
-        )
-        
         # Run the assistant
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant.id
-        )
-        
-        # Wait for the run to complete
-        while True:
-            run = client.beta.threads.runs.retrieve(
+        with tracer.span("files.run") as span:
+            run = get_client().beta.threads.runs.create(
                 thread_id=thread.id,
-                run_id=run.id
+                assistant_id=assistant.id
             )
-            if run.status == "completed":
-                break
-            elif run.status in ["failed", "cancelled", "expired"]:
-                raise HTTPException(status_code=500, detail=f"Run failed with status: {run.status}")
-            await asyncio.sleep(1)
+            
+            # Wait for the run to complete
+            while True:
+                run = get_client().beta.threads.runs.retrieve(
+                    thread_id=thread.id,
+                    run_id=run.id
+                )
+                span.add("run.polls")
+                if run.status == "completed":
+                    break
+                elif run.status in ["failed", "cancelled", "expired"]:
+                    span.set("run.status", run.status)
+                    raise HTTPException(status_code=500, detail=f"Run failed with status: {run.status}")
+                await asyncio.sleep(1)
+            span.set("run.status", run.status)
+            if run.usage is not None:
+                span.set("llm.prompt_tokens", run.usage.prompt_tokens)
+                span.set("llm.completion_tokens", run.usage.completion_tokens)
         
         # Get the assistant's response
-        messages = client.beta.threads.messages.list(
-            thread_id=thread.id
-        )
+        with tracer.span("files.messages_list"):
+            messages = get_client().beta.threads.messages.list(
+                thread_id=thread.id
+            )
         
         # Get the latest assistant message
         assistant_message = next(
@@ -272,7 +293,7 @@ async def delete_file(file_id: str):
     try:
         # Delete from OpenAI
         try:
-            client.files.delete(file_id)
+            get_client().files.delete(file_id)
             logger.info(f"Deleted file from OpenAI: {file_id}")
         except Exception as e:
             logger.error(f"Failed to delete file from OpenAI: {str(e)}")
@@ -298,7 +319,7 @@ async def get_file_info(file_id: str):
         vector_store_id = get_or_create_vector_store()
         
         # Get file information from the vector store
-        file_info = client.vector_stores.files.retrieve(
+        file_info = get_client().vector_stores.files.retrieve(
             vector_store_id=vector_store_id,
             file_id=file_id
         )
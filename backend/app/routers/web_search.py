@@ -1,27 +1,39 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from duckduckgo_search import AsyncDDGS
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, AsyncIterator, Callable, Tuple
 import asyncio
 import time
-import random
 import logging
 import json
 import traceback
-import aiohttp
-from bs4 import BeautifulSoup
-import re
 from urllib.parse import urlparse
+from ..services.page_cache import page_cache, PageCacheEntry, canonicalize_url
+from ..services.search_cache import search_cache
+from ..services.html_extract import html_extractor
+from ..services.page_reader import page_reader
+from ..services.search_backends import search_backend
+from ..services.metrics import metrics, timed
+from ..services.tracing import tracer
+
+if TYPE_CHECKING:
+    from ..services.relevance import PageTerms
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+PAGE_FETCH_SECONDS = metrics.histogram(
+    "page_fetch_duration_seconds", "Time to get the text of a linked page, by page cache result and outcome",
+    ["cache", "outcome"]
+)
+
 class WebSearchRequest(BaseModel):
     query: str
     max_results: Optional[int] = 5
     fetch_content: Optional[bool] = True
+    stream: Optional[bool] = False
 
 class WebSearchResult(BaseModel):
     title: str
@@ -36,162 +48,406 @@ class WebSearchResult(BaseModel):
 async def fetch_page_content(url: str, timeout: int = 10) -> Optional[str]:
     """
     Fetch the HTML content of a URL and extract the main text content.
+    Extracted text is cached per canonical URL and revalidated with conditional GETs.
+    A stale copy is served when revalidating it fails, unless the page is gone.
     """
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+    with tracer.span("page.fetch") as span, PAGE_FETCH_SECONDS.time(cache="miss", outcome="ok") as fetch:
+        span.set("http.url", url)
+        cached = None
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=timeout) as response:
-                if response.status != 200:
-                    logger.warning(f"Failed to fetch {url}: Status code {response.status}")
-                    return None
-                
-                html = await response.text()
-                
-                # Parse HTML with BeautifulSoup
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Remove script and style elements
-                for script in soup(["script", "style", "nav", "footer", "header"]):
-                    script.extract()
-                
-                # Get text content
-                text = soup.get_text(separator=' ', strip=True)
+        def serve_stale() -> str:
+            page_cache.record_stale(cached)
+            fetch["cache"] = "stale"
+            span.set("page.cache", "stale")
+            return cached.text
+        
+        try:
+            cache_key = canonicalize_url(url)
+            cached = await page_cache.get(cache_key)
+            if cached and cached.is_fresh(page_cache.ttl):
+                page_cache.record_hit(cached)
+                fetch["cache"] = "hit"
+                span.set("page.cache", "hit")
+                return cached.text
+        
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            }
+            if cached:
+                headers.update(cached.conditional_headers())
+        
+            import aiohttp
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url, headers=headers, timeout=timeout) as response:
+                    span.set("http.status_code", response.status)
+                    if response.status == 304 and cached:
+                        await page_cache.record_revalidated(cache_key, cached)
+                        fetch["cache"] = "revalidated"
+                        span.set("page.cache", "revalidated")
+                        return cached.text
                 
-                # Clean up text (remove extra whitespace, etc.)
-                text = re.sub(r'\s+', ' ', text).strip()
+                    if response.status != 200:
+                        logger.warning(f"Failed to fetch {url}: Status code {response.status}")
+                        fetch["outcome"] = "http_error"
+                        if cached and response.status not in (404, 410):
+                            return serve_stale()
+                        return None
                 
-                return text
-    except Exception as e:
-        logger.error(f"Error fetching {url}: {str(e)}")
-        return None
+                    page_cache.record_miss()
+                    span.set("page.cache", "miss")
+                    # Stream the body with a size cap, rejecting binary content from the headers
+                    html, body_bytes = await page_reader.read(response)
+                    span.set("http.response_bytes", body_bytes)
+                    if html is None:
+                        fetch["outcome"] = "skipped"
+                        return None
+                    response_headers = response.headers
+        
+            # Parsing is CPU bound, so it runs in the extractor pool rather than on the event loop
+            extracted = await html_extractor.extract(html, url)
+            if extracted is None:
+                fetch["outcome"] = "extraction_failed"
+                return None
+            text, parse_ms = extracted
+            span.set("page.text_chars", len(text))
+            span.set("page.parse_ms", round(parse_ms, 2))
+        
+            if 'no-store' not in response_headers.get('Cache-Control', ''):
+                await page_cache.put(cache_key, PageCacheEntry(
+                    url=url,
+                    text=text,
+                    etag=response_headers.get('ETag'),
+                    last_modified=response_headers.get('Last-Modified'),
+                    body_bytes=body_bytes,
+                    parse_ms=parse_ms
+                ))
+        
+            return text
+        except Exception as e:
+            logger.error(f"Error fetching {url}: {str(e)}")
+            fetch["outcome"] = type(e).__name__
+            span.fail(e)
+            return serve_stale() if cached else None
 
 async def analyze_content(content: str, query: str) -> Dict[str, Any]:
     """
     Analyze the content to extract relevant information based on the query.
+    Scored on its own, a page gets different scores than with the other pages of its
+    search in analyze_contents.
     """
-    if not content:
-        return {
-            'summary': None,
-            'key_points': [],
-            'relevance_score': 0.0
-        }
-    
-    # Simple relevance scoring based on query term frequency
-    query_terms = query.lower().split()
-    content_lower = content.lower()
-    
-    # Calculate term frequency score
-    term_frequency = sum(content_lower.count(term) for term in query_terms)
-    relevance_score = min(1.0, term_frequency / (len(query_terms) * 10))
+    return (await analyze_contents([content], query))[0]
+
+async def analyze_contents(contents: List[str], query: str) -> List[Dict[str, Any]]:
+    """
+    Analyze all fetched pages of a search together with BM25 scoring.
+    """
+    from ..services.relevance import analyze_pages
+    with tracer.span("page.analysis") as span, timed("page_analysis"):
+        span.set("page.count", len(contents))
+        span.set("page.chars", sum(len(content) for content in contents))
+        return await asyncio.to_thread(analyze_pages, contents, query)
+
+async def analyze_page(content: str, query: str) -> Tuple["PageTerms", Dict[str, Any]]:
+    """
+    Analyze one page on its own, also returning its counted terms so it can be scored
+    again with the other pages of its search by score_page_terms.
+    """
+    from ..services.relevance import count_terms, query_terms, score_pages
+
+    def analyze() -> Tuple["PageTerms", Dict[str, Any]]:
+        page = count_terms([content], query_terms(query))[0]
+        return page, score_pages([page])[0]
+
+    with tracer.span("page.analysis") as span, timed("page_analysis"):
+        span.set("page.count", 1)
+        span.set("page.chars", len(content))
+        return await asyncio.to_thread(analyze)
+
+async def score_page_terms(pages: List["PageTerms"]) -> List[Dict[str, Any]]:
+    """
+    Score pages already analyzed by analyze_page together, as analyze_contents would.
+    """
+    from ..services.relevance import score_pages
+    with tracer.span("page.scoring") as span:
+        span.set("page.count", len(pages))
+        return await asyncio.to_thread(score_pages, pages)
+
+def apply_analysis(result: dict, analysis: Dict[str, Any]) -> dict:
+    result.update({
+        'relevance_score': analysis['relevance_score'],
+        'content_summary': analysis['summary'],
+        'key_points': analysis['key_points']
+    })
+    return result
+
+async def enrich_results(results: List[dict], query: str):
+    """
+    Fetch the linked pages of search results concurrently and add their analysis in place.
+    """
+    targets = [result for result in results if result['url'] and urlparse(result['url']).scheme in ['http', 'https']]
+    contents = await asyncio.gather(
+        *(fetch_page_content(result['url']) for result in targets),
+        return_exceptions=True
+    )
     
-    # Extract key sentences (simple approach)
-    sentences = re.split(r'(?<=[.!?])\s+', content)
+    fetched = []
+    for result, content in zip(targets, contents):
+        if isinstance(content, Exception):
+            logger.error(f"Error fetching content for {result['url']}: {str(content)}")
+        elif content:
+            fetched.append((result, content))
     
-    # Score sentences based on query term presence
-    scored_sentences = []
-    for sentence in sentences:
-        score = sum(sentence.lower().count(term) for term in query_terms)
-        if score > 0:
-            scored_sentences.append((score, sentence))
+    if not fetched:
+        return
     
-    # Sort by score and take top 5
-    scored_sentences.sort(reverse=True)
-    key_points = [sentence for _, sentence in scored_sentences[:5]]
+    try:
+        analyses = await analyze_contents([content for _, content in fetched], query)
+    except Exception as content_error:
+        logger.error(f"Error analyzing content for query {query!r}: {str(content_error)}")
+        return
     
-    # Generate a summary (first few sentences or a portion of the content)
-    summary = ' '.join(sentences[:3]) if sentences else None
-    if summary and len(summary) > 500:
-        summary = summary[:500] + "..."
+    for (result, _), analysis in zip(fetched, analyses):
+        apply_analysis(result, analysis)
+
+async def perform_search(query: str, max_results: int = 5, max_retries: int = 3, fetch_content: bool = True) -> List[dict]:
+    """
+    Perform a DuckDuckGo search, serving popular queries from the search-results cache.
+    Stale cached results are returned immediately and refreshed in the background.
+    """
+    key = search_cache.make_key(query, max_results, fetch_content)
+    with tracer.span("web_search") as span:
+        span.set("search.query", query)
+        span.set("search.max_results", max_results)
+        span.set("search.fetch_content", fetch_content)
+        results = await search_cache.get_or_fetch(
+            key,
+            lambda: _search_uncached(query, max_results, max_retries, fetch_content)
+        )
+        span.set("search.results", len(results))
+        return results
+
+def to_search_result(result: dict) -> dict:
+    """
+    Convert a raw search backend hit into our result format.
+    """
+    # Check for URL in different possible fields
+    url = result.get('link', '') or result.get('url', '') or result.get('href', '')
     
     return {
-        'summary': summary,
-        'key_points': key_points,
-        'relevance_score': relevance_score
+        'title': result.get('title', ''),
+        'url': url,
+        'snippet': result.get('body', ''),
+        'date': result.get('date', ''),
+        'source': result.get('source', ''),
+        'relevance_score': None,
+        'content_summary': None,
+        'key_points': []
     }
 
-async def perform_search(query: str, max_results: int = 5, max_retries: int = 3, fetch_content: bool = True) -> List[dict]:
+async def _search_uncached(query: str, max_results: int, max_retries: int, fetch_content: bool) -> List[dict]:
     """
-    Perform a DuckDuckGo search with retry logic and proper async handling.
-    Optionally fetch and analyze the content of linked pages.
+    Perform a search and optionally fetch and analyze the content of linked pages.
+    """
+    results = await search_hits(query, max_results, max_retries)
+    
+    # Fetch and analyze the linked pages concurrently once all hits are in
+    if fetch_content:
+        await enrich_results(results, query)
+    
+    return results
+
+async def search_hits(query: str, max_results: int, max_retries: int = 3) -> List[dict]:
+    """
+    Perform a search across the adaptive DuckDuckGo backends, without fetching any pages.
+    All attempts share the searcher's timeout, so retrying never extends it.
     """
     logger.debug(f"Starting web search for query: {query}")
+    deadline = time.monotonic() + search_backend.timeout
     
     for attempt in range(max_retries):
         try:
             logger.debug(f"Search attempt {attempt + 1}/{max_retries}")
             
-            # Add a random delay between retries
+            # Each attempt already fails over between backends, so only back off briefly
             if attempt > 0:
-                delay = random.uniform(2.0, 5.0)
-                logger.debug(f"Retrying in {delay:.1f} seconds")
-                await asyncio.sleep(delay)
-
-            async with AsyncDDGS() as ddgs:
-                results = []
-                try:
-                    async for result in ddgs.text(
-                        query,
-                        max_results=max_results,
-                        backend="lite"
-                    ):
-                        logger.debug(f"Received result: {json.dumps(result, indent=2)}")
-                        # Check for URL in different possible fields
-                        url = result.get('link', '') or result.get('url', '') or result.get('href', '')
-                        
-                        # Create the base result
-                        search_result = {
-                            'title': result.get('title', ''),
-                            'url': url,
-                            'snippet': result.get('body', ''),
-                            'date': result.get('date', ''),
-                            'source': result.get('source', ''),
-                            'relevance_score': None,
-                            'content_summary': None,
-                            'key_points': []
-                        }
-                        
-                        # Fetch and analyze content if requested and URL is valid
-                        if fetch_content and url and urlparse(url).scheme in ['http', 'https']:
-                            try:
-                                content = await fetch_page_content(url)
-                                if content:
-                                    analysis = await analyze_content(content, query)
-                                    search_result.update({
-                                        'relevance_score': analysis['relevance_score'],
-                                        'content_summary': analysis['summary'],
-                                        'key_points': analysis['key_points']
-                                    })
-                            except Exception as content_error:
-                                logger.error(f"Error analyzing content for {url}: {str(content_error)}")
-                        
-                        results.append(search_result)
-                except Exception as search_error:
-                    logger.error(f"Error during search iteration: {str(search_error)}")
-                    raise
-                
-                logger.debug(f"Search completed successfully with {len(results)} results")
-                return results
-
+                await asyncio.sleep(0.5 * attempt)
+            
+            with tracer.span("search.backend") as span, timed("search"):
+                span.set("search.attempt", attempt + 1)
+                raw_results = await search_backend.search(query, max_results, deadline=deadline)
+                span.set("search.results", len(raw_results))
+            results = [to_search_result(result) for result in raw_results]
+            logger.debug(f"Search completed successfully with {len(results)} results")
+            return results
         except Exception as e:
             logger.error(f"Error in attempt {attempt + 1}: {str(e)}")
             logger.error(traceback.format_exc())
-            if attempt == max_retries - 1:
+            # Give up once the next attempt could not start before the deadline
+            if attempt == max_retries - 1 or time.monotonic() + 0.5 * (attempt + 1) >= deadline:
                 raise HTTPException(
                     status_code=500,
-                    detail=f"Search failed after {max_retries} attempts: {str(e)}"
+                    detail=f"Search failed after {attempt + 1} attempts: {str(e)}"
                 )
-            await asyncio.sleep(1)
-
+    
     return []
 
+async def stream_search(query: str, max_results: int, fetch_content: bool) -> AsyncIterator[dict]:
+    """
+    Yield search events progressively: the raw hits first, then each page's analysis as it finishes.
+
+    An uncached search runs as the search cache's shared fetch, so concurrent requests
+    for the same search (streamed or not) wait for it instead of searching again. Only
+    the request that started it receives its events as they happen, the others get
+    them all once it is done.
+    """
+    key = search_cache.make_key(query, max_results, fetch_content)
+    results = search_cache.peek(key, refresh=lambda: _search_uncached(query, max_results, 3, fetch_content))
+    if results is not None:
+        for event in result_events(results, fetch_content):
+            yield event
+        yield {'type': 'done', 'count': len(results)}
+        return
+    
+    events: asyncio.Queue = asyncio.Queue()
+    search = asyncio.ensure_future(search_cache.fetch(
+        key, lambda: _stream_uncached(query, max_results, fetch_content, events.put_nowait)
+    ))
+    streamed = False
+    next_event = None
+    try:
+        while True:
+            next_event = asyncio.ensure_future(events.get())
+            await asyncio.wait((search, next_event), return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                break
+            streamed = True
+            yield next_event.result()
+        while not events.empty():
+            streamed = True
+            yield events.get_nowait()
+        results = search.result()
+    finally:
+        # A client that disconnects stops receiving events, the search itself still finishes and is cached
+        if next_event is not None:
+            next_event.cancel()
+        search.cancel()
+    
+    if not streamed:
+        for event in result_events(results, fetch_content):
+            yield event
+    yield {'type': 'done', 'count': len(results)}
+
+async def _stream_uncached(query: str, max_results: int, fetch_content: bool,
+                           emit: Callable[[dict], None]) -> List[dict]:
+    """
+    Search and analyze the linked pages like _search_uncached, emitting the events of
+    stream_search as the hits come in and each page is analyzed.
+
+    Each page is first analyzed on its own so it can be sent as soon as it is ready.
+    Scores depend on the other pages of the search, so the returned (and cached) results
+    are scored again together, as a search without streaming scores them; that reuses
+    the terms counted per page rather than reading the pages again.
+    """
+    results = await search_hits(query, max_results)
+    for index, result in enumerate(results):
+        emit(result_event(index, result))
+    if not fetch_content:
+        return results
+    
+    pages: Dict[int, "PageTerms"] = {}
+    
+    async def fetch_and_analyze(index: int, result: dict):
+        content = await fetch_page_content(result['url'])
+        if content:
+            pages[index], analysis = await analyze_page(content, query)
+            emit(analysis_event(index, apply_analysis(dict(result), analysis)))
+    
+    targets = [
+        (index, result) for index, result in enumerate(results)
+        if result['url'] and urlparse(result['url']).scheme in ['http', 'https']
+    ]
+    outcomes = await asyncio.gather(
+        *(fetch_and_analyze(index, result) for index, result in targets),
+        return_exceptions=True
+    )
+    for (_, result), outcome in zip(targets, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Error analyzing streamed result {result['url']}: {str(outcome)}")
+    
+    if pages:
+        indexes = sorted(pages)
+        try:
+            analyses = await score_page_terms([pages[index] for index in indexes])
+        except Exception as e:
+            logger.error(f"Error scoring streamed results for query {query!r}: {str(e)}")
+            return results
+        for index, analysis in zip(indexes, analyses):
+            apply_analysis(results[index], analysis)
+    return results
+
+def result_event(index: int, result: dict) -> dict:
+    return {
+        'type': 'result',
+        'index': index,
+        'title': result['title'],
+        'url': result['url'],
+        'snippet': result['snippet'],
+        'date': result['date'],
+        'source': result['source']
+    }
+
+def result_events(results: List[dict], fetch_content: bool) -> List[dict]:
+    """
+    The events of a search that is already done: every hit, then every analysis.
+    """
+    events = [result_event(index, result) for index, result in enumerate(results)]
+    if fetch_content:
+        events.extend(
+            analysis_event(index, result) for index, result in enumerate(results)
+            if result.get('content_summary') is not None
+        )
+    return events
+
+def analysis_event(index: int, result: dict) -> dict:
+    return {
+        'type': 'analysis',
+        'index': index,
+        'content_summary': result['content_summary'],
+        'key_points': result['key_points'],
+        'relevance_score': result['relevance_score']
+    }
+
+async def encode_events(events: AsyncIterator[dict], sse: bool) -> AsyncIterator[str]:
+    """
+    Serialize search events as Server-Sent Events or newline-delimited JSON.
+    """
+    try:
+        async for event in events:
+            if sse:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            else:
+                yield json.dumps(event) + "\n"
+    except Exception as e:
+        logger.error(f"Streaming search error: {str(e)}")
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        error = {'type': 'error', 'detail': f"Search failed: {detail}"}
+        yield f"event: error\ndata: {json.dumps(error)}\n\n" if sse else json.dumps(error) + "\n"
+
 @router.post("/search", response_model=List[WebSearchResult])
-async def search(request: WebSearchRequest):
+async def search(request: WebSearchRequest, http_request: Request):
     """
     Perform a web search and optionally fetch and analyze the content of linked pages.
+    With stream=true the results are sent progressively as NDJSON, or as Server-Sent
+    Events when the client accepts text/event-stream.
     """
+    if request.stream:
+        sse = "text/event-stream" in http_request.headers.get("accept", "")
+        return StreamingResponse(
+            encode_events(stream_search(request.query, request.max_results, request.fetch_content), sse),
+            media_type="text/event-stream" if sse else "application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
     try:
         results = await perform_search(
             query=request.query,
@@ -205,4 +461,33 @@ async def search(request: WebSearchRequest):
         raise HTTPException(
             status_code=500,
             detail=f"Search failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Report page and search-result cache effectiveness.
+    """
+    return {
+        "page_cache": page_cache.stats(),
+        "search_cache": search_cache.stats()
+    }
+
+
+@router.get("/extraction/stats")
+async def get_extraction_stats():
+    """
+    Report page download and HTML extraction metrics: bytes, truncations, CPU time and timeouts.
+    """
+    return {
+        "download": page_reader.stats(),
+        "extraction": html_extractor.stats()
+    }
+
+
+@router.get("/backends/stats")
+async def get_backend_stats():
+    """
+    Report latency, error rate, wins and hedges for each search backend.
+    """
+    return search_backend.stats()
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile
+from fastapi import APIRouter, HTTPException, File, UploadFile, Header, Response
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import os
-from azure.cosmos import CosmosClient, PartitionKey
-import asyncio
+from ..services.config_registry import ConfigRegistry, cached_json_response, encode_json
+from ..services.repository import NotFoundError, PreconditionFailedError, get_repository
+from ..services.workflow_cache import workflow_cache
 
 router = APIRouter()
 
@@ -21,6 +22,15 @@ class Workflow(BaseModel):
     conversation_starters: List[dict]
     is_default: bool = False
 
+class WorkflowUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    system_prompt: Optional[str] = None
+    icon_name: Optional[str] = None
+    color: Optional[str] = None
+    conversation_starters: Optional[List[dict]] = None
+    is_default: Optional[bool] = None
+
 class WorkflowConfig(BaseModel):
     id: str
     title: str
@@ -32,26 +42,6 @@ class WorkflowConfig(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-# Initialize CosmosDB client
-client = CosmosClient(
-    os.getenv("COSMOS_ENDPOINT"),
-    os.getenv("COSMOS_KEY")
-)
-database = client.get_database_client(os.getenv("COSMOS_DATABASE", "chatview-db"))
-
-# Create workflows container if it doesn't exist
-try:
-    database.create_container_if_not_exists(
-        id="workflows",
-        partition_key=PartitionKey(path="/user_id"),
-        offer_throughput=400
-    )
-    print("Workflows container created or already exists")
-except Exception as e:
-    print(f"Error creating workflows container: {str(e)}")
-
-workflow_container = database.get_container_client("workflows")
-
 # Default workflows
 DEFAULT_WORKFLOWS = [
     {
@@ -89,14 +79,10 @@ DEFAULT_WORKFLOWS = [
 async def create_default_workflows():
     try:
         # Check if default workflows already exist
-        query = f"SELECT * FROM c WHERE c.user_id = @userId AND c.is_default = true"
-        parameters = [{"name": "@userId", "value": "default-user"}]
-        
-        existing_workflows = list(workflow_container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        existing_workflows = [
+            workflow for workflow in await get_repository().list_workflows("default-user")
+            if workflow.get("is_default")
+        ]
         
         if not existing_workflows:
             print("Creating default workflows...")
@@ -105,7 +91,7 @@ async def create_default_workflows():
                 workflow["created_at"] = datetime.now().isoformat()
                 workflow["updated_at"] = workflow["created_at"]
                 try:
-                    workflow_container.create_item(body=workflow)
+                    await get_repository().create_workflow(workflow)
                     print(f"Created default workflow: {workflow['title']}")
                 except Exception as e:
                     print(f"Error creating workflow {workflow['title']}: {str(e)}")
@@ -115,10 +101,10 @@ async def create_default_workflows():
     except Exception as e:
         print(f"Error in create_default_workflows: {str(e)}")
 
-# Create default workflows when the router is initialized
-asyncio.create_task(create_default_workflows())
+# Default workflow configurations. The timestamps are fixed so the configs (and their
+# ETags) stay identical across restarts and workers, update them when editing a config.
+DEFAULT_CONFIGS_UPDATED_AT = "2025-01-01T00:00:00"
 
-# Default workflow configurations
 DEFAULT_CONFIGS = {
     "chat": {
         "id": "chat",
@@ -132,7 +118,9 @@ DEFAULT_CONFIGS = {
             {"id": "3", "text": "Summarize this article for me"},
             {"id": "4", "text": "Create a to-do list for my project"}
         ],
-        "system_prompt": "You are a helpful AI assistant that can answer questions and help with various tasks."
+        "system_prompt": "You are a helpful AI assistant that can answer questions and help with various tasks.",
+        "created_at": DEFAULT_CONFIGS_UPDATED_AT,
+        "updated_at": DEFAULT_CONFIGS_UPDATED_AT
     },
     "code": {
         "id": "code",
@@ -146,10 +134,43 @@ DEFAULT_CONFIGS = {
             {"id": "3", "text": "Generate a function to..."},
             {"id": "4", "text": "Suggest best practices for..."}
         ],
-        "system_prompt": "You are an expert programming assistant. Help users with coding tasks, debugging, and explaining programming concepts."
+        "system_prompt": "You are an expert programming assistant. Help users with coding tasks, debugging, and explaining programming concepts.",
+        "created_at": DEFAULT_CONFIGS_UPDATED_AT,
+        "updated_at": DEFAULT_CONFIGS_UPDATED_AT
     }
 }
 
+def fallback_config(workflow_id: str) -> dict:
+    """Generic config served for workflow ids without a config of their own"""
+    return {
+        "id": workflow_id,
+        "title": "Chat Assistant",
+        "description": "General purpose AI assistant",
+        "icon_name": "message-square",
+        "color": "#3B82F6",  # Default blue color
+        "conversation_starters": [
+            {"id": "1", "text": "What can you help me with?"},
+            {"id": "2", "text": "Tell me about yourself"},
+            {"id": "3", "text": "How do I get started?"}
+        ],
+        "system_prompt": "You are a helpful AI assistant that can answer questions and help with various tasks.",
+        "created_at": DEFAULT_CONFIGS_UPDATED_AT,
+        "updated_at": DEFAULT_CONFIGS_UPDATED_AT
+    }
+
+def workflow_as_config(workflow: dict) -> dict:
+    """Config of a user-created workflow, made of the workflow's own fields"""
+    config = {key: workflow.get(key) for key in WorkflowConfig.model_fields}
+    config["created_at"] = config["created_at"] or DEFAULT_CONFIGS_UPDATED_AT
+    config["updated_at"] = config["updated_at"] or config["created_at"]
+    return config
+
+config_registry = ConfigRegistry(
+    DEFAULT_CONFIGS,
+    refresh_interval=float(os.getenv("CONFIG_REFRESH_SECONDS", 300))
+)
+get_repository().watch_configs(config_registry.add, config_registry.refresh)
+
 @router.post("/workflows", response_model=Workflow)
 async def create_workflow(workflow: Workflow):
     try:
@@ -161,9 +182,7 @@ async def create_workflow(workflow: Workflow):
         workflow.created_at = datetime.now().isoformat()
         workflow.updated_at = workflow.created_at
         
-        # Create the workflow in Cosmos DB
-        workflow_dict = workflow.dict()
-        workflow_container.create_item(body=workflow_dict)
+        await get_repository().create_workflow(workflow.dict())
         return workflow
     except Exception as e:
         print(f"Error creating workflow: {str(e)}")
@@ -172,65 +191,56 @@ async def create_workflow(workflow: Workflow):
 @router.get("/workflows", response_model=List[Workflow])
 async def get_workflows(user_id: str):
     try:
-        query = f"SELECT * FROM c WHERE c.user_id = @userId"
-        parameters = [{"name": "@userId", "value": user_id}]
-        
-        items = list(workflow_container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        return items
+        return await get_repository().list_workflows(user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/workflows/cache/stats")
+async def get_workflow_cache_stats():
+    """
+    Hit rate of the in-process workflow cache.
+    """
+    return workflow_cache.stats()
+
 @router.get("/workflows/{workflow_id}", response_model=Workflow)
-async def get_workflow(workflow_id: str, user_id: str):
+async def get_workflow(workflow_id: str, user_id: str, response: Response):
+    """
+    Get a workflow, with its ETag to send as If-Match when updating it.
+    """
     try:
-        query = f"SELECT * FROM c WHERE c.id = @id AND c.user_id = @userId"
-        parameters = [
-            {"name": "@id", "value": workflow_id},
-            {"name": "@userId", "value": user_id}
-        ]
-        
-        items = list(workflow_container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        
-        if not items:
-            raise HTTPException(status_code=404, detail="Workflow not found")
-        
-        return items[0]
+        workflow = await get_repository().get_workflow(workflow_id, user_id)
+        if workflow.get("_etag"):
+            response.headers["ETag"] = workflow["_etag"]
+        return workflow
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Workflow not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/workflows/{workflow_id}", response_model=Workflow)
-async def update_workflow(workflow_id: str, workflow_update: dict, user_id: str):
+async def update_workflow(workflow_id: str, workflow_update: WorkflowUpdate, user_id: str, response: Response,
+                          if_match: Optional[str] = Header(None)):
+    # Fields missing from the body keep their current values, so this is the same partial update
+    return await patch_workflow(workflow_id, workflow_update, user_id, response, if_match)
+
+@router.patch("/workflows/{workflow_id}", response_model=Workflow)
+async def patch_workflow(workflow_id: str, workflow_update: WorkflowUpdate, user_id: str, response: Response,
+                         if_match: Optional[str] = Header(None)):
+    """
+    Update only the given fields of a workflow.
+    
+    Send If-Match with the workflow's ETag to fail with 412 if it was changed meanwhile.
+    """
     try:
-        # Get existing workflow
-        existing = await get_workflow(workflow_id, user_id)
-        
-        # Create a new workflow object with existing data
-        updated_workflow = Workflow(
-            id=workflow_id,
-            title=workflow_update.get('title', existing['title']),
-            description=workflow_update.get('description', existing['description']),
-            system_prompt=workflow_update.get('system_prompt', existing['system_prompt']),
-            icon_name=workflow_update.get('icon_name', existing['icon_name']),
-            color=workflow_update.get('color', existing['color']),
-            user_id=user_id,
-            conversation_starters=workflow_update.get('conversation_starters', existing['conversation_starters']),
-            is_default=workflow_update.get('is_default', existing['is_default']),
-            created_at=existing['created_at'],  # Always preserve original creation time
-            updated_at=datetime.now().isoformat()  # Update the modification time
-        )
-        
-        # Update in Cosmos DB
-        workflow_dict = updated_workflow.dict()
-        workflow_container.replace_item(item=workflow_id, body=workflow_dict)
-        return updated_workflow
+        changes = {key: value for key, value in workflow_update.dict(exclude_unset=True).items() if value is not None}
+        updated = await get_repository().update_workflow(workflow_id, user_id, changes, etag=if_match)
+        if updated.get("_etag"):
+            response.headers["ETag"] = updated["_etag"]
+        return updated
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    except PreconditionFailedError:
+        raise HTTPException(status_code=412, detail="Workflow was modified by another request")
     except Exception as e:
         print(f"Error updating workflow: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -238,91 +248,38 @@ async def update_workflow(workflow_id: str, workflow_update: dict, user_id: str)
 @router.delete("/workflows/{workflow_id}")
 async def delete_workflow(workflow_id: str, user_id: str):
     try:
-        # Verify workflow exists and belongs to user
-        await get_workflow(workflow_id, user_id)
-        
-        # Delete from Cosmos DB
-        workflow_container.delete_item(item=workflow_id, partition_key=user_id)
+        await get_repository().delete_workflow(workflow_id, user_id)
         return {"message": "Workflow deleted successfully"}
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Workflow not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/configs/{workflow_id}")
-async def get_workflow_config(workflow_id: str):
+async def get_workflow_config(workflow_id: str, if_none_match: Optional[str] = Header(None)):
     """Get specific workflow configuration"""
     try:
-        # First check if it's a default config
-        if workflow_id in DEFAULT_CONFIGS:
-            config = DEFAULT_CONFIGS[workflow_id]
-            config["created_at"] = datetime.utcnow()
-            config["updated_at"] = datetime.utcnow()
-            return config
-            
-        # If not a default config, try to get from database
-        query = f"SELECT * FROM c WHERE c.id = @workflow_id"
-        parameters = [{"name": "@workflow_id", "value": workflow_id}]
-        configs = list(workflow_container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        
-        if not configs:
-            # If no config found, return a default config
-            default_config = {
-                "id": workflow_id,
-                "title": "Chat Assistant",
-                "description": "General purpose AI assistant",
-                "icon_name": "message-square",
-                "color": "#3B82F6",  # Default blue color
-                "conversation_starters": [
-                    {"id": "1", "text": "What can you help me with?"},
-                    {"id": "2", "text": "Tell me about yourself"},
-                    {"id": "3", "text": "How do I get started?"}
-                ],
-                "system_prompt": "You are a helpful AI assistant that can answer questions and help with various tasks.",
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            return default_config
-            
-        return configs[0]
+        snapshot = await config_registry.snapshot()
+        if workflow_id in snapshot.bodies:
+            return cached_json_response(snapshot.bodies[workflow_id], snapshot.etags[workflow_id], if_none_match)
+        # Workflows users created have no config document, their config is the workflow itself
+        body, etag = encode_json(workflow_as_config(await get_repository().find_workflow(workflow_id)))
+        return cached_json_response(body, etag, if_none_match)
+    except NotFoundError:
+        pass
     except Exception as e:
         print(f"Error in get_workflow_config: {str(e)}")
-        # Return a default config on error
-        default_config = {
-            "id": workflow_id,
-            "title": "Chat Assistant",
-            "description": "General purpose AI assistant",
-            "icon_name": "message-square",
-            "color": "#3B82F6",  # Default blue color
-            "conversation_starters": [
-                {"id": "1", "text": "What can you help me with?"},
-                {"id": "2", "text": "Tell me about yourself"},
-                {"id": "3", "text": "How do I get started?"}
-            ],
-            "system_prompt": "You are a helpful AI assistant that can answer questions and help with various tasks.",
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
-        }
-        return default_config
+    
+    # If no config found, return a default config
+    body, etag = encode_json(fallback_config(workflow_id))
+    return cached_json_response(body, etag, if_none_match)
 
 @router.get("/configs")
-async def get_workflow_configs():
+async def get_workflow_configs(if_none_match: Optional[str] = Header(None)):
     """Get all available workflow configurations"""
     try:
-        # Start with default configs
-        configs = list(DEFAULT_CONFIGS.values())
-        
-        # Add any custom configs from database
-        query = "SELECT * FROM c WHERE c.type = 'workflow_config'"
-        custom_configs = list(workflow_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        
-        configs.extend(custom_configs)
-        return configs
+        snapshot = await config_registry.snapshot()
+        return cached_json_response(snapshot.list_body, snapshot.list_etag, if_none_match)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -333,11 +290,11 @@ async def create_workflow_config(config: WorkflowConfig):
         # Add type and timestamps
         config_dict = config.dict()
         config_dict["type"] = "workflow_config"
-        config_dict["created_at"] = datetime.utcnow()
-        config_dict["updated_at"] = datetime.utcnow()
+        config_dict["created_at"] = datetime.utcnow().isoformat()
+        config_dict["updated_at"] = config_dict["created_at"]
         
-        # Store in CosmosDB
-        workflow_container.create_item(body=config_dict)
+        created = await get_repository().create_workflow_config(config_dict)
+        config_registry.add(created)
         return config_dict
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from azure.cosmos.aio import ContainerProxy
+
+logger = logging.getLogger(__name__)
+
+# The change feed of a container is read per partition key range, and azure-cosmos 4.5
+# (pinned in requirements.txt) only lists the ranges through this private method of the
+# client connection. Newer SDKs list them publicly (read_feed_ranges); until the pin moves,
+# a feed whose ranges can't be listed is turned off instead of failing on every poll.
+READ_RANGES_METHOD = "_ReadPartitionKeyRanges"
+
+ChangeHandler = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+ResetHandler = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class FeedState:
+    name: str
+    container: Callable[[], "ContainerProxy"]
+    handler: ChangeHandler
+    on_reset: Optional[ResetHandler] = None
+    ranges: List[str] = field(default_factory=list)
+    continuations: Dict[str, str] = field(default_factory=dict)
+    # Per range: polls in a row without changes, and when to poll it next
+    idle_polls: Dict[str, int] = field(default_factory=dict)
+    next_poll_at: Dict[str, float] = field(default_factory=dict)
+    unsupported: bool = False
+    polls: int = 0
+    changes: int = 0
+    errors: int = 0
+    resets: int = 0
+    last_change_at: Optional[float] = None
+
+
+class ChangeFeedProcessor:
+    """
+    Follows the change feeds of Cosmos DB containers and hands every changed document
+    to a handler, so each worker can keep its in-process caches and the materialized
+    views in step with writes made by other workers and replicas.
+
+    Every worker reads the feeds on its own, starting from the current position (no
+    lease container). A partition key range is polled every poll_interval seconds while
+    it has changes; each poll that finds none doubles the wait, up to max_poll_interval.
+    A range only moves forward after its handler succeeded. When the position is lost
+    (a handler failed or a partition split) the feed restarts from now and on_reset is
+    called, so the caches can drop whatever they might have missed.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, max_poll_interval: float = 10.0, max_item_count: int = 100,
+                 enabled: bool = True):
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(max_poll_interval, poll_interval)
+        self.max_item_count = max_item_count
+        self.enabled = enabled
+        self._feeds: List[FeedState] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, container: Callable[[], "ContainerProxy"], handler: ChangeHandler,
+            on_reset: Optional[ResetHandler] = None):
+        self._feeds.append(FeedState(name=name, container=container, handler=handler, on_reset=on_reset))
+
+    async def _list_ranges(self, container: "ContainerProxy") -> Optional[List[str]]:
+        """
+        The partition key range ids of the container, or None if this SDK can't list them.
+        """
+        read_ranges = getattr(container.client_connection, READ_RANGES_METHOD, None)
+        if read_ranges is None:
+            return None
+        return [partition_key_range["id"] async for partition_key_range in read_ranges(container.container_link)]
+
+    async def _read_range(self, container: "ContainerProxy", range_id: str,
+                          continuation: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        response_headers = {}
+        feed = container.query_items_change_feed(
+            partition_key_range_id=range_id,
+            continuation=continuation,
+            max_item_count=self.max_item_count,
+            response_hook=lambda headers, _: response_headers.update(headers)
+        )
+        changes = [item async for item in feed]
+        # The ETag of the last page is the position to continue from
+        etag = next((value for key, value in response_headers.items() if key.lower() == "etag"), None)
+        return changes, etag or continuation
+
+    async def _reset(self, feed: FeedState):
+        feed.ranges = []
+        feed.continuations = {}
+        feed.idle_polls = {}
+        feed.next_poll_at = {}
+        feed.resets += 1
+        if feed.on_reset is not None:
+            try:
+                await feed.on_reset()
+            except Exception as e:
+                logger.error(f"Error resetting caches for the {feed.name} change feed: {str(e)}")
+
+    def _next_poll_at(self, feed: FeedState, range_id: str, had_changes: bool, now: float) -> float:
+        idle = 0 if had_changes else feed.idle_polls.get(range_id, 0) + 1
+        feed.idle_polls[range_id] = idle
+        return now + min(self.poll_interval * 2 ** min(idle, 16), self.max_poll_interval)
+
+    async def poll(self, feed: FeedState):
+        """
+        Read the ranges of the feed that are due and hand their changes to the handler.
+        """
+        if feed.unsupported:
+            return
+        container = feed.container()
+        if not feed.ranges:
+            ranges = await self._list_ranges(container)
+            if ranges is None:
+                feed.unsupported = True
+                logger.error(f"This azure-cosmos version can't list partition key ranges, "
+                             f"the {feed.name} change feed is off")
+                return
+            feed.ranges = ranges
+
+        now = time.time()
+        changes = []
+        positions = {}
+        next_poll_at = {}
+        for range_id in feed.ranges:
+            if feed.next_poll_at.get(range_id, 0) > now:
+                continue
+            range_changes, positions[range_id] = await self._read_range(
+                container, range_id, feed.continuations.get(range_id)
+            )
+            changes.extend(range_changes)
+            next_poll_at[range_id] = self._next_poll_at(feed, range_id, bool(range_changes), now)
+        if not positions:
+            return
+        feed.polls += 1
+
+        if changes:
+            await feed.handler(changes)
+            feed.changes += len(changes)
+            feed.last_change_at = time.time()
+            logger.debug(f"Applied {len(changes)} changes from the {feed.name} change feed")
+        feed.continuations.update({range_id: etag for range_id, etag in positions.items() if etag})
+        feed.next_poll_at.update(next_poll_at)
+
+    async def _run(self):
+        from azure.cosmos.exceptions import CosmosHttpResponseError
+
+        while True:
+            for feed in self._feeds:
+                try:
+                    await self.poll(feed)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    feed.errors += 1
+                    if isinstance(e, CosmosHttpResponseError) and e.status_code == 410:
+                        logger.warning(f"Partition key ranges of {feed.name} changed, restarting its change feed")
+                    else:
+                        logger.error(f"Error reading the {feed.name} change feed: {str(e)}")
+                    await self._reset(feed)
+            await asyncio.sleep(self.poll_interval)
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        # Take the current position of every feed, so nothing written from now on is missed
+        for feed in self._feeds:
+            try:
+                await self.poll(feed)
+            except Exception as e:
+                feed.errors += 1
+                logger.error(f"Error starting the {feed.name} change feed: {str(e)}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def following(self, name: str) -> bool:
+        """
+        Whether the named feed is being read, so whatever it keeps up to date is current.
+        """
+        return self.enabled and any(feed.name == name and not feed.unsupported for feed in self._feeds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            feed.name: {
+                "enabled": self.enabled and not feed.unsupported,
+                "ranges": len(feed.ranges),
+                "idle_ranges": sum(1 for idle in feed.idle_polls.values() if idle > 0),
+                "polls": feed.polls,
+                "changes": feed.changes,
+                "errors": feed.errors,
+                "resets": feed.resets,
+                "last_change_at": feed.last_change_at,
+            }
+            for feed in self._feeds
+        }
+
+
+change_feed = ChangeFeedProcessor(
+    poll_interval=float(os.getenv("CHANGE_FEED_POLL_SECONDS", 1)),
+    max_poll_interval=float(os.getenv("CHANGE_FEED_MAX_POLL_SECONDS", 10)),
+    enabled=os.getenv("CHANGE_FEED_ENABLED", "true").lower() != "false",
+)
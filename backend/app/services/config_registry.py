@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from fastapi import Response
+
+from .repository import get_repository
+
+logger = logging.getLogger(__name__)
+
+
+def encode_json(value: Any) -> Tuple[bytes, str]:
+    body = json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def _public(config: Dict[str, Any]) -> Dict[str, Any]:
+    # Drop Cosmos DB system properties (_rid, _etag, _ts...), they change the ETag without changing the config
+    return {key: value for key, value in config.items() if not key.startswith("_")}
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Immutable view of all workflow configs with their JSON bodies and ETags precomputed.
+    """
+    ids: Tuple[str, ...]
+    bodies: Mapping[str, bytes]
+    etags: Mapping[str, str]
+    list_body: bytes
+    list_etag: str
+    loaded_at: float
+
+    @classmethod
+    def build(cls, configs: List[Dict[str, Any]]) -> "ConfigSnapshot":
+        configs = [_public(config) for config in configs]
+        bodies, etags = {}, {}
+        for config in configs:
+            bodies[config["id"]], etags[config["id"]] = encode_json(config)
+        list_body, list_etag = encode_json(configs)
+        return cls(
+            ids=tuple(config["id"] for config in configs),
+            bodies=MappingProxyType(bodies),
+            etags=MappingProxyType(etags),
+            list_body=list_body,
+            list_etag=list_etag,
+            loaded_at=time.time(),
+        )
+
+
+class ConfigRegistry:
+    """
+    In-memory registry of workflow configs: the built-in defaults plus the custom
+    workflow configs stored in the repository.
+
+    The custom configs are loaded once and refreshed in the background every
+    refresh_interval seconds (requests keep being served from the current snapshot
+    meanwhile). Configs created through this process are added immediately. Each
+    change produces a new snapshot, so the response bodies and ETags stay stable
+    between changes and across workers.
+    """
+
+    def __init__(self, defaults: Dict[str, Dict[str, Any]], refresh_interval: float = 300.0):
+        self.defaults = defaults
+        self.refresh_interval = refresh_interval
+        self._custom: Dict[str, Dict[str, Any]] = {}
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _rebuild(self):
+        custom = sorted(self._custom.values(), key=lambda config: (str(config.get("created_at")), config["id"]))
+        self._snapshot = ConfigSnapshot.build(
+            list(self.defaults.values()) + [config for config in custom if config["id"] not in self.defaults]
+        )
+
+    async def refresh(self):
+        async with self._lock:
+            try:
+                configs = await get_repository().list_workflow_configs()
+                self._custom = {config["id"]: config for config in configs}
+                logger.info(f"Loaded {len(configs)} custom workflow configs")
+            except Exception as e:
+                # Keep serving what we have, the next refresh tries again
+                logger.error(f"Error loading workflow configs: {str(e)}")
+            self._rebuild()
+
+    async def snapshot(self) -> ConfigSnapshot:
+        if self._snapshot is None:
+            await self.refresh()
+        elif time.time() - self._snapshot.loaded_at >= self.refresh_interval and (
+                self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self._snapshot
+
+    def add(self, config: Dict[str, Any]):
+        """
+        Add or replace a custom config written by this process.
+        """
+        self._custom[config["id"]] = config
+        self._rebuild()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def cached_json_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    """
+    Return a precomputed JSON body, or 304 Not Modified if the client already has it.
+    """
+    max_age = int(os.getenv("CONFIG_CACHE_MAX_AGE_SECONDS", 0))
+    headers = {
+        "ETag": etag,
+        # no-cache still lets the browser store the response, it just revalidates it every time
+        "Cache-Control": f"public, max-age={max_age}" if max_age else "no-cache",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,119 @@
+import logging
+import os
+from typing import TYPE_CHECKING, Optional
+
+from .cosmos_metrics import cosmos_metrics
+
+if TYPE_CHECKING:
+    import aiohttp
+    from azure.cosmos.aio import CosmosClient, ContainerProxy, DatabaseProxy
+
+logger = logging.getLogger(__name__)
+
+
+class CosmosDB:
+    """
+    Shared async Cosmos DB client for all routers.
+
+    The client and its containers are created in the app lifespan (connect/close) and
+    reuse one pooled aiohttp session, so database calls never block the event loop and
+    many of them can overlap per worker. The SDK is imported by connect, so importing
+    the app doesn't load it.
+    """
+
+    def __init__(self):
+        self.client: Optional["CosmosClient"] = None
+        self.database: Optional["DatabaseProxy"] = None
+        self._chat_container: Optional["ContainerProxy"] = None
+        self._workflow_container: Optional["ContainerProxy"] = None
+        self._summary_container: Optional["ContainerProxy"] = None
+        self._http_session: Optional["aiohttp.ClientSession"] = None
+
+    @property
+    def chat_container(self) -> "ContainerProxy":
+        if self._chat_container is None:
+            raise RuntimeError("Cosmos DB is not connected")
+        return self._chat_container
+
+    @property
+    def workflow_container(self) -> "ContainerProxy":
+        if self._workflow_container is None:
+            raise RuntimeError("Cosmos DB is not connected")
+        return self._workflow_container
+
+    @property
+    def summary_container(self) -> "ContainerProxy":
+        if self._summary_container is None:
+            raise RuntimeError("Cosmos DB is not connected")
+        return self._summary_container
+
+    async def connect(self):
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+        from azure.cosmos.aio import CosmosClient
+
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv("COSMOS_POOL_SIZE", 100)),
+            limit_per_host=int(os.getenv("COSMOS_POOL_SIZE_PER_HOST", 0)),
+            keepalive_timeout=float(os.getenv("COSMOS_KEEPALIVE_SECONDS", 30)),
+            ttl_dns_cache=300
+        )
+        self._http_session = aiohttp.ClientSession(connector=connector)
+        try:
+            self.client = CosmosClient(
+                os.getenv("COSMOS_ENDPOINT"),
+                os.getenv("COSMOS_KEY"),
+                transport=AioHttpTransport(session=self._http_session, session_owner=False),
+                connection_timeout=int(os.getenv("COSMOS_CONNECTION_TIMEOUT", 10)),
+                # Record request charge, latency and throttling of every call
+                raw_request_hook=cosmos_metrics.on_request,
+                raw_response_hook=cosmos_metrics.on_response
+            )
+            await self.client.__aenter__()
+        except BaseException:
+            # Also on cancellation, e.g. when the startup timeout expires
+            await self.close()
+            raise
+
+        self.database = self.client.get_database_client(os.getenv("COSMOS_DATABASE", "chatview-db"))
+        self._chat_container = self.database.get_container_client(os.getenv("COSMOS_CONTAINER", "chat-history"))
+        self._workflow_container = self.database.get_container_client("workflows")
+        self._summary_container = self.database.get_container_client(
+            os.getenv("COSMOS_SUMMARY_CONTAINER", "session-summaries")
+        )
+
+    async def provision(self):
+        """
+        Create the workflows and session summaries containers if they don't exist.
+        COSMOS_WORKFLOWS_THROUGHPUT=0 or COSMOS_SUMMARIES_THROUGHPUT=0 leaves a container
+        on shared database throughput.
+        """
+        from azure.cosmos import PartitionKey
+
+        await self.database.create_container_if_not_exists(
+            id="workflows",
+            partition_key=PartitionKey(path="/user_id"),
+            offer_throughput=int(os.getenv("COSMOS_WORKFLOWS_THROUGHPUT", 400)) or None
+        )
+        logger.info("Workflows container created or already exists")
+        await self.database.create_container_if_not_exists(
+            id=self._summary_container.id,
+            partition_key=PartitionKey(path="/userId"),
+            offer_throughput=int(os.getenv("COSMOS_SUMMARIES_THROUGHPUT", 400)) or None
+        )
+        logger.info("Session summaries container created or already exists")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        self.database = None
+        self._chat_container = None
+        self._workflow_container = None
+        self._summary_container = None
+
+
+cosmos_db = CosmosDB()
@@ -0,0 +1,236 @@
+import contextvars
+import logging
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Response header carrying the request units a request consumed in Cosmos DB
+REQUEST_CHARGE_HEADER = "X-Cosmos-Request-Charge"
+NO_REQUEST = "(no request)"
+
+
+@dataclass
+class RequestUsage:
+    """
+    Cosmos DB usage of a single API request.
+    """
+    calls: int = 0
+    request_charge: float = 0.0
+    throttled: int = 0
+    cosmos_ms: float = 0.0
+
+
+_current_usage: contextvars.ContextVar[Optional[RequestUsage]] = contextvars.ContextVar("cosmos_usage", default=None)
+
+
+class LatencyStats:
+    def __init__(self, window: int = 500):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.retry_after_ms = 0.0
+        self.request_charge = 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "retry_after_ms": round(self.retry_after_ms, 1),
+            "ru_total": round(self.request_charge, 2),
+            "ru_avg": round(self.request_charge / self.calls, 2) if self.calls else 0.0,
+            "p50_ms": round(self.percentile(0.5), 1) if self.latencies else None,
+            "p95_ms": round(self.percentile(0.95), 1) if self.latencies else None,
+        }
+
+
+def classify(method: str, path: str, headers) -> Tuple[str, Optional[str]]:
+    """
+    Map a Cosmos DB REST call to the SDK operation and container it belongs to.
+    """
+    segments = [segment for segment in path.split("/") if segment]
+    container = segments[segments.index("colls") + 1] if "colls" in segments[:-1] else None
+    if "docs" not in segments:
+        return "metadata", container
+
+    if segments[-1] != "docs":
+        return {"GET": "read_item", "PUT": "replace_item", "PATCH": "patch_item",
+                "DELETE": "delete_item"}.get(method, method.lower()), container
+    if method == "POST":
+        if str(headers.get("x-ms-documentdb-isquery", "")).lower() == "true":
+            return "query_items", container
+        if str(headers.get("x-ms-documentdb-is-upsert", "")).lower() == "true":
+            return "upsert_item", container
+        return "create_item", container
+    if headers.get("A-IM"):
+        return "query_items_change_feed", container
+    return "read_all_items", container
+
+
+class CosmosMetrics:
+    """
+    Request charge, latency and throttling of every Cosmos DB call.
+
+    Installed as the raw request/response hooks of the Cosmos client pipeline, so it
+    sees each HTTP call the SDK makes (including throttled attempts it retries) without
+    wrapping individual call sites. Calls are aggregated per operation and container,
+    the request units per partition key, and per API endpoint through the usage context
+    opened by CosmosUsageMiddleware.
+    """
+
+    def __init__(self, max_partitions: int = 1000, top_partitions: int = 10):
+        self.max_partitions = max_partitions
+        self.top_partitions = top_partitions
+        self._operations: Dict[Tuple[str, Optional[str]], LatencyStats] = {}
+        self._endpoints: Dict[str, Dict[str, float]] = {}
+        self._partitions: Dict[Optional[str], Counter] = {}
+
+    def on_request(self, request):
+        request.context["cosmos_started"] = time.perf_counter()
+
+    def on_response(self, response):
+        try:
+            self._record(response)
+        except Exception as e:
+            logger.warning(f"Failed to record Cosmos DB metrics: {str(e)}")
+
+    def _record(self, response):
+        http_request = response.http_request
+        http_response = response.http_response
+        started = response.context.get("cosmos_started")
+        latency_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+        headers = http_response.headers
+        charge = float(headers.get("x-ms-request-charge") or 0)
+        status = http_response.status_code
+        throttled = status == 429
+
+        operation, container = classify(http_request.method, http_request.url.split("?")[0], http_request.headers)
+        stats = self._operations.setdefault((operation, container), LatencyStats())
+        stats.calls += 1
+        stats.latencies.append(latency_ms)
+        stats.request_charge += charge
+        if status >= 400 and status != 404:
+            stats.errors += 1
+        if throttled:
+            stats.throttled += 1
+            stats.retry_after_ms += float(headers.get("x-ms-retry-after-ms") or 0)
+
+        partition = http_request.headers.get("x-ms-documentdb-partitionkey")
+        if partition and charge:
+            partitions = self._partitions.setdefault(container, Counter())
+            partitions[partition] += charge
+            if len(partitions) > self.max_partitions:
+                # Keep the heaviest half so the hot spots survive
+                kept = partitions.most_common(self.max_partitions // 2)
+                partitions.clear()
+                partitions.update(dict(kept))
+
+        usage = _current_usage.get()
+        if usage is None:
+            self._record_endpoint(NO_REQUEST, RequestUsage(1, charge, int(throttled), latency_ms), count_request=False)
+        else:
+            usage.calls += 1
+            usage.request_charge += charge
+            usage.throttled += int(throttled)
+            usage.cosmos_ms += latency_ms
+
+        # Each attempt is a span of its own, so throttling retries show up in the waterfall
+        tracer.record_call(f"cosmos.{operation}", latency_ms / 1000, {
+            "db.system": "cosmosdb",
+            "db.operation": operation,
+            "db.container": container,
+            "db.request_charge": charge,
+            "http.status_code": status,
+            "http.response_bytes": int(headers.get("content-length") or 0) or None,
+        }, error=f"HTTP {status}" if status >= 400 and status != 404 else None)
+        current = tracer.current_span()
+        current.add("db.request_charge", charge)
+        if throttled:
+            current.add("db.retries")
+
+        logger.debug(f"Cosmos {operation} on {container} [{partition}]: {status} {charge} RU in {latency_ms:.1f}ms")
+
+    def _record_endpoint(self, endpoint: str, usage: RequestUsage, count_request: bool = True):
+        stats = self._endpoints.setdefault(endpoint, {
+            "requests": 0, "cosmos_calls": 0, "ru_total": 0.0, "ru_max": 0.0, "throttled": 0, "cosmos_ms_total": 0.0,
+        })
+        stats["requests"] += 1 if count_request else 0
+        stats["cosmos_calls"] += usage.calls
+        stats["ru_total"] += usage.request_charge
+        stats["ru_max"] = max(stats["ru_max"], usage.request_charge)
+        stats["throttled"] += usage.throttled
+        stats["cosmos_ms_total"] += usage.cosmos_ms
+
+    def record_request(self, endpoint: str, usage: RequestUsage):
+        if usage.calls:
+            self._record_endpoint(endpoint, usage)
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, stats in sorted(self._endpoints.items(), key=lambda item: -item[1]["ru_total"]):
+            endpoints[endpoint] = {
+                **{key: round(value, 2) if isinstance(value, float) else value for key, value in stats.items()},
+                "ru_avg": round(stats["ru_total"] / stats["requests"], 2) if stats["requests"] else None,
+            }
+        return {
+            "ru_total": round(sum(stats.request_charge for stats in self._operations.values()), 2),
+            "throttled": sum(stats.throttled for stats in self._operations.values()),
+            "endpoints": endpoints,
+            "operations": {
+                f"{operation} {container or '-'}": stats.to_dict()
+                for (operation, container), stats in self._operations.items()
+            },
+            "hot_partitions": {
+                container or "-": [[partition, round(charge, 2)] for partition, charge in partitions.most_common(self.top_partitions)]
+                for container, partitions in self._partitions.items()
+            },
+        }
+
+
+class CosmosUsageMiddleware:
+    """
+    ASGI middleware that attributes Cosmos DB usage to the API endpoint being served
+    and reports the request units of each request in the X-Cosmos-Request-Charge header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        usage = RequestUsage()
+        token = _current_usage.set(usage)
+
+        async def send_with_charge(message):
+            if message["type"] == "http.response.start" and usage.calls:
+                MutableHeaders(scope=message).append(REQUEST_CHARGE_HEADER, f"{usage.request_charge:.2f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_charge)
+        finally:
+            _current_usage.reset(token)
+            # The router stores the matched route in the scope, so endpoints group by path template
+            route = scope.get("route")
+            endpoint = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+            cosmos_metrics.record_request(endpoint, usage)
+
+
+cosmos_metrics = CosmosMetrics()
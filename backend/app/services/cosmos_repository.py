@@ -0,0 +1,396 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from .change_feed import change_feed
+from .cosmos_db import cosmos_db
+from .cosmos_metrics import cosmos_metrics
+from .metrics import metrics
+from .repository import (
+    InvalidContinuationError,
+    NotFoundError,
+    PreconditionFailedError,
+    Repository,
+)
+from .resources import ResourceRegistry
+from .session_cache import session_cache
+from .session_summaries import session_summaries
+from .workflow_cache import workflow_cache
+
+logger = logging.getLogger(__name__)
+
+# Cosmos DB applies at most this many operations in a single patch
+MAX_PATCH_OPERATIONS = 10
+
+# Reads of a workflow an update without an ETag makes before giving up on concurrent writes
+WORKFLOW_UPDATE_ATTEMPTS = 3
+
+# Continuation tokens of pages served from the summary view, as opposed to query tokens
+VIEW_CONTINUATION_PREFIX = "view:"
+
+
+@contextmanager
+def cosmos_errors():
+    """
+    Raise Cosmos DB errors as the repository errors the routers handle.
+    """
+    # The SDK is imported where it's used, so importing the app doesn't load it
+    from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
+
+    try:
+        yield
+    except CosmosResourceNotFoundError as e:
+        raise NotFoundError(str(e)) from e
+    except CosmosAccessConditionFailedError as e:
+        raise PreconditionFailedError(str(e)) from e
+
+
+def if_not_modified(etag: Optional[str]) -> Dict[str, Any]:
+    """
+    Options making a write conditional on the document still having etag, none without one.
+    """
+    if not etag:
+        return {}
+    from azure.core import MatchConditions
+    return {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+
+
+class CosmosRepository(Repository):
+    """
+    Sessions and workflows in Cosmos DB, with the session and workflow caches, the
+    session summary view and the change feeds that keep them current.
+    """
+
+    backend = "cosmos"
+
+    def __init__(self):
+        self._on_config_change: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._on_config_reset: Optional[Callable[[], Awaitable[None]]] = None
+        self._background: Set[asyncio.Task] = set()
+
+    def register_resources(self, registry: ResourceRegistry) -> str:
+        registry.register("cosmos", start=cosmos_db.connect, stop=cosmos_db.close)
+        registry.register("cosmos_containers", start=cosmos_db.provision, depends_on=("cosmos",))
+        # Keep every worker's caches and the session summary views in step with other writers
+        change_feed.add("chat-history", lambda: cosmos_db.chat_container,
+                        self.on_session_changes, self.on_session_feed_reset)
+        change_feed.add("workflows", lambda: cosmos_db.workflow_container,
+                        self.on_workflow_changes, self.on_workflow_feed_reset)
+        registry.register("change_feed", start=change_feed.start, stop=change_feed.stop,
+                          depends_on=("cosmos_containers",))
+        registry.register("session_summaries", start=session_summaries.start, stop=session_summaries.stop,
+                          depends_on=("cosmos_containers",))
+        metrics.register_stats("cosmos", lambda: cosmos_metrics.stats()["operations"], label="operation")
+        metrics.register_stats("session_cache", session_cache.stats)
+        metrics.register_stats("workflow_cache", workflow_cache.stats)
+        metrics.register_stats("session_summaries", session_summaries.stats)
+        metrics.register_stats("change_feed", change_feed.stats, label="feed")
+        return "cosmos_containers"
+
+    def watch_configs(self, on_change: Callable[[Dict[str, Any]], None],
+                      on_reset: Callable[[], Awaitable[None]]):
+        self._on_config_change = on_change
+        self._on_config_reset = on_reset
+
+    def _in_background(self, coroutine: Awaitable[Any]):
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # Sessions
+
+    async def create_session(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        created = await cosmos_db.chat_container.create_item(body=session)
+        session_cache.put(created)
+        # The change feed does the same, this just shows the session in the sidebar sooner
+        # when this worker holds the view lease
+        self._in_background(session_summaries.apply([created]))
+        return created
+
+    async def get_session(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        with cosmos_errors():
+            return await session_cache.read(session_id, user_id)
+
+    async def list_sessions(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        One query for the sessions and their order. Reading them one by one in the order
+        of the summary view would cost a request per session.
+        """
+        query = "SELECT * FROM c WHERE c.userId = @userId ORDER BY c.updatedAt DESC OFFSET 0 LIMIT @limit"
+        parameters = [
+            {"name": "@userId", "value": user_id},
+            {"name": "@limit", "value": limit}
+        ]
+        # userId is the partition key, so this stays a single-partition query
+        return [item async for item in cosmos_db.chat_container.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=user_id
+        )]
+
+    async def list_session_summaries(self, user_id: str, limit: int,
+                                     continuation: Optional[str] = None) -> Dict[str, Any]:
+        from azure.cosmos.exceptions import CosmosHttpResponseError
+
+        # The views are only kept up to date by the chat-history change feed
+        use_view = session_summaries.enabled and change_feed.following("chat-history")
+        if use_view and (continuation is None or continuation.startswith(VIEW_CONTINUATION_PREFIX)):
+            offset = 0
+            if continuation is not None:
+                try:
+                    offset = int(continuation[len(VIEW_CONTINUATION_PREFIX):])
+                except ValueError:
+                    raise InvalidContinuationError("Invalid continuation token")
+            try:
+                view = await session_summaries.get(user_id)
+                if not view.get("truncated"):
+                    sessions = view["sessions"]
+                    end = offset + limit
+                    return {
+                        "items": sessions[offset:end],
+                        "continuation": f"{VIEW_CONTINUATION_PREFIX}{end}" if end < len(sessions) else None
+                    }
+            except Exception as e:
+                logger.error(f"Error reading session summaries, falling back to a query: {str(e)}")
+            if continuation is not None:
+                # A query can't resume from a view offset, the client has to start over
+                raise InvalidContinuationError("Session summaries are unavailable, list from the start")
+
+        query = (
+            "SELECT c.id, c.workflowId, c.workflowTitle, c.createdAt, c.updatedAt, "
+            "ARRAY_LENGTH(c.messages) AS messageCount "
+            "FROM c WHERE c.userId = @userId ORDER BY c.updatedAt DESC"
+        )
+        pages = cosmos_db.chat_container.query_items(
+            query=query,
+            parameters=[{"name": "@userId", "value": user_id}],
+            partition_key=user_id,
+            max_item_count=limit
+        ).by_page(continuation)
+
+        try:
+            page = await pages.__anext__()
+            items = [item async for item in page]
+        except StopAsyncIteration:
+            items = []
+        except CosmosHttpResponseError as e:
+            if e.status_code == 400:
+                raise InvalidContinuationError("Invalid continuation token") from e
+            raise
+        return {"items": items, "continuation": pages.continuation_token}
+
+    async def append_messages(self, session_id: str, user_id: str, messages: List[Dict[str, Any]],
+                              etag: Optional[str] = None) -> Optional[str]:
+        """
+        Append messages with partial-document patches.
+
+        Each patch adds to /messages/- server side, so the cost stays flat however long the
+        session gets and concurrent appends never overwrite each other. Up to
+        MAX_PATCH_OPERATIONS - 1 messages go in one atomic patch; longer lists are chained,
+        each patch conditional on the ETag of the previous one. A chain is not atomic: if
+        a later patch fails, the messages of the earlier ones stay appended (azure-cosmos
+        4.5 has no transactional batch to group them).
+
+        Without an etag the append is still made conditional on the cached version of the
+        session, so the session cache can apply it in place. If that version is out of date
+        the append is retried unconditionally and the cached copy is dropped.
+        """
+        from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+
+        cached_etag = session_cache.etag(session_id, user_id)
+        speculative = etag is None and cached_etag is not None
+        previous_etag = etag or cached_etag
+        updated_at = datetime.now().isoformat()
+
+        chunk_size = MAX_PATCH_OPERATIONS - 1
+        etag = previous_etag
+        try:
+            with cosmos_errors():
+                for start in range(0, len(messages), chunk_size):
+                    operations = [{"op": "add", "path": "/messages/-", "value": message} for message in messages[start:start + chunk_size]]
+                    operations.append({"op": "set", "path": "/updatedAt", "value": updated_at})
+                    try:
+                        etag = await self._patch_session(session_id, user_id, operations, etag)
+                    except CosmosAccessConditionFailedError:
+                        if not (speculative and start == 0):
+                            raise
+                        speculative = False
+                        previous_etag = None
+                        etag = await self._patch_session(session_id, user_id, operations, None)
+        except Exception:
+            session_cache.invalidate(session_id, user_id)
+            raise
+
+        session_cache.apply_append(session_id, user_id, previous_etag, messages, updated_at, etag)
+        return etag
+
+    async def _patch_session(self, session_id: str, user_id: str, operations: List[Dict[str, Any]],
+                             etag: Optional[str]) -> Optional[str]:
+        response_headers = {}
+        await cosmos_db.chat_container.patch_item(
+            item=session_id,
+            partition_key=user_id,
+            patch_operations=operations,
+            # Skip sending the whole updated document back
+            headers={"Prefer": "return=minimal"},
+            response_hook=lambda headers, _: response_headers.update(headers),
+            **if_not_modified(etag)
+        )
+        return next((value for key, value in response_headers.items() if key.lower() == "etag"), None)
+
+    async def on_session_changes(self, sessions: List[Dict[str, Any]]):
+        """
+        Change feed handler for chat-history: drop cached copies of sessions changed
+        elsewhere and merge the changes into the session summary views.
+        """
+        for session in sessions:
+            if not session.get("id") or not session.get("userId"):
+                continue
+            cached_etag = session_cache.etag(session["id"], session["userId"])
+            if cached_etag is not None and cached_etag != session.get("_etag"):
+                session_cache.invalidate(session["id"], session["userId"])
+        await session_summaries.apply(sessions)
+
+    async def on_session_feed_reset(self):
+        session_cache.clear()
+        session_summaries.invalidate_all()
+
+    # Workflows
+
+    async def create_workflow(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        created = await cosmos_db.workflow_container.create_item(body=workflow)
+        workflow_cache.put(created)
+        return created
+
+    async def list_workflows(self, user_id: str) -> List[Dict[str, Any]]:
+        items = workflow_cache.get_all(user_id)
+        if items is not None:
+            return items
+
+        query = "SELECT * FROM c WHERE c.user_id = @userId"
+        parameters = [{"name": "@userId", "value": user_id}]
+        # user_id is the partition key, so this stays a single-partition query
+        items = [item async for item in cosmos_db.workflow_container.query_items(
+            query=query,
+            parameters=parameters,
+            partition_key=user_id
+        )]
+        workflow_cache.set_all(user_id, items)
+        return items
+
+    async def get_workflow(self, workflow_id: str, user_id: str) -> Dict[str, Any]:
+        item = workflow_cache.get(user_id, workflow_id)
+        if item is not None:
+            return item
+
+        # Point read by id and partition key
+        with cosmos_errors():
+            item = await cosmos_db.workflow_container.read_item(item=workflow_id, partition_key=user_id)
+        workflow_cache.put(item)
+        return item
+
+    async def find_workflow(self, workflow_id: str) -> Dict[str, Any]:
+        item = workflow_cache.find(workflow_id)
+        if item is not None:
+            return item
+
+        # Without the owner this has to fan out over the partitions; workflow configs share the container
+        query = "SELECT * FROM c WHERE c.id = @workflowId AND (NOT IS_DEFINED(c.type) OR c.type != 'workflow_config')"
+        parameters = [{"name": "@workflowId", "value": workflow_id}]
+        async for item in cosmos_db.workflow_container.query_items(query=query, parameters=parameters):
+            workflow_cache.put(item)
+            return item
+        raise NotFoundError(f"Workflow {workflow_id} not found")
+
+    async def update_workflow(self, workflow_id: str, user_id: str, changes: Dict[str, Any],
+                              etag: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Update the workflow in a single patch, conditional on the version the changes
+        were compared with.
+
+        With an etag the patch fails if the workflow no longer has it. Without one, fields
+        the cached copy already has are skipped and the patch is conditional on that copy;
+        if the workflow changed meanwhile it is read again and the changes are compared
+        with the current version, so the patch never lands on a version it wasn't checked
+        against.
+        """
+        from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+
+        try:
+            with cosmos_errors():
+                if etag is not None:
+                    try:
+                        updated = await self._patch_workflow(workflow_id, user_id, changes, etag)
+                    except CosmosAccessConditionFailedError:
+                        workflow_cache.invalidate(user_id, workflow_id)
+                        raise
+                else:
+                    updated = await self._patch_current_workflow(workflow_id, user_id, changes)
+        except NotFoundError:
+            workflow_cache.invalidate(user_id, workflow_id)
+            raise
+
+        workflow_cache.put(updated)
+        return updated
+
+    async def _patch_current_workflow(self, workflow_id: str, user_id: str,
+                                      changes: Dict[str, Any]) -> Dict[str, Any]:
+        from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+
+        current = workflow_cache.get(user_id, workflow_id)
+        for _ in range(WORKFLOW_UPDATE_ATTEMPTS):
+            if current is None or not current.get("_etag"):
+                current = await cosmos_db.workflow_container.read_item(item=workflow_id, partition_key=user_id)
+            changes_to_send = {key: value for key, value in changes.items() if current.get(key) != value}
+            try:
+                return await self._patch_workflow(workflow_id, user_id, changes_to_send, current["_etag"])
+            except CosmosAccessConditionFailedError:
+                workflow_cache.invalidate(user_id, workflow_id)
+                current = None
+        raise PreconditionFailedError(f"Workflow {workflow_id} kept changing during the update")
+
+    async def _patch_workflow(self, workflow_id: str, user_id: str, changes: Dict[str, Any],
+                              etag: Optional[str]) -> Dict[str, Any]:
+        operations = [{"op": "set", "path": f"/{key}", "value": value} for key, value in changes.items()]
+        operations.append({"op": "set", "path": "/updated_at", "value": datetime.now().isoformat()})
+        return await cosmos_db.workflow_container.patch_item(
+            item=workflow_id,
+            partition_key=user_id,
+            patch_operations=operations,
+            **if_not_modified(etag)
+        )
+
+    async def delete_workflow(self, workflow_id: str, user_id: str):
+        workflow_cache.invalidate(user_id, workflow_id)
+        with cosmos_errors():
+            await cosmos_db.workflow_container.delete_item(item=workflow_id, partition_key=user_id)
+
+    async def on_workflow_changes(self, documents: List[Dict[str, Any]]):
+        """
+        Change feed handler for the workflows container: pass on workflow configs written
+        by other workers and drop users whose cached workflows changed elsewhere.
+        """
+        for document in documents:
+            if document.get("type") == "workflow_config":
+                if self._on_config_change is not None:
+                    self._on_config_change(document)
+            elif document.get("user_id") and document.get("id"):
+                # Our own writes are cached with the same ETag, anything else also changes the user's list
+                if workflow_cache.etag(document["user_id"], document["id"]) != document.get("_etag"):
+                    workflow_cache.invalidate(document["user_id"])
+
+    async def on_workflow_feed_reset(self):
+        workflow_cache.clear()
+        if self._on_config_reset is not None:
+            await self._on_config_reset()
+
+    # Workflow configs
+
+    async def list_workflow_configs(self) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM c WHERE c.type = 'workflow_config'"
+        return [item async for item in cosmos_db.workflow_container.query_items(query=query)]
+
+    async def create_workflow_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        return await cosmos_db.workflow_container.create_item(body=config)
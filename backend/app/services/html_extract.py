@@ -0,0 +1,194 @@
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def default_parser() -> str:
+    """
+    Prefer the lxml parser backend when it is installed, it is several times faster than html.parser.
+    """
+    return "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+
+def extract_text(html: str, parser: str = "html.parser", main_content: bool = True) -> Tuple[str, int]:
+    """
+    Extract the readable text content from an HTML document.
+
+    Returns the text and the length of the full page text, so callers can report how much
+    the main-content extraction removed. Falls back to the full text when no main block is found.
+    """
+    # Imported here, in the worker that parses, so importing the app doesn't load bs4 and lxml
+    from bs4 import BeautifulSoup
+    from .readability import extract_main_content
+
+    # Parse HTML with BeautifulSoup
+    soup = BeautifulSoup(html, parser)
+
+    # Remove script and style elements
+    for script in soup(["script", "style", "nav", "footer", "header"]):
+        script.extract()
+
+    # Get text content
+    text = soup.get_text(separator=' ', strip=True)
+
+    # Clean up text (remove extra whitespace, etc.)
+    full_text = re.sub(r'\s+', ' ', text).strip()
+
+    if main_content:
+        main_text = extract_main_content(soup)
+        if main_text:
+            return main_text, len(full_text)
+    return full_text, len(full_text)
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout("Page extraction exceeded its CPU time limit")
+
+
+def _init_worker():
+    # Pool workers run tasks on their main thread, so a profiling timer can interrupt a runaway parse
+    signal.signal(signal.SIGPROF, _raise_timeout)
+
+
+def _extract_task(html: str, parser: str, main_content: bool, cpu_limit: float,
+                  use_timer: bool) -> Tuple[str, int, float]:
+    """
+    Run extract_text and return the text, the full text length and the CPU time used in milliseconds.
+    """
+    start = time.process_time() if use_timer else time.thread_time()
+    if use_timer:
+        signal.setitimer(signal.ITIMER_PROF, cpu_limit)
+    try:
+        text, full_chars = extract_text(html, parser, main_content)
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+    end = time.process_time() if use_timer else time.thread_time()
+    return text, full_chars, (end - start) * 1000
+
+
+class HtmlExtractor:
+    """
+    Runs HTML parsing and text extraction off the event loop.
+
+    mode is "process" (default, scales across cores and enforces the CPU limit per page),
+    "thread" (wall-clock timeout only) or "inline" (runs on the event loop, for debugging).
+    """
+
+    def __init__(self, mode: str = "process", max_workers: Optional[int] = None,
+                 cpu_limit: float = 2.0, timeout: float = 5.0, parser: Optional[str] = None,
+                 main_content: bool = True):
+        self.mode = mode
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.cpu_limit = cpu_limit
+        self.timeout = timeout
+        self.parser = parser or default_parser()
+        self.main_content = main_content
+        self._executor: Optional[Executor] = None
+        self._stats = {
+            "pages": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "cpu_ms_total": 0.0,
+            "cpu_ms_max": 0.0,
+            "wall_ms_total": 0.0,
+            "full_chars_total": 0,
+            "text_chars_total": 0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="html-extract"
+                )
+            logger.info(f"Started {self.mode} HTML extractor with {self.max_workers} workers using {self.parser}")
+        return self._executor
+
+    async def extract(self, html: str, url: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """
+        Extract text from html, returning (text, cpu_ms) or None if the page hit its time limit.
+        """
+        start = time.perf_counter()
+        try:
+            if self.mode == "inline":
+                text, full_chars, cpu_ms = _extract_task(html, self.parser, self.main_content, self.cpu_limit, False)
+            else:
+                loop = asyncio.get_running_loop()
+                use_timer = self.mode == "process" and hasattr(signal, "setitimer")
+                future = loop.run_in_executor(
+                    self._get_executor(), _extract_task, html, self.parser, self.main_content,
+                    self.cpu_limit, use_timer
+                )
+                text, full_chars, cpu_ms = await asyncio.wait_for(future, timeout=self.timeout)
+        except (ExtractionTimeout, asyncio.TimeoutError):
+            self._stats["timeouts"] += 1
+            logger.warning(f"HTML extraction timed out for a {len(html)} character page")
+            return None
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory), start a fresh pool for the next page
+            self._stats["errors"] += 1
+            logger.error("HTML extraction worker pool broke, restarting it")
+            self.shutdown()
+            return None
+
+        self._stats["pages"] += 1
+        self._stats["cpu_ms_total"] += cpu_ms
+        self._stats["cpu_ms_max"] = max(self._stats["cpu_ms_max"], cpu_ms)
+        self._stats["wall_ms_total"] += (time.perf_counter() - start) * 1000
+        self._stats["full_chars_total"] += full_chars
+        self._stats["text_chars_total"] += len(text)
+        if full_chars:
+            logger.debug(f"Extracted {len(text)}/{full_chars} chars from {url or 'page'} "
+                         f"({1 - len(text) / full_chars:.0%} reduction)")
+        return text, cpu_ms
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["cpu_ms_avg"] = stats["cpu_ms_total"] / stats["pages"] if stats["pages"] else 0.0
+        stats["reduction_ratio"] = (
+            round(1 - stats["text_chars_total"] / stats["full_chars_total"], 4) if stats["full_chars_total"] else 0.0
+        )
+        for key in ("cpu_ms_total", "cpu_ms_max", "cpu_ms_avg", "wall_ms_total"):
+            stats[key] = round(stats[key], 2)
+        stats["mode"] = self.mode
+        stats["workers"] = self.max_workers
+        stats["parser"] = self.parser
+        stats["main_content"] = self.main_content
+        return stats
+
+
+html_extractor = HtmlExtractor(
+    mode=os.getenv("HTML_EXTRACT_MODE", "process"),
+    max_workers=int(os.getenv("HTML_EXTRACT_WORKERS", 0)) or None,
+    cpu_limit=float(os.getenv("HTML_EXTRACT_CPU_LIMIT_SECONDS", 2)),
+    timeout=float(os.getenv("HTML_EXTRACT_TIMEOUT_SECONDS", 5)),
+    parser=os.getenv("HTML_PARSER") or None,
+    main_content=os.getenv("HTML_MAIN_CONTENT", "true").lower() != "false",
+)
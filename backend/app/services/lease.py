@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from azure.cosmos.aio import ContainerProxy
+
+logger = logging.getLogger(__name__)
+
+
+class Lease:
+    """
+    A named lease held by one worker at a time, stored as a document in a Cosmos DB
+    container, for work that all workers could do but only one should.
+
+    The holder renews it every duration / 3 seconds; when it stops renewing, another
+    worker takes it over once it has expired. acquired_at is when the current holder
+    took it over, so others can tell whatever it maintains may have missed changes
+    before then. Expiry uses the workers' clocks, so the holder gives it up a third
+    of the duration early to allow for skew.
+    """
+
+    def __init__(self, name: str, container: Callable[[], "ContainerProxy"], partition_key_path: str,
+                 duration: float = 30.0):
+        self.name = name
+        self.container = container
+        self.partition_key_path = partition_key_path
+        self.duration = duration
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.acquired_at = 0.0
+        self._held_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "acquisitions": 0,
+            "renewals": 0,
+            "errors": 0,
+        }
+
+    @property
+    def held(self) -> bool:
+        return time.time() < self._held_until
+
+    def _document(self, now: float, acquired_at: float) -> Dict[str, Any]:
+        return {
+            "id": self.name,
+            self.partition_key_path: self.name,
+            "owner": self.owner,
+            "acquiredAt": acquired_at,
+            "expiresAt": now + self.duration,
+        }
+
+    async def _claim(self):
+        from azure.core import MatchConditions
+        from azure.cosmos.exceptions import (
+            CosmosAccessConditionFailedError,
+            CosmosResourceExistsError,
+            CosmosResourceNotFoundError,
+        )
+
+        container = self.container()
+        now = time.time()
+        try:
+            lease = await container.read_item(item=self.name, partition_key=self.name)
+        except CosmosResourceNotFoundError:
+            try:
+                await container.create_item(body=self._document(now, now))
+            except CosmosResourceExistsError:
+                return  # Another worker created it first
+            self._acquired(now, now)
+            return
+
+        if lease.get("owner") != self.owner and lease.get("expiresAt", 0) > now:
+            self.acquired_at = lease.get("acquiredAt", 0.0)
+            self._held_until = 0.0
+            return
+
+        renewing = lease.get("owner") == self.owner
+        acquired_at = lease.get("acquiredAt", now) if renewing else now
+        try:
+            await container.replace_item(
+                item=self.name,
+                body=self._document(now, acquired_at),
+                etag=lease["_etag"],
+                match_condition=MatchConditions.IfNotModified
+            )
+        except CosmosAccessConditionFailedError:
+            self._held_until = 0.0
+            return
+        if renewing:
+            self._stats["renewals"] += 1
+            self._held_until = now + self.duration * 2 / 3
+        else:
+            self._acquired(now, acquired_at)
+
+    def _acquired(self, now: float, acquired_at: float):
+        logger.info(f"Took the {self.name} lease as {self.owner}")
+        self._stats["acquisitions"] += 1
+        self.acquired_at = acquired_at
+        self._held_until = now + self.duration * 2 / 3
+
+    async def _run(self):
+        while True:
+            try:
+                await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.error(f"Error claiming the {self.name} lease: {str(e)}")
+            await asyncio.sleep(self.duration / 3)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.held:
+            # Let another worker take over without waiting for the lease to expire
+            from azure.core import MatchConditions
+            try:
+                lease = await self.container().read_item(item=self.name, partition_key=self.name)
+                if lease.get("owner") == self.owner:
+                    lease["expiresAt"] = 0
+                    await self.container().replace_item(
+                        item=self.name, body=lease, etag=lease["_etag"],
+                        match_condition=MatchConditions.IfNotModified
+                    )
+            except Exception as e:
+                logger.warning(f"Could not release the {self.name} lease: {str(e)}")
+        self._held_until = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["held"] = self.held
+        stats["acquired_at"] = self.acquired_at
+        return stats
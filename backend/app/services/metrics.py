@@ -0,0 +1,221 @@
+import contextvars
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds, from a cached lookup to a slow completion
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+
+_request_started: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_started", default=None)
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count of observations per label set.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            # Per-bucket counts, then sum and count; made cumulative when rendered
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[Dict[str, str]]:
+        """
+        Observe the duration of the block in seconds. The block may change the labels
+        through the yielded dict; an "outcome" label, when declared, is set to "ok" or
+        the name of the exception that left the block.
+        """
+        labels = dict(labels)
+        started = time.perf_counter()
+        try:
+            yield labels
+        except BaseException as e:
+            if "outcome" in self.labelnames:
+                labels["outcome"] = type(e).__name__
+            raise
+        else:
+            if "outcome" in self.labelnames:
+                labels.setdefault("outcome", "ok")
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            bucket_labels = self.labelnames + ("le",)
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, key + (_format_value(float(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, key + ('+Inf',))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {values[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms recorded in process, plus the stats the services already
+    keep, rendered together in the Prometheus text exposition format.
+
+    Stats sources are read when the metrics are scraped: every numeric value of their
+    stats dict becomes a sample named <namespace>_<source>_<key>. Sources that report
+    one dict per backend, feed or operation name that level with a label instead.
+    """
+
+    def __init__(self, namespace: str = "panta"):
+        self.namespace = namespace
+        self._metrics: Dict[str, Any] = {}
+        self._stats: Dict[str, Tuple[Callable[[], Dict[str, Any]], Optional[str]]] = {}
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.namespace}_{name}", documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        # Modules may be imported more than once (reloads, benchmarks), keep the first
+        return self._metrics.setdefault(metric.name, metric)
+
+    def register_stats(self, source: str, stats: Callable[[], Dict[str, Any]], label: Optional[str] = None):
+        """
+        Export the numeric values of a stats() dict. With label, the dict maps names
+        (backends, feeds, ...) to their stats and the names become values of that label.
+        """
+        self._stats[source] = (stats, label)
+
+    def _render_stats(self, source: str, stats: Callable[[], Dict[str, Any]], label: Optional[str]) -> List[str]:
+        try:
+            report = stats()
+        except Exception:
+            return []
+        samples: Dict[str, List[Tuple[str, float]]] = {}
+        for name, values in (report.items() if label else [(None, report)]):
+            if not isinstance(values, dict):
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = _NAME_RE.sub("_", f"{self.namespace}_{source}_{key}")
+                labels = _format_labels((label,), (name,)) if label else ""
+                samples.setdefault(metric, []).append((labels, value))
+        lines = []
+        for metric, values in sorted(samples.items()):
+            lines.append(f"# TYPE {metric} untyped")
+            lines.extend(f"{metric}{labels} {_format_value(value)}" for labels, value in values)
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for source, (stats, label) in self._stats.items():
+            lines.extend(self._render_stats(source, stats, label))
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time to serve API requests, by route and status",
+    ["method", "route", "status"]
+)
+STAGE_SECONDS = metrics.histogram(
+    "stage_duration_seconds", "Time spent in each stage of serving a request",
+    ["stage", "outcome"]
+)
+
+
+def timed(stage: str):
+    """
+    Time a stage of request processing: with timed("llm_first"): ...
+    """
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def record_request_parse():
+    """
+    Record the time from the request arriving to the endpoint running, which is
+    receiving and validating the body. Call first thing in the endpoint.
+    """
+    started = _request_started.get()
+    if started is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="request_parse", outcome="ok")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the latency of every HTTP request by route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        token = _request_started.set(started)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_started.reset(token)
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=getattr(route, "path", "unmatched"), status=str(status)
+            )
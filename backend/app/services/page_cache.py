@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Optional, Any
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only carry tracking information and never change the page
+TRACKING_PARAMS = {"gclid", "fbclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a URL so that trivially different links to the same page share a cache entry.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ]
+    query.sort()
+
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+@dataclass
+class PageCacheEntry:
+    url: str
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = 0.0
+    body_bytes: int = 0
+    parse_ms: float = 0.0
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    Two-tier cache of extracted page text keyed by canonical URL.
+
+    The memory tier is a bounded LRU. The disk tier is optional and stores one JSON
+    file per page so cached text survives restarts and is shared between workers.
+    Stale entries are kept so they can be revalidated with a conditional GET, and
+    served when revalidating them fails.
+
+    The files on disk are tracked in memory in the order they were written, so the
+    disk tier is bounded without listing the directory on every write. The directory
+    is rescanned every disk_scan_interval seconds to pick up files other workers wrote.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 900.0,
+                 disk_dir: Optional[str] = None, max_disk_entries: int = 5000,
+                 disk_scan_interval: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_entries = max_disk_entries
+        self.disk_scan_interval = disk_scan_interval
+        self._entries: "OrderedDict[str, PageCacheEntry]" = OrderedDict()
+        # File names of the disk tier, oldest write first
+        self._disk_files: "OrderedDict[str, None]" = OrderedDict()
+        self._disk_scanned_at: Optional[float] = None
+        self._disk_lock = threading.Lock()
+        self._stats = {
+            "lookups": 0,
+            "hits": 0,
+            "disk_loads": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "stores": 0,
+            "evictions": 0,
+            "bytes_saved": 0,
+            "parse_ms_saved": 0.0,
+        }
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def _read_disk(self, key: str) -> Optional[PageCacheEntry]:
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                return PageCacheEntry(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable page cache file for {key}: {str(e)}")
+            return None
+
+    def _scan_disk(self):
+        files = []
+        for path in self.disk_dir.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path.name))
+            except FileNotFoundError:
+                pass  # Evicted by another worker meanwhile
+        files.sort()
+        self._disk_files = OrderedDict((name, None) for _, name in files)
+        self._disk_scanned_at = time.time()
+
+    def _write_disk(self, key: str, entry: PageCacheEntry):
+        path = self._disk_path(key)
+        # A temporary file of its own per write, so concurrent writers of a page never
+        # interleave, and readers only ever see complete files
+        tmp = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.disk_dir, suffix=".tmp", delete=False)
+        try:
+            with tmp:
+                json.dump(asdict(entry), tmp)
+            os.replace(tmp.name, path)
+        except BaseException:
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+
+        # Keep the disk tier bounded by dropping the least recently written pages
+        with self._disk_lock:
+            if self._disk_scanned_at is None or time.time() - self._disk_scanned_at >= self.disk_scan_interval:
+                self._scan_disk()
+            self._disk_files[path.name] = None
+            self._disk_files.move_to_end(path.name)
+            evicted = []
+            while len(self._disk_files) > self.max_disk_entries:
+                evicted.append(self._disk_files.popitem(last=False)[0])
+        for name in evicted:
+            (self.disk_dir / name).unlink(missing_ok=True)
+
+    def _remember(self, key: str, entry: PageCacheEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[PageCacheEntry]:
+        """
+        Return the cached entry for a canonical URL, fresh or stale, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        if self.disk_dir:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None:
+                self._remember(key, entry)
+                self._stats["disk_loads"] += 1
+                return entry
+
+        return None
+
+    async def put(self, key: str, entry: PageCacheEntry):
+        self._stats["stores"] += 1
+        await self._store(key, entry)
+
+    async def _store(self, key: str, entry: PageCacheEntry):
+        entry.fetched_at = time.time()
+        self._remember(key, entry)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, entry)
+            except Exception as e:
+                logger.warning(f"Failed to write page cache file for {key}: {str(e)}")
+
+    def record_hit(self, entry: PageCacheEntry):
+        self._stats["lookups"] += 1
+        self._stats["hits"] += 1
+        self._stats["bytes_saved"] += entry.body_bytes
+        self._stats["parse_ms_saved"] += entry.parse_ms
+
+    async def record_revalidated(self, key: str, entry: PageCacheEntry):
+        """
+        Mark an entry as confirmed unchanged by a 304 response and restart its TTL.
+        """
+        self._stats["lookups"] += 1
+        self._stats["revalidated"] += 1
+        self._stats["bytes_saved"] += entry.body_bytes
+        self._stats["parse_ms_saved"] += entry.parse_ms
+        await self._store(key, entry)
+
+    def record_stale(self, entry: PageCacheEntry):
+        """
+        Mark a stale entry as served because revalidating it failed.
+        """
+        self._stats["lookups"] += 1
+        self._stats["stale_served"] += 1
+        self._stats["bytes_saved"] += entry.body_bytes
+        self._stats["parse_ms_saved"] += entry.parse_ms
+
+    def record_miss(self):
+        self._stats["lookups"] += 1
+        self._stats["misses"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        served = stats["hits"] + stats["revalidated"] + stats["stale_served"]
+        stats["hit_rate"] = served / stats["lookups"] if stats["lookups"] else 0.0
+        stats["parse_ms_saved"] = round(stats["parse_ms_saved"], 2)
+        stats["entries"] = len(self._entries)
+        stats["disk_enabled"] = self.disk_dir is not None
+        return stats
+
+
+page_cache = PageCache(
+    max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", 256)),
+    ttl=float(os.getenv("PAGE_CACHE_TTL_SECONDS", 900)),
+    disk_dir=os.getenv("PAGE_CACHE_DIR") or None,
+    max_disk_entries=int(os.getenv("PAGE_CACHE_MAX_DISK_ENTRIES", 5000)),
+    disk_scan_interval=float(os.getenv("PAGE_CACHE_DISK_SCAN_SECONDS", 300)),
+)
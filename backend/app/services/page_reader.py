@@ -0,0 +1,182 @@
+import codecs
+import logging
+import os
+import re
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Content types that can be turned into text for analysis
+TEXT_CONTENT_TYPES = {"text/html", "application/xhtml+xml", "text/plain"}
+
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_\-:.]+)', re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]*>')
+WHITESPACE_RE = re.compile(r'\s+')
+# Elements whose content is never visible text
+RAW_TEXT_OPEN_RE = re.compile(r'<(script|style)\b[^>]*>', re.IGNORECASE)
+RAW_TEXT_CLOSE_RES = {name: re.compile(rf'</{name}\s*>', re.IGNORECASE) for name in ("script", "style")}
+
+# Longest unfinished tag held back for the next chunk before it is dropped
+MAX_PENDING_CHARS = 4096
+
+# How many leading bytes to inspect for a BOM or <meta charset> before decoding starts
+SNIFF_BYTES = 2048
+
+
+def sniff_charset(head: bytes) -> Optional[str]:
+    """
+    Detect the charset of an HTML document from its BOM or <meta> declaration.
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    match = META_CHARSET_RE.search(head)
+    if match:
+        return match.group(1).decode("ascii", errors="ignore")
+    return None
+
+
+def _incremental_decoder(charset: Optional[str]):
+    try:
+        return codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    except LookupError:
+        logger.debug(f"Unknown charset {charset!r}, falling back to utf-8")
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+class VisibleTextCounter:
+    """
+    Counts the visible text characters of HTML decoded chunk by chunk, leaving out tags
+    and the content of <script> and <style> elements, even when they span chunks.
+    """
+
+    def __init__(self):
+        self.chars = 0
+        self._pending = ""
+        self._raw_text_close: Optional[re.Pattern] = None
+
+    def feed(self, html: str) -> int:
+        text = self._pending + html
+        self._pending = ""
+        pos = 0
+        while pos < len(text):
+            if self._raw_text_close is not None:
+                match = self._raw_text_close.search(text, pos)
+                if match is None:
+                    # Keep enough to find a closing tag split between chunks
+                    self._pending = text[max(pos, len(text) - 16):]
+                    break
+                self._raw_text_close = None
+                pos = match.end()
+                continue
+
+            match = RAW_TEXT_OPEN_RE.search(text, pos)
+            segment = text[pos:match.start() if match else len(text)]
+            if match is None:
+                # A tag cut off by the end of the chunk is finished by the next one
+                cut = segment.rfind("<")
+                if cut != -1 and ">" not in segment[cut:]:
+                    if len(segment) - cut <= MAX_PENDING_CHARS:
+                        self._pending = segment[cut:]
+                    segment = segment[:cut]
+            self.chars += len(WHITESPACE_RE.sub(' ', TAG_RE.sub(' ', segment)).strip())
+            if match is None:
+                break
+            self._raw_text_close = RAW_TEXT_CLOSE_RES[match.group(1).lower()]
+            pos = match.end()
+        return self.chars
+
+
+class PageReader:
+    """
+    Streams a page body in chunks instead of loading it whole.
+
+    Non-text content types are rejected from the headers, the body is decoded
+    incrementally and the download stops at max_bytes or once roughly
+    text_budget characters of visible text (outside tags, scripts and styles) have
+    been collected.
+    """
+
+    def __init__(self, max_bytes: int = 2 * 1024 * 1024, text_budget: int = 100_000, chunk_size: int = 64 * 1024):
+        self.max_bytes = max_bytes
+        self.text_budget = text_budget
+        self.chunk_size = chunk_size
+        self._stats = {
+            "pages": 0,
+            "bytes_downloaded": 0,
+            "rejected_content_type": 0,
+            "truncated_bytes": 0,
+            "truncated_text": 0,
+        }
+
+    def accepts(self, response: "aiohttp.ClientResponse") -> bool:
+        # aiohttp reports application/octet-stream when the header is missing, so only trust an explicit header
+        if "Content-Type" not in response.headers:
+            return True
+        return response.content_type in TEXT_CONTENT_TYPES
+
+    async def read(self, response: "aiohttp.ClientResponse") -> Tuple[Optional[str], int]:
+        """
+        Read a response body, returning (html, bytes_read). html is None when the content type is rejected.
+        """
+        if not self.accepts(response):
+            self._stats["rejected_content_type"] += 1
+            logger.info(f"Skipping {response.url}: unsupported content type {response.content_type}")
+            return None, 0
+
+        decoder = None
+        head = b""
+        parts = []
+        bytes_read = 0
+        visible_text = VisibleTextCounter()
+
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            remaining = self.max_bytes - bytes_read
+            if len(chunk) > remaining:
+                chunk = chunk[:remaining]
+            bytes_read += len(chunk)
+
+            if decoder is None:
+                # Hold back decoding until there is enough of the document to sniff its charset
+                head += chunk
+                if len(head) < SNIFF_BYTES and bytes_read < self.max_bytes:
+                    continue
+                decoder = _incremental_decoder(response.charset or sniff_charset(head[:SNIFF_BYTES]))
+                chunk = head
+
+            decoded = decoder.decode(chunk)
+            parts.append(decoded)
+            text_chars = visible_text.feed(decoded)
+
+            if bytes_read >= self.max_bytes:
+                self._stats["truncated_bytes"] += 1
+                break
+            if text_chars >= self.text_budget:
+                self._stats["truncated_text"] += 1
+                break
+
+        if decoder is None:
+            decoder = _incremental_decoder(response.charset or sniff_charset(head))
+            parts.append(decoder.decode(head))
+        parts.append(decoder.decode(b"", final=True))
+
+        self._stats["pages"] += 1
+        self._stats["bytes_downloaded"] += bytes_read
+        return "".join(parts), bytes_read
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["max_bytes"] = self.max_bytes
+        stats["text_budget"] = self.text_budget
+        return stats
+
+
+page_reader = PageReader(
+    max_bytes=int(os.getenv("PAGE_MAX_BYTES", 2 * 1024 * 1024)),
+    text_budget=int(os.getenv("PAGE_TEXT_BUDGET_CHARS", 100_000)),
+    chunk_size=int(os.getenv("PAGE_CHUNK_BYTES", 64 * 1024)),
+)
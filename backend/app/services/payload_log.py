@@ -0,0 +1,26 @@
+import json
+import logging
+import os
+import random
+from typing import Any, Callable, Union
+
+SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.01))
+MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 2000))
+
+
+def log_payload(logger: logging.Logger, label: str, payload: Union[Any, Callable[[], Any]]):
+    """
+    Log a request, response or tool payload at DEBUG for a sample of calls.
+
+    Nothing is serialized unless DEBUG is enabled for the logger and the call is
+    sampled (LOG_PAYLOAD_SAMPLE_RATE, 1% by default); pass a callable to also defer
+    building the payload. The JSON is cut to LOG_PAYLOAD_MAX_CHARS.
+    """
+    if not logger.isEnabledFor(logging.DEBUG) or random.random() >= SAMPLE_RATE:
+        return
+    if callable(payload):
+        payload = payload()
+    text = json.dumps(payload, default=str)
+    if len(text) > MAX_CHARS:
+        text = f"{text[:MAX_CHARS]}... ({len(text)} chars)"
+    logger.debug("%s: %s", label, text)
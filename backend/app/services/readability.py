@@ -0,0 +1,153 @@
+import re
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup, Tag
+
+# Class/id hints, in the spirit of Mozilla Readability
+POSITIVE_RE = re.compile(r'article|body|content|entry|main|page|post|story|text|blog', re.IGNORECASE)
+# Matched against whole words of class names and ids ("entry-meta" but not "metadata")
+NEGATIVE_RE = re.compile(
+    r'ads?|advert|advertisement|banner|breadcrumbs?|combx|comments?|commentlist|consent|cookies?|disqus|'
+    r'extra|foot|footer|gdpr|masthead|menu|meta|modal|newsletter|outbrain|pager|pagination|popup|promo|'
+    r'related|share|sharing|shopping|sidebar|social|sponsor|sponsored|subscribe|tags|taboola|tool|tools|'
+    r'toolbar|widgets?',
+    re.IGNORECASE
+)
+# Words of a class name or id: split on punctuation and camelCase
+HINT_WORD_RE = re.compile(r'[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Tags that never hold article text
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "iframe", "svg", "canvas",
+                    "nav", "footer", "header", "aside", "form", "button", "select"]
+# Tags whose own text is scored and credited to their ancestors
+PARAGRAPH_TAGS = ["p", "pre", "td", "blockquote", "li", "h2", "h3", "dd"]
+
+MIN_PARAGRAPH_CHARS = 25
+MIN_MAIN_CHARS = 250
+# Negatively hinted blocks with at least MIN_MAIN_CHARS of text this dense are kept
+MIN_KEPT_TEXT_DENSITY = 40
+MAX_KEPT_LINK_DENSITY = 0.5
+
+
+def _clean(text: str) -> str:
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _negative_hint(hint: str) -> bool:
+    return any(NEGATIVE_RE.fullmatch(word) for word in HINT_WORD_RE.findall(hint))
+
+
+def _class_weight(tag: Tag) -> int:
+    weight = 0
+    for hint in (" ".join(tag.get("class") or []), tag.get("id") or ""):
+        if not hint:
+            continue
+        if _negative_hint(hint):
+            weight -= 25
+        if POSITIVE_RE.search(hint):
+            weight += 25
+    return weight
+
+
+def _initial_score(tag: Tag) -> float:
+    base = {
+        "article": 10, "main": 10, "section": 5, "div": 5,
+        "pre": 3, "td": 3, "blockquote": 3,
+        "address": -3, "ol": -3, "ul": -3, "dl": -3, "dd": -3, "dt": -3, "li": -3,
+        "h1": -5, "h2": -5, "h3": -5, "h4": -5, "h5": -5, "h6": -5, "th": -5,
+    }.get(tag.name, 0)
+    return base + _class_weight(tag)
+
+
+def _link_density(tag: Tag, text_length: int) -> float:
+    if not text_length:
+        return 1.0
+    link_length = sum(len(_clean(a.get_text())) for a in tag.find_all("a"))
+    return min(1.0, link_length / text_length)
+
+
+def _text_density(tag: Tag, text_length: int) -> float:
+    # Characters of text per descendant element, menus and widgets have many tags and little text
+    return text_length / (len(tag.find_all(True)) + 1)
+
+
+def _remove_unlikely_candidates(soup: BeautifulSoup):
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(True):
+        if tag.decomposed or tag.name in ("html", "body", "article", "main"):
+            continue
+        hint = f"{' '.join(tag.get('class') or [])} {tag.get('id') or ''}"
+        if not hint.strip() or not _negative_hint(hint) or POSITIVE_RE.search(hint):
+            continue
+        # Wrappers with a boilerplate-sounding class can still hold the article: keep
+        # blocks with enough dense, link-poor text to be the main content
+        text_length = len(_clean(tag.get_text(" ")))
+        if (text_length >= MIN_MAIN_CHARS
+                and _text_density(tag, text_length) >= MIN_KEPT_TEXT_DENSITY
+                and _link_density(tag, text_length) <= MAX_KEPT_LINK_DENSITY):
+            continue
+        tag.decompose()
+
+
+def extract_main_content(soup: BeautifulSoup) -> Optional[str]:
+    """
+    Find the main content block of a page and return its text, or None if no block stands out.
+
+    Paragraph-like blocks are scored by length and comma count and credit their parent
+    and grandparent. Candidates are weighted by tag, class/id hints and link density, and
+    siblings of the best candidate with a comparable score or dense, link-poor text are kept.
+    The soup is modified in place.
+    """
+    _remove_unlikely_candidates(soup)
+
+    scores: Dict[int, float] = {}
+    candidates: Dict[int, Tag] = {}
+    for paragraph in soup.find_all(PARAGRAPH_TAGS):
+        text = _clean(paragraph.get_text(" "))
+        if len(text) < MIN_PARAGRAPH_CHARS:
+            continue
+        content_score = 1 + text.count(",") + min(len(text) // 100, 3)
+
+        for level, ancestor in enumerate((paragraph.parent, getattr(paragraph.parent, "parent", None))):
+            if not isinstance(ancestor, Tag) or ancestor.name in ("[document]", "html"):
+                continue
+            key = id(ancestor)
+            if key not in candidates:
+                candidates[key] = ancestor
+                scores[key] = _initial_score(ancestor)
+            scores[key] += content_score if level == 0 else content_score / 2
+
+    if not candidates:
+        return None
+
+    final_scores = {}
+    for key, candidate in candidates.items():
+        text_length = len(_clean(candidate.get_text(" ")))
+        final_scores[key] = scores[key] * (1 - _link_density(candidate, text_length))
+
+    top_key = max(final_scores, key=final_scores.get)
+    top = candidates[top_key]
+    threshold = max(10.0, final_scores[top_key] * 0.2)
+
+    blocks: List[str] = []
+    siblings = top.parent.find_all(recursive=False) if isinstance(top.parent, Tag) else [top]
+    for sibling in siblings:
+        if sibling is top:
+            keep = True
+        elif id(sibling) in final_scores and final_scores[id(sibling)] >= threshold:
+            keep = True
+        else:
+            text = _clean(sibling.get_text(" "))
+            keep = (
+                sibling.name == "p"
+                and len(text) > 80
+                and _link_density(sibling, len(text)) < 0.25
+                and _text_density(sibling, len(text)) > 40
+            )
+        if keep:
+            blocks.append(_clean(sibling.get_text(" ")))
+
+    main_text = " ".join(block for block in blocks if block)
+    return main_text if len(main_text) >= MIN_MAIN_CHARS else None
@@ -0,0 +1,194 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r'\w+')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Which ASCII characters TOKEN_RE counts as word characters, by code point
+ASCII_WORD = np.array([TOKEN_RE.match(chr(code)) is not None for code in range(128)])
+# Joins the sentences of a search into one text, never a word character
+SEPARATOR = "\x00"
+
+# Standard BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def query_terms(query: str) -> List[str]:
+    """
+    Tokenize a query into its unique lowercase terms, keeping their order.
+    """
+    return list(dict.fromkeys(TOKEN_RE.findall(query.lower())))
+
+
+def _bm25(tf: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    Score every row of a (documents x terms) frequency matrix against all the terms.
+
+    Returns the raw scores and the best achievable score, so callers can normalize to [0, 1].
+    """
+    n_docs = tf.shape[0]
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avgdl = max(float(lengths.mean()), 1.0)
+    norm = K1 * (1 - B + B * lengths / avgdl)
+    scores = (idf * tf * (K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+    return scores, float((idf * (K1 + 1)).sum())
+
+
+def _word_chars(codes: np.ndarray) -> np.ndarray:
+    """
+    Mask of the code points TOKEN_RE counts as word characters. Non-ASCII characters
+    are looked up once per distinct character.
+    """
+    ascii_chars = codes < 128
+    if ascii_chars.all():
+        return ASCII_WORD[codes]
+    mask = np.zeros(len(codes), dtype=bool)
+    mask[ascii_chars] = ASCII_WORD[codes[ascii_chars]]
+    others = np.flatnonzero(~ascii_chars)
+    unique, inverse = np.unique(codes[others], return_inverse=True)
+    mask[others] = np.array([TOKEN_RE.match(chr(code)) is not None for code in unique.tolist()])[inverse]
+    return mask
+
+
+def _term_frequencies(sentences: List[str], terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Query-term frequencies (sentences x terms) and token counts of the sentences,
+    counting the same tokens as TOKEN_RE.findall(sentence.lower()).
+
+    The sentences are joined and lowercased into one text and viewed as an array of
+    code points. Tokens are the runs of word characters, found with array operations,
+    and each term is matched against the tokens of its length at once, so no Python
+    code runs per token.
+    """
+    text = SEPARATOR.join(sentences).lower()
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    word = np.concatenate(([False], _word_chars(codes), [False]))
+    starts = np.flatnonzero(word[1:-1] & ~word[:-2])
+    token_lengths = np.flatnonzero(word[1:-1] & ~word[2:]) - starts + 1
+    separators = np.flatnonzero(codes == ord(SEPARATOR))
+
+    lengths = np.bincount(np.searchsorted(separators, starts), minlength=len(sentences))
+    tf = np.zeros((len(sentences), len(terms)))
+    for term_id, term in enumerate(terms):
+        candidates = starts[token_lengths == len(term)]
+        if not len(candidates):
+            continue
+        term_codes = np.frombuffer(term.encode("utf-32-le"), dtype=np.uint32)
+        matches = candidates[(codes[candidates[:, None] + np.arange(len(term))] == term_codes).all(axis=1)]
+        tf[:, term_id] = np.bincount(np.searchsorted(separators, matches), minlength=len(sentences))
+    return tf, lengths.astype(np.float64)
+
+
+class PageTerms(NamedTuple):
+    """
+    The sentences of a page and the query-term frequencies (sentences x terms) and
+    token counts of each of them: the part of the analysis that reads the text.
+    """
+    sentences: List[str]
+    tf: np.ndarray
+    lengths: np.ndarray
+
+
+def count_terms(contents: List[str], terms: List[str]) -> List[PageTerms]:
+    """
+    Split pages into sentences and count the query terms in every sentence, for all
+    pages in one pass.
+    """
+    page_sentences = []
+    for content in contents:
+        if content and SEPARATOR in content:
+            content = content.replace(SEPARATOR, " ")
+        page_sentences.append(SENTENCE_RE.split(content) if content else [])
+
+    all_sentences = [sentence for sentences in page_sentences for sentence in sentences]
+    if all_sentences and terms:
+        tf, lengths = _term_frequencies(all_sentences, terms)
+    else:
+        tf, lengths = np.zeros((len(all_sentences), len(terms))), np.zeros(len(all_sentences))
+
+    pages = []
+    offset = 0
+    for sentences in page_sentences:
+        end = offset + len(sentences)
+        pages.append(PageTerms(sentences, tf[offset:end], lengths[offset:end]))
+        offset = end
+    return pages
+
+
+def score_pages(pages: List[PageTerms], max_key_points: int = 5) -> List[Dict[str, Any]]:
+    """
+    Rank the sentences and score the relevance of pages whose terms are counted, as
+    one batch: IDF and the average lengths come from all the given pages.
+    """
+    page_ids = [page_id for page_id, page in enumerate(pages) for _ in page.sentences]
+    n_terms = pages[0].tf.shape[1] if pages else 0
+
+    analyses = []
+    if not page_ids or not n_terms:
+        sentence_scores = np.zeros(len(page_ids))
+        page_relevance = np.zeros(len(pages))
+    else:
+        tf = np.concatenate([page.tf for page in pages])
+        sentence_lengths = np.concatenate([page.lengths for page in pages])
+        sentence_pages = np.array(page_ids)
+        sentence_scores, _ = _bm25(tf, sentence_lengths)
+
+        page_tf = np.zeros((len(pages), n_terms))
+        np.add.at(page_tf, sentence_pages, tf)
+        page_lengths = np.bincount(sentence_pages, weights=sentence_lengths, minlength=len(pages))
+        page_scores, best = _bm25(page_tf, page_lengths)
+        page_relevance = np.clip(page_scores / best, 0.0, 1.0) if best > 0 else np.zeros(len(pages))
+
+    offset = 0
+    for page_id, page in enumerate(pages):
+        sentences = page.sentences
+        if not sentences:
+            analyses.append({
+                'summary': None,
+                'key_points': [],
+                'relevance_score': 0.0
+            })
+            continue
+
+        scores = sentence_scores[offset:offset + len(sentences)]
+        offset += len(sentences)
+
+        # Highest scoring sentences first, ties keep document order
+        ranked = np.argsort(-scores, kind='stable')
+        key_points = [sentences[i] for i in ranked[:max_key_points] if scores[i] > 0]
+
+        # Generate a summary (first few sentences or a portion of the content)
+        summary = ' '.join(sentences[:3])
+        if len(summary) > 500:
+            summary = summary[:500] + "..."
+
+        analyses.append({
+            'summary': summary,
+            'key_points': key_points,
+            'relevance_score': round(float(page_relevance[page_id]), 4)
+        })
+
+    return analyses
+
+
+def analyze_pages(contents: List[str], query: str, max_key_points: int = 5) -> List[Dict[str, Any]]:
+    """
+    Score and summarize all fetched pages of a search in one pass.
+
+    Each page is split into sentences once. Query-term frequencies for every sentence
+    of every page are counted with array operations into one matrix, so sentence
+    ranking (BM25 over all sentences of the search) and page relevance (BM25 over the
+    pages) are vectorized.
+
+    Scores are relative to the pages analyzed together: IDF and the average lengths
+    come from the whole batch, so the relevance_score and key points of a page depend
+    on the other pages of the search. Analyze all pages of a search in one call to get
+    comparable scores; a page analyzed on its own scores differently. Pages counted
+    separately with count_terms can be scored together later with score_pages, which
+    gives the same result.
+    """
+    return score_pages(count_terms(contents, query_terms(query)), max_key_points)
@@ -0,0 +1,166 @@
+import os
+from functools import lru_cache, wraps
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import metrics
+from .resources import ResourceRegistry
+from .tracing import tracer
+
+DB_OPERATION_SECONDS = metrics.histogram(
+    "db_operation_duration_seconds", "Time of repository operations, by backend, operation and outcome",
+    ["backend", "operation", "outcome"]
+)
+
+# Messages every backend appends in one atomic write (one Cosmos DB patch holds 10
+# operations, one of which sets updatedAt)
+MAX_ATOMIC_APPEND = 9
+
+# The storage operations of a repository, timed for every backend
+OPERATIONS = (
+    "create_session", "get_session", "list_sessions", "list_session_summaries", "append_messages",
+    "create_workflow", "list_workflows", "get_workflow", "find_workflow", "update_workflow", "delete_workflow",
+    "list_workflow_configs", "create_workflow_config",
+)
+
+
+class RepositoryError(Exception):
+    pass
+
+
+class NotFoundError(RepositoryError):
+    """The session or workflow does not exist."""
+
+
+class PreconditionFailedError(RepositoryError):
+    """The document changed since the ETag the write was conditional on."""
+
+
+class InvalidContinuationError(RepositoryError):
+    """The continuation token can't be used to resume the listing."""
+
+
+class Repository:
+    """
+    Storage of chat sessions, their messages, workflows and workflow configs.
+
+    Documents are plain dicts shaped like the API models. Every stored document carries
+    an _etag, and writes that take an etag only succeed while the document still has
+    it (PreconditionFailedError otherwise).
+    """
+
+    backend = "none"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in OPERATIONS:
+            if name in cls.__dict__:
+                setattr(cls, name, _timed_operation(name, cls.__dict__[name]))
+
+    def register_resources(self, registry: ResourceRegistry) -> str:
+        """
+        Register the clients and provisioning steps of this backend with the app's
+        resource registry and return the name of the resource that makes it usable.
+        """
+        raise NotImplementedError
+
+    def watch_configs(self, on_change: Callable[[Dict[str, Any]], None],
+                      on_reset: Callable[[], Awaitable[None]]):
+        """
+        Get told about workflow configs written by other processes, if the backend can tell.
+        """
+
+    # Sessions
+
+    async def create_session(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def get_session(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def list_sessions(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        The user's most recently updated sessions, with their messages.
+        """
+        raise NotImplementedError
+
+    async def list_session_summaries(self, user_id: str, limit: int,
+                                     continuation: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of the user's sessions without their messages, most recently updated
+        first, as {"items": [...], "continuation": token or None}.
+        """
+        raise NotImplementedError
+
+    async def append_messages(self, session_id: str, user_id: str, messages: List[Dict[str, Any]],
+                              etag: Optional[str] = None) -> Optional[str]:
+        """
+        Append messages to a session and return its new ETag.
+
+        Appends of up to MAX_ATOMIC_APPEND messages are all-or-nothing on every backend.
+        Longer lists may be applied in several steps (chained patches on Cosmos DB), so
+        a failure part way can leave the first messages appended.
+        """
+        raise NotImplementedError
+
+    # Workflows
+
+    async def create_workflow(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def list_workflows(self, user_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_workflow(self, workflow_id: str, user_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def find_workflow(self, workflow_id: str) -> Dict[str, Any]:
+        """
+        A workflow of any user by its id, for callers that don't know its owner.
+        """
+        raise NotImplementedError
+
+    async def update_workflow(self, workflow_id: str, user_id: str, changes: Dict[str, Any],
+                              etag: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Set the given fields and updated_at, and return the updated workflow.
+        """
+        raise NotImplementedError
+
+    async def delete_workflow(self, workflow_id: str, user_id: str):
+        raise NotImplementedError
+
+    # Workflow configs
+
+    async def list_workflow_configs(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def create_workflow_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+def _timed_operation(name: str, method):
+    @wraps(method)
+    async def timed(self, *args, **kwargs):
+        with tracer.span(f"db.{name}") as span, DB_OPERATION_SECONDS.time(backend=self.backend, operation=name):
+            span.set("db.system", self.backend)
+            return await method(self, *args, **kwargs)
+    return timed
+
+
+@lru_cache(maxsize=None)
+def get_repository() -> Repository:
+    """
+    The repository selected by PERSISTENCE_BACKEND: cosmos (default) or sqlite.
+    """
+    backend = os.getenv("PERSISTENCE_BACKEND", "cosmos").lower()
+    if backend == "cosmos":
+        from .cosmos_repository import CosmosRepository
+        return CosmosRepository()
+    if backend == "sqlite":
+        from .sqlite_repository import SqliteRepository
+        return SqliteRepository(
+            path=os.getenv("SQLITE_PATH", "panta-flows.db"),
+            batch_size=int(os.getenv("SQLITE_BATCH_SIZE", 64)),
+            batch_delay=float(os.getenv("SQLITE_BATCH_DELAY_MS", 0)) / 1000,
+        )
+    raise ValueError(f"Unknown PERSISTENCE_BACKEND: {backend}")
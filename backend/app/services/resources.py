@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Resource:
+    name: str
+    start: Optional[Callable[[], Awaitable[Any]]] = None
+    stop: Optional[Callable[[], Awaitable[Any]]] = None
+    timeout: float = 30.0
+    depends_on: Tuple[str, ...] = ()
+    # A required resource that fails to start stops the app from starting
+    required: bool = False
+    status: str = "pending"
+    error: Optional[str] = None
+    duration_ms: float = 0.0
+
+
+class ResourceRegistry:
+    """
+    Starts and stops the app's external clients and provisioning steps from the lifespan.
+
+    Resources start concurrently, each one as soon as the resources it depends on are
+    up, and each within its own timeout. A resource that fails or times out is
+    reported (and anything depending on it is skipped) but only stops the app from
+    starting when it is required, so the API comes up degraded instead of not at all.
+    Resources are stopped in reverse registration order.
+    """
+
+    def __init__(self, default_timeout: float = 30.0):
+        self.default_timeout = default_timeout
+        self.resources: Dict[str, Resource] = {}
+        self.startup_ms = 0.0
+
+    def register(self, name: str, start: Optional[Callable[[], Awaitable[Any]]] = None,
+                 stop: Optional[Callable[[], Awaitable[Any]]] = None, timeout: Optional[float] = None,
+                 depends_on: Tuple[str, ...] = (), required: bool = False):
+        for dependency in depends_on:
+            if dependency not in self.resources:
+                raise ValueError(f"Resource {name} depends on unknown resource {dependency}")
+        self.resources[name] = Resource(
+            name=name, start=start, stop=stop, timeout=timeout or self.default_timeout,
+            depends_on=tuple(depends_on), required=required
+        )
+
+    async def _start(self, resource: Resource, tasks: Dict[str, asyncio.Task]):
+        for dependency in resource.depends_on:
+            await tasks[dependency]
+            if self.resources[dependency].status != "ok":
+                resource.status = "skipped"
+                resource.error = f"{dependency} is unavailable"
+                logger.warning(f"Skipped starting {resource.name}: {resource.error}")
+                return
+
+        started = time.perf_counter()
+        try:
+            if resource.start is not None:
+                await asyncio.wait_for(resource.start(), timeout=resource.timeout)
+            resource.status = "ok"
+        except asyncio.TimeoutError:
+            resource.status = "timeout"
+            resource.error = f"Did not start within {resource.timeout:.0f}s"
+        except Exception as e:
+            resource.status = "failed"
+            resource.error = str(e)
+        resource.duration_ms = (time.perf_counter() - started) * 1000
+
+        if resource.status == "ok":
+            logger.info(f"Started {resource.name} in {resource.duration_ms:.0f}ms")
+        else:
+            logger.error(f"Failed to start {resource.name} after {resource.duration_ms:.0f}ms: {resource.error}")
+
+    async def start_all(self):
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        for resource in self.resources.values():
+            tasks[resource.name] = asyncio.create_task(self._start(resource, tasks))
+        await asyncio.gather(*tasks.values())
+        self.startup_ms = (time.perf_counter() - started) * 1000
+
+        failed = [resource.name for resource in self.resources.values() if resource.status != "ok"]
+        logger.info(f"Startup finished in {self.startup_ms:.0f}ms" + (f", unavailable: {', '.join(failed)}" if failed else ""))
+        missing = [resource.name for resource in self.resources.values() if resource.required and resource.status != "ok"]
+        if missing:
+            raise RuntimeError(f"Required resources failed to start: {', '.join(missing)}")
+
+    async def stop_all(self):
+        for resource in reversed(list(self.resources.values())):
+            if resource.stop is None or resource.status == "skipped":
+                continue
+            try:
+                await asyncio.wait_for(resource.stop(), timeout=resource.timeout)
+            except Exception as e:
+                logger.error(f"Error stopping {resource.name}: {str(e)}")
+
+    def healthy(self) -> bool:
+        return all(resource.status == "ok" for resource in self.resources.values())
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "status": "ok" if self.healthy() else "degraded",
+            "startup_ms": round(self.startup_ms, 1),
+            "resources": {
+                resource.name: {
+                    "status": resource.status,
+                    "duration_ms": round(resource.duration_ms, 1),
+                    "error": resource.error,
+                }
+                for resource in self.resources.values()
+            },
+        }
+
+
+resources = ResourceRegistry(default_timeout=float(os.getenv("STARTUP_TIMEOUT_SECONDS", 30)))
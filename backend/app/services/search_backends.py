@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SearchBackend = Callable[[str, int], Awaitable[List[dict]]]
+
+
+def ddgs_backend(name: str) -> SearchBackend:
+    """
+    Build a search backend that queries one of the DuckDuckGo endpoints (api, html or lite).
+    """
+    async def search(query: str, max_results: int) -> List[dict]:
+        from duckduckgo_search import AsyncDDGS
+        async with AsyncDDGS() as ddgs:
+            return [result async for result in ddgs.text(query, max_results=max_results, backend=name)]
+    return search
+
+
+class BackendStats:
+    """
+    Rolling latency window and error rate of a single search backend.
+    """
+
+    def __init__(self, window: int = 50, error_decay: float = 0.2):
+        self.latencies = deque(maxlen=window)
+        self.error_decay = error_decay
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+        self.hedges = 0
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        self.latencies.append(latency)
+        self.error_rate += self.error_decay * ((0.0 if ok else 1.0) - self.error_rate)
+        if not ok:
+            self.errors += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def expected_latency(self, default: float) -> float:
+        # Penalize unreliable backends, a failure costs at least another attempt elsewhere
+        p50 = self.percentile(0.5)
+        return (p50 if p50 is not None else default) * (1 + 4 * self.error_rate)
+
+
+class AdaptiveSearcher:
+    """
+    Searches the fastest healthy backend first and hedges to the next one when it is slow.
+
+    Backends are ranked by expected latency (median latency inflated by recent error
+    rate). If the first backend has not answered by its own p95 latency, the request
+    is also sent to the next backend and whichever answers first wins. A failing or
+    empty answer immediately moves on to the next backend, but an empty answer counts
+    as a healthy call: the query may just have no results. No backend is tried once
+    the deadline has passed.
+    """
+
+    def __init__(self, backends: Dict[str, SearchBackend], default_hedge_delay: float = 1.5,
+                 min_hedge_delay: float = 0.2, max_parallel: int = 2, min_samples: int = 5,
+                 timeout: float = 15.0):
+        self.backends = backends
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_parallel = max_parallel
+        self.min_samples = min_samples
+        self.timeout = timeout
+        self.stats_by_backend = {name: BackendStats() for name in backends}
+
+    def ranked(self) -> List[str]:
+        return sorted(
+            self.backends,
+            key=lambda name: self.stats_by_backend[name].expected_latency(self.default_hedge_delay)
+        )
+
+    def hedge_delay(self, name: str) -> float:
+        stats = self.stats_by_backend[name]
+        if len(stats.latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, stats.percentile(0.95))
+
+    async def search(self, query: str, max_results: int, deadline: Optional[float] = None) -> List[dict]:
+        """
+        Run a search across the backends and return the first non-empty answer, or an
+        empty list if the backends that answered found nothing.
+
+        deadline is a time.monotonic() value, by default timeout seconds from now.
+        """
+        remaining = self.ranked()
+        pending: Dict[asyncio.Task, tuple] = {}
+        last_error: Optional[Exception] = None
+        answered_empty = False
+        if deadline is None:
+            deadline = time.monotonic() + self.timeout
+
+        def launch(hedge: bool = False):
+            name = remaining.pop(0)
+            if hedge:
+                self.stats_by_backend[name].hedges += 1
+                logger.debug(f"Hedging search {query!r} to backend {name}")
+            task = asyncio.create_task(self.backends[name](query, max_results))
+            pending[task] = (name, time.monotonic())
+
+        if time.monotonic() >= deadline:
+            raise asyncio.TimeoutError("Search deadline passed before any backend was tried")
+        launch()
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise asyncio.TimeoutError(f"Search timed out after {self.timeout:.1f}s")
+                wait = deadline - now
+                hedge_at = None
+                if remaining and len(pending) < self.max_parallel:
+                    newest_name, newest_start = list(pending.values())[-1]
+                    # Only hedge if the hedge would start before the deadline
+                    if newest_start + self.hedge_delay(newest_name) < deadline:
+                        hedge_at = newest_start + self.hedge_delay(newest_name)
+                        wait = min(wait, hedge_at - now)
+
+                done, _ = await asyncio.wait(pending, timeout=max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge_at is not None and time.monotonic() < deadline:
+                        launch(hedge=True)
+                    continue
+
+                # Record every finished request before returning, also the ones that lost
+                winner = None
+                for task in done:
+                    name, started = pending.pop(task)
+                    latency = time.monotonic() - started
+                    error = task.exception()
+                    self.stats_by_backend[name].record(latency, error is None)
+                    if error is not None:
+                        last_error = error
+                        logger.warning(f"Search backend {name} failed: {str(error)}")
+                    elif not task.result():
+                        answered_empty = True
+                        logger.warning(f"Search backend {name} returned no results")
+                    elif winner is None:
+                        winner = name, task.result()
+                if winner is not None:
+                    name, results = winner
+                    self.stats_by_backend[name].wins += 1
+                    return results
+
+                if remaining and len(pending) < self.max_parallel and time.monotonic() < deadline:
+                    launch()
+        finally:
+            # Losing requests count as at least as slow as they got, so slow backends drift down the ranking
+            for task, (name, started) in pending.items():
+                task.cancel()
+                self.stats_by_backend[name].calls += 1
+                self.stats_by_backend[name].latencies.append(time.monotonic() - started)
+
+        if answered_empty:
+            return []
+        if last_error is not None:
+            raise last_error
+        raise asyncio.TimeoutError(f"Search timed out after {self.timeout:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "error_rate": round(stats.error_rate, 4),
+                "p50_ms": round(stats.percentile(0.5) * 1000, 1) if stats.latencies else None,
+                "p95_ms": round(stats.percentile(0.95) * 1000, 1) if stats.latencies else None,
+                "wins": stats.wins,
+                "hedges": stats.hedges,
+            }
+            for name, stats in self.stats_by_backend.items()
+        }
+
+
+search_backend = AdaptiveSearcher(
+    backends={name: ddgs_backend(name) for name in os.getenv("SEARCH_BACKENDS", "lite,html,api").split(",")},
+    default_hedge_delay=float(os.getenv("SEARCH_HEDGE_DELAY_SECONDS", 1.5)),
+    timeout=float(os.getenv("SEARCH_TIMEOUT_SECONDS", 15)),
+)
@@ -0,0 +1,142 @@
+import asyncio
+import copy
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SearchKey = Tuple[str, int, bool]
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r'\s+', ' ', query).strip().casefold()
+
+
+class SearchResultCache:
+    """
+    Cache of search results with a short TTL and stale-while-revalidate.
+
+    Fresh entries are served directly. Stale entries are served immediately while a
+    single background task refreshes them. Concurrent misses for the same key share
+    one upstream search, which runs in a task of its own so that a caller giving up
+    doesn't cancel it for the others.
+    """
+
+    def __init__(self, ttl: float = 120.0, stale_ttl: float = 900.0, max_entries: int = 512):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[SearchKey, Tuple[float, List[dict]]]" = OrderedDict()
+        self._inflight: Dict[SearchKey, asyncio.Task] = {}
+        self._refreshes: Dict[SearchKey, asyncio.Task] = {}
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+
+    @staticmethod
+    def make_key(query: str, max_results: int, fetch_content: bool) -> SearchKey:
+        return (normalize_query(query), max_results, fetch_content)
+
+    def _store(self, key: SearchKey, results: List[dict]):
+        # Empty answers are usually transient upstream trouble, so they are not cached
+        if not results:
+            return
+        self._entries[key] = (time.monotonic(), results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _refresh(self, key: SearchKey, fetch: Callable[[], Awaitable[List[dict]]]):
+        try:
+            self._store(key, await fetch())
+            self._stats["refreshes"] += 1
+        except Exception as e:
+            self._stats["refresh_errors"] += 1
+            logger.warning(f"Background refresh failed for search {key[0]!r}: {str(e)}")
+        finally:
+            self._refreshes.pop(key, None)
+
+    def _start_refresh(self, key: SearchKey, fetch: Callable[[], Awaitable[List[dict]]]):
+        if key not in self._refreshes:
+            self._refreshes[key] = asyncio.create_task(self._refresh(key, fetch))
+
+    async def _fetch(self, key: SearchKey, fetch: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        try:
+            results = await fetch()
+            self._store(key, results)
+            return results
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_fetch(self, key: SearchKey, fetch: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        """
+        Return cached results for a key, calling fetch only on a miss or in the background when stale.
+        """
+        results = self.peek(key, refresh=fetch)
+        if results is not None:
+            return results
+        return await self.fetch(key, fetch)
+
+    def peek(self, key: SearchKey,
+             refresh: Optional[Callable[[], Awaitable[List[dict]]]] = None) -> Optional[List[dict]]:
+        """
+        Return a copy of cached results (fresh or within the stale window) without waiting
+        for a fetch. Stale results are refreshed in the background with refresh, if given.
+        Returns None, counted as a miss, when the results have to be fetched.
+        """
+        entry = self._entries.get(key)
+        age = time.monotonic() - entry[0] if entry is not None else None
+        if age is None or age >= self.ttl + self.stale_ttl:
+            # Joining a search that is already running is counted apart from misses
+            self._stats["coalesced" if key in self._inflight else "misses"] += 1
+            return None
+        if age < self.ttl:
+            self._stats["hits"] += 1
+            self._entries.move_to_end(key)
+        else:
+            self._stats["stale_hits"] += 1
+            if refresh is not None:
+                self._start_refresh(key, refresh)
+        return copy.deepcopy(entry[1])
+
+    def fetch(self, key: SearchKey, fetch: Callable[[], Awaitable[List[dict]]]) -> Awaitable[List[dict]]:
+        """
+        Fetch and store the results of a key peek missed. Concurrent callers share one
+        fetch: only the first caller's fetch runs, the others wait for its results.
+
+        The fetch is started when this is called, not when the result is awaited, so
+        callers peeking from then on count as joining it.
+        """
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = self._inflight[key] = asyncio.create_task(self._fetch(key, fetch))
+            # Retrieve the exception even when every caller was cancelled before it failed
+            inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._results_of(inflight)
+
+    @staticmethod
+    async def _results_of(inflight: asyncio.Task) -> List[dict]:
+        return copy.deepcopy(await asyncio.shield(inflight))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        stats["entries"] = len(self._entries)
+        return stats
+
+
+search_cache = SearchResultCache(
+    ttl=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", 120)),
+    stale_ttl=float(os.getenv("SEARCH_CACHE_STALE_SECONDS", 900)),
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 512)),
+)
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cosmos_db import cosmos_db
+
+logger = logging.getLogger(__name__)
+
+
+def request_charge(headers: Dict[str, str]) -> float:
+    """
+    Read the request units charged for a Cosmos DB call from its response headers.
+    """
+    for key, value in headers.items():
+        if key.lower() == "x-ms-request-charge":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 0.0
+
+
+@dataclass
+class CachedSession:
+    doc: Dict[str, Any]
+    size: int
+    read_charge: float = 0.0
+
+
+class SessionCache:
+    """
+    In-process cache of chat session documents keyed by (session_id, user_id).
+
+    Every read is revalidated with If-None-Match on the cached _etag, so an unchanged
+    session costs a 304 without a body instead of a full document read, and changes
+    made by other workers are always picked up. Appends made through this process are
+    applied to the cached copy directly. The cache is an LRU bounded by the total
+    serialized size of the documents. Cached documents are shared, callers must not
+    modify them.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_doc_bytes: int = 2 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_doc_bytes = max_doc_bytes
+        self._entries: "OrderedDict[Tuple[str, str], CachedSession]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {
+            "lookups": 0,
+            "hits": 0,
+            "refreshed": 0,
+            "misses": 0,
+            "local_updates": 0,
+            "invalidations": 0,
+            "evictions": 0,
+            "bytes_saved": 0,
+            "ru_charged": 0.0,
+            "ru_saved": 0.0,
+        }
+
+    def _remember(self, key: Tuple[str, str], doc: Dict[str, Any], read_charge: float):
+        self._forget(key)
+        size = len(json.dumps(doc, default=str))
+        if size > self.max_doc_bytes:
+            return
+        self._entries[key] = CachedSession(doc=doc, size=size, read_charge=read_charge)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._stats["evictions"] += 1
+
+    def _forget(self, key: Tuple[str, str]) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.size
+        return True
+
+    def etag(self, session_id: str, user_id: str) -> Optional[str]:
+        entry = self._entries.get((session_id, user_id))
+        return entry.doc.get("_etag") if entry else None
+
+    async def read(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        """
+        Return the current session document, revalidating the cached copy if there is one.
+
+        Raises CosmosResourceNotFoundError if the session does not exist.
+        """
+        from azure.core import MatchConditions
+        from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+        key = (session_id, user_id)
+        entry = self._entries.get(key)
+        response_headers = {}
+        conditions = (
+            {"etag": entry.doc["_etag"], "match_condition": MatchConditions.IfModified}
+            if entry and entry.doc.get("_etag") else {}
+        )
+        self._stats["lookups"] += 1
+        try:
+            doc = await cosmos_db.chat_container.read_item(
+                item=session_id,
+                partition_key=user_id,
+                response_hook=lambda headers, _: response_headers.update(headers),
+                **conditions
+            )
+        except CosmosResourceNotFoundError:
+            self.invalidate(session_id, user_id)
+            raise
+
+        charge = request_charge(response_headers)
+        self._stats["ru_charged"] += charge
+        if doc is None and conditions:
+            # 304, the cached copy is current
+            self._stats["hits"] += 1
+            self._stats["bytes_saved"] += entry.size
+            self._stats["ru_saved"] += max(0.0, entry.read_charge - charge)
+            self._entries.move_to_end(key)
+            return entry.doc
+
+        self._stats["refreshed" if conditions else "misses"] += 1
+        self._remember(key, doc, charge)
+        return doc
+
+    def put(self, doc: Dict[str, Any]):
+        """
+        Cache a session document returned by one of our own writes.
+        """
+        if doc.get("id") and doc.get("userId") and doc.get("_etag"):
+            self._remember((doc["id"], doc["userId"]), doc, 0.0)
+
+    def apply_append(self, session_id: str, user_id: str, previous_etag: Optional[str],
+                     messages: List[Dict[str, Any]], updated_at: str, etag: Optional[str]):
+        """
+        Apply messages appended by this process to the cached copy.
+
+        Only safe when the append was conditional on the cached version (previous_etag),
+        otherwise another writer may have changed the session and the copy is dropped.
+        """
+        key = (session_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        if not etag or not previous_etag or entry.doc.get("_etag") != previous_etag:
+            self.invalidate(session_id, user_id)
+            return
+
+        doc = dict(entry.doc)
+        doc["messages"] = list(entry.doc.get("messages") or []) + messages
+        doc["updatedAt"] = updated_at
+        doc["_etag"] = etag
+        self._remember(key, doc, entry.read_charge)
+        self._stats["local_updates"] += 1
+
+    def invalidate(self, session_id: str, user_id: str):
+        if self._forget((session_id, user_id)):
+            self._stats["invalidations"] += 1
+
+    def clear(self):
+        self._stats["invalidations"] += len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["ru_charged"] = round(stats["ru_charged"], 2)
+        stats["ru_saved"] = round(stats["ru_saved"], 2)
+        stats["entries"] = len(self._entries)
+        stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+session_cache = SessionCache(
+    max_bytes=int(os.getenv("SESSION_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    max_doc_bytes=int(os.getenv("SESSION_CACHE_MAX_DOC_BYTES", 2 * 1024 * 1024)),
+)
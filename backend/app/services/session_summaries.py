@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .cosmos_db import cosmos_db
+from .lease import Lease
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ("id", "workflowId", "workflowTitle", "createdAt", "updatedAt")
+
+
+def summarize(session: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Project a chat session document onto its sidebar summary.
+    """
+    summary = {key: session.get(key) for key in SUMMARY_FIELDS}
+    summary["messageCount"] = len(session.get("messages") or [])
+    return summary
+
+
+class SessionSummaryView:
+    """
+    Materialized per-user list of session summaries, one document per user.
+
+    A user's view is built from a projection query the first time it is read, then
+    kept up to date from the chat-history change feed, so listing a user's sessions is
+    a single point read. Every worker reads the feed, but only the holder of the
+    view lease merges the changes into the views, so a change costs one view update
+    rather than one per worker racing on the same document. Updates are conditional
+    on the view's ETag and only take a session's summary when its updatedAt is newer
+    than the one in the view. Users with more than max_sessions sessions are marked
+    truncated and listed with the query instead.
+
+    Views built before this worker's change feed lost its position, or before the
+    lease changed hands, are rebuilt on their next read, since they may have missed
+    changes.
+    """
+
+    def __init__(self, enabled: bool = True, max_sessions: int = 2000, max_retries: int = 5,
+                 lease_seconds: float = 30.0):
+        self.enabled = enabled
+        self.max_sessions = max_sessions
+        self.max_retries = max_retries
+        self.lease = Lease("lease:session-summaries", lambda: cosmos_db.summary_container, "userId",
+                           duration=lease_seconds)
+        self._stale_before = 0.0
+        self._stats = {
+            "reads": 0,
+            "builds": 0,
+            "rebuilds": 0,
+            "updates": 0,
+            "conflicts": 0,
+            "skipped": 0,
+        }
+
+    async def start(self):
+        if self.enabled:
+            await self.lease.start()
+
+    async def stop(self):
+        await self.lease.stop()
+
+    async def read(self, user_id: str) -> Optional[Dict[str, Any]]:
+        from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+        try:
+            view = await cosmos_db.summary_container.read_item(item=user_id, partition_key=user_id)
+        except CosmosResourceNotFoundError:
+            return None
+        self._stats["reads"] += 1
+        return view
+
+    async def build(self, user_id: str, replace: bool = False) -> Dict[str, Any]:
+        from azure.cosmos.exceptions import CosmosResourceExistsError
+
+        query = (
+            "SELECT c.id, c.workflowId, c.workflowTitle, c.createdAt, c.updatedAt, "
+            "ARRAY_LENGTH(c.messages) AS messageCount "
+            "FROM c WHERE c.userId = @userId ORDER BY c.updatedAt DESC"
+        )
+        sessions = [item async for item in cosmos_db.chat_container.query_items(
+            query=query,
+            parameters=[{"name": "@userId", "value": user_id}],
+            partition_key=user_id
+        )]
+        view = {
+            "id": user_id,
+            "userId": user_id,
+            "sessions": sessions[:self.max_sessions],
+            "truncated": len(sessions) > self.max_sessions,
+            "builtAt": time.time(),
+            "updatedAt": datetime.now().isoformat(),
+        }
+        if replace:
+            self._stats["rebuilds"] += 1
+            return await cosmos_db.summary_container.upsert_item(body=view)
+        try:
+            view = await cosmos_db.summary_container.create_item(body=view)
+            self._stats["builds"] += 1
+        except CosmosResourceExistsError:
+            # Another worker built it meanwhile
+            view = await self.read(user_id) or view
+        return view
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        view = await self.read(user_id)
+        if view is None:
+            return await self.build(user_id)
+        if view.get("builtAt", 0) < max(self._stale_before, self.lease.acquired_at):
+            return await self.build(user_id, replace=True)
+        return view
+
+    def invalidate_all(self):
+        """
+        Rebuild every view on its next read.
+        """
+        self._stale_before = time.time()
+
+    async def apply(self, sessions: List[Dict[str, Any]]):
+        """
+        Merge changed session documents into the views of their users, if this worker
+        holds the view lease.
+        """
+        if not self.enabled:
+            return
+        if not self.lease.held:
+            self._stats["skipped"] += len(sessions)
+            return
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        for session in sessions:
+            if session.get("userId") and session.get("id"):
+                by_user.setdefault(session["userId"], []).append(session)
+        await asyncio.gather(*(self._merge(user_id, changed) for user_id, changed in by_user.items()))
+
+    async def _merge(self, user_id: str, sessions: List[Dict[str, Any]]):
+        from azure.core import MatchConditions
+        from azure.cosmos.exceptions import CosmosAccessConditionFailedError
+
+        for _ in range(self.max_retries):
+            view = await self.read(user_id)
+            if view is None:
+                # Views are built on first read, the query will include these sessions
+                return
+
+            entries = {entry["id"]: entry for entry in view.get("sessions", [])}
+            changed = False
+            for session in sessions:
+                summary = summarize(session)
+                current = entries.get(summary["id"])
+                # updatedAt has microseconds, unlike _ts, and older changes never overwrite newer ones
+                if current is None or ((current.get("updatedAt") or "") <= (summary["updatedAt"] or "")
+                                       and current != summary):
+                    entries[summary["id"]] = summary
+                    changed = True
+            if not changed:
+                return
+
+            ordered = sorted(entries.values(), key=lambda entry: entry.get("updatedAt") or "", reverse=True)
+            view["sessions"] = ordered[:self.max_sessions]
+            view["truncated"] = view.get("truncated", False) or len(ordered) > self.max_sessions
+            view["updatedAt"] = datetime.now().isoformat()
+            try:
+                await cosmos_db.summary_container.replace_item(
+                    item=user_id,
+                    body=view,
+                    etag=view["_etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+                self._stats["updates"] += 1
+                return
+            except CosmosAccessConditionFailedError:
+                self._stats["conflicts"] += 1
+        logger.warning(f"Gave up updating the session summaries of {user_id} after {self.max_retries} conflicts")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["lease_held"] = self.lease.held
+        return stats
+
+
+session_summaries = SessionSummaryView(
+    enabled=os.getenv("SESSION_SUMMARY_VIEW", "true").lower() != "false",
+    max_sessions=int(os.getenv("SESSION_SUMMARY_MAX_SESSIONS", 2000)),
+    lease_seconds=float(os.getenv("SESSION_SUMMARY_LEASE_SECONDS", 30)),
+)
@@ -0,0 +1,436 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import metrics
+from .repository import (
+    InvalidContinuationError,
+    NotFoundError,
+    PreconditionFailedError,
+    Repository,
+    RepositoryError,
+)
+from .resources import ResourceRegistry
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    etag TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS sessions_by_user_updated ON sessions (user_id, updated_at DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (user_id, session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS workflows (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    updated_at TEXT,
+    etag TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS workflows_by_user_updated ON workflows (user_id, updated_at DESC);
+CREATE INDEX IF NOT EXISTS workflows_by_id ON workflows (id);
+CREATE TABLE IF NOT EXISTS workflow_configs (
+    id TEXT PRIMARY KEY,
+    created_at TEXT,
+    etag TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+"""
+
+Operation = Callable[..., Any]
+
+
+def new_etag() -> str:
+    return f'"{os.urandom(8).hex()}"'
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def _stored(document: Dict[str, Any], *excluded: str) -> str:
+    # System properties (_etag...) and columns kept separately are not part of the body
+    return dumps({key: value for key, value in document.items() if not key.startswith("_") and key not in excluded})
+
+
+class SqliteRepository(Repository):
+    """
+    Sessions and workflows in an embedded SQLite database, for small deployments and
+    for benchmarking without a Cosmos DB account.
+
+    The database runs in WAL mode, so reads never wait for writes. Reads run on a small
+    thread pool, each thread with its own connection. Writes go through a queue to a
+    single writer thread that commits whatever has queued up in one transaction (one
+    fsync per batch), each write in its own savepoint so a failing write doesn't take
+    the rest of the batch with it. Messages are rows of their own, so appending to a
+    session costs the same however long it gets.
+
+    Sessions are listed by their (user_id, updated_at) index. With several worker
+    processes on one database file, workflow configs created by one worker reach the
+    others on their next config refresh.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, batch_size: int = 64, batch_delay: float = 0.0, read_threads: int = 4):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._readers = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="sqlite-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._stats = {
+            "reads": 0,
+            "writes": 0,
+            "write_batches": 0,
+            "failed_writes": 0,
+        }
+
+    def register_resources(self, registry: ResourceRegistry) -> str:
+        registry.register("sqlite", start=self.start, stop=self.stop)
+        metrics.register_stats("sqlite", self.stats)
+        return "sqlite"
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a crash can only lose the last commits, never corrupt the database
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    async def start(self):
+        if self._writer_task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._writer, lambda: self._connection().executescript(SCHEMA))
+        self._queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._write_loop())
+        logger.info(f"SQLite database ready at {self.path}")
+
+    async def stop(self):
+        if self._writer_task is None:
+            return
+        # Let the queued writes finish first
+        await self._queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    async def _read(self, operation: Operation, *args) -> Any:
+        self._stats["reads"] += 1
+        return await asyncio.get_running_loop().run_in_executor(
+            self._readers, lambda: operation(self._connection(), *args)
+        )
+
+    async def _write(self, operation: Operation, *args) -> Any:
+        if self._queue is None:
+            raise RuntimeError("SQLite repository is not started")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, args, future))
+        return await future
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            if self.batch_delay:
+                await asyncio.sleep(self.batch_delay)
+            batch = [first]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            results = await loop.run_in_executor(self._writer, self._apply_batch, batch)
+            self._stats["write_batches"] += 1
+            self._stats["writes"] += len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if not ok:
+                    self._stats["failed_writes"] += 1
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply_batch(self, batch: List[Tuple[Operation, tuple, asyncio.Future]]) -> List[Tuple[bool, Any]]:
+        connection = self._connection()
+        results = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for operation, args, _ in batch:
+                connection.execute("SAVEPOINT write")
+                try:
+                    results.append((True, operation(connection, *args)))
+                    connection.execute("RELEASE write")
+                except Exception as e:
+                    connection.execute("ROLLBACK TO write")
+                    connection.execute("RELEASE write")
+                    results.append((False, e))
+            connection.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Error committing a batch of {len(batch)} SQLite writes: {str(e)}")
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            return [(False, e)] * len(batch)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["avg_batch_size"] = stats["writes"] / stats["write_batches"] if stats["write_batches"] else 0.0
+        return stats
+
+    # Sessions
+
+    @staticmethod
+    def _session(row: Tuple, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        body, updated_at, etag = row
+        session = json.loads(body)
+        session["updatedAt"] = updated_at
+        session["messages"] = messages
+        session["_etag"] = etag
+        return session
+
+    @staticmethod
+    def _messages(connection: sqlite3.Connection, user_id: str, session_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        messages: Dict[str, List[Dict[str, Any]]] = {session_id: [] for session_id in session_ids}
+        if not session_ids:
+            return messages
+        placeholders = ",".join("?" * len(session_ids))
+        rows = connection.execute(
+            f"SELECT session_id, body FROM messages WHERE user_id = ? AND session_id IN ({placeholders}) "
+            "ORDER BY session_id, seq",
+            (user_id, *session_ids)
+        )
+        for session_id, body in rows:
+            messages[session_id].append(json.loads(body))
+        return messages
+
+    async def create_session(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        def insert(connection: sqlite3.Connection) -> Dict[str, Any]:
+            messages = session.get("messages") or []
+            etag = new_etag()
+            try:
+                connection.execute(
+                    "INSERT INTO sessions (user_id, id, updated_at, message_count, etag, body) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session["userId"], session["id"], session["updatedAt"], len(messages), etag,
+                     _stored(session, "messages", "updatedAt"))
+                )
+            except sqlite3.IntegrityError:
+                raise RepositoryError(f"Session {session['id']} already exists")
+            connection.executemany(
+                "INSERT INTO messages (user_id, session_id, seq, body) VALUES (?, ?, ?, ?)",
+                [(session["userId"], session["id"], seq, dumps(message)) for seq, message in enumerate(messages)]
+            )
+            return dict(session, messages=list(messages), _etag=etag)
+        return await self._write(insert)
+
+    async def get_session(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        def select(connection: sqlite3.Connection) -> Dict[str, Any]:
+            row = connection.execute(
+                "SELECT body, updated_at, etag FROM sessions WHERE user_id = ? AND id = ?", (user_id, session_id)
+            ).fetchone()
+            if row is None:
+                raise NotFoundError(f"Session {session_id} not found")
+            return self._session(row, self._messages(connection, user_id, [session_id])[session_id])
+        return await self._read(select)
+
+    async def list_sessions(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        def select(connection: sqlite3.Connection) -> List[Dict[str, Any]]:
+            rows = connection.execute(
+                "SELECT id, body, updated_at, etag FROM sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+            messages = self._messages(connection, user_id, [row[0] for row in rows])
+            return [self._session(row[1:], messages[row[0]]) for row in rows]
+        return await self._read(select)
+
+    async def list_session_summaries(self, user_id: str, limit: int,
+                                     continuation: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            offset = int(continuation) if continuation else 0
+        except ValueError:
+            raise InvalidContinuationError("Invalid continuation token")
+
+        def select(connection: sqlite3.Connection) -> Dict[str, Any]:
+            rows = connection.execute(
+                "SELECT id, body, updated_at, message_count FROM sessions WHERE user_id = ? "
+                "ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (user_id, limit + 1, offset)
+            ).fetchall()
+            items = []
+            for session_id, body, updated_at, message_count in rows[:limit]:
+                session = json.loads(body)
+                items.append({
+                    "id": session_id,
+                    "workflowId": session.get("workflowId"),
+                    "workflowTitle": session.get("workflowTitle"),
+                    "createdAt": session.get("createdAt"),
+                    "updatedAt": updated_at,
+                    "messageCount": message_count,
+                })
+            return {"items": items, "continuation": str(offset + limit) if len(rows) > limit else None}
+        return await self._read(select)
+
+    async def append_messages(self, session_id: str, user_id: str, messages: List[Dict[str, Any]],
+                              etag: Optional[str] = None) -> Optional[str]:
+        updated_at = datetime.now().isoformat()
+
+        def append(connection: sqlite3.Connection) -> str:
+            row = connection.execute(
+                "SELECT etag, message_count FROM sessions WHERE user_id = ? AND id = ?", (user_id, session_id)
+            ).fetchone()
+            if row is None:
+                raise NotFoundError(f"Session {session_id} not found")
+            current_etag, message_count = row
+            if etag and etag != current_etag:
+                raise PreconditionFailedError(f"Session {session_id} was modified")
+            connection.executemany(
+                "INSERT INTO messages (user_id, session_id, seq, body) VALUES (?, ?, ?, ?)",
+                [(user_id, session_id, message_count + offset, dumps(message)) for offset, message in enumerate(messages)]
+            )
+            next_etag = new_etag()
+            connection.execute(
+                "UPDATE sessions SET message_count = ?, updated_at = ?, etag = ? WHERE user_id = ? AND id = ?",
+                (message_count + len(messages), updated_at, next_etag, user_id, session_id)
+            )
+            return next_etag
+        return await self._write(append)
+
+    # Workflows
+
+    @staticmethod
+    def _document(body: str, etag: str) -> Dict[str, Any]:
+        document = json.loads(body)
+        document["_etag"] = etag
+        return document
+
+    async def create_workflow(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        def insert(connection: sqlite3.Connection) -> Dict[str, Any]:
+            etag = new_etag()
+            try:
+                connection.execute(
+                    "INSERT INTO workflows (user_id, id, updated_at, etag, body) VALUES (?, ?, ?, ?, ?)",
+                    (workflow["user_id"], workflow["id"], workflow.get("updated_at"), etag, _stored(workflow))
+                )
+            except sqlite3.IntegrityError:
+                raise RepositoryError(f"Workflow {workflow['id']} already exists")
+            return dict(workflow, _etag=etag)
+        return await self._write(insert)
+
+    async def list_workflows(self, user_id: str) -> List[Dict[str, Any]]:
+        def select(connection: sqlite3.Connection) -> List[Dict[str, Any]]:
+            rows = connection.execute("SELECT body, etag FROM workflows WHERE user_id = ?", (user_id,))
+            return [self._document(body, etag) for body, etag in rows]
+        return await self._read(select)
+
+    async def get_workflow(self, workflow_id: str, user_id: str) -> Dict[str, Any]:
+        def select(connection: sqlite3.Connection) -> Dict[str, Any]:
+            row = connection.execute(
+                "SELECT body, etag FROM workflows WHERE user_id = ? AND id = ?", (user_id, workflow_id)
+            ).fetchone()
+            if row is None:
+                raise NotFoundError(f"Workflow {workflow_id} not found")
+            return self._document(*row)
+        return await self._read(select)
+
+    async def find_workflow(self, workflow_id: str) -> Dict[str, Any]:
+        def select(connection: sqlite3.Connection) -> Dict[str, Any]:
+            row = connection.execute("SELECT body, etag FROM workflows WHERE id = ? LIMIT 1", (workflow_id,)).fetchone()
+            if row is None:
+                raise NotFoundError(f"Workflow {workflow_id} not found")
+            return self._document(*row)
+        return await self._read(select)
+
+    async def update_workflow(self, workflow_id: str, user_id: str, changes: Dict[str, Any],
+                              etag: Optional[str] = None) -> Dict[str, Any]:
+        updated_at = datetime.now().isoformat()
+
+        def update(connection: sqlite3.Connection) -> Dict[str, Any]:
+            row = connection.execute(
+                "SELECT body, etag FROM workflows WHERE user_id = ? AND id = ?", (user_id, workflow_id)
+            ).fetchone()
+            if row is None:
+                raise NotFoundError(f"Workflow {workflow_id} not found")
+            if etag and etag != row[1]:
+                raise PreconditionFailedError(f"Workflow {workflow_id} was modified")
+            workflow = dict(json.loads(row[0]), **changes, updated_at=updated_at)
+            next_etag = new_etag()
+            connection.execute(
+                "UPDATE workflows SET updated_at = ?, etag = ?, body = ? WHERE user_id = ? AND id = ?",
+                (updated_at, next_etag, _stored(workflow), user_id, workflow_id)
+            )
+            workflow["_etag"] = next_etag
+            return workflow
+        return await self._write(update)
+
+    async def delete_workflow(self, workflow_id: str, user_id: str):
+        def delete(connection: sqlite3.Connection):
+            cursor = connection.execute("DELETE FROM workflows WHERE user_id = ? AND id = ?", (user_id, workflow_id))
+            if cursor.rowcount == 0:
+                raise NotFoundError(f"Workflow {workflow_id} not found")
+        await self._write(delete)
+
+    # Workflow configs
+
+    async def list_workflow_configs(self) -> List[Dict[str, Any]]:
+        def select(connection: sqlite3.Connection) -> List[Dict[str, Any]]:
+            rows = connection.execute("SELECT body, etag FROM workflow_configs ORDER BY created_at, id")
+            return [self._document(body, etag) for body, etag in rows]
+        return await self._read(select)
+
+    async def create_workflow_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        def insert(connection: sqlite3.Connection) -> Dict[str, Any]:
+            etag = new_etag()
+            try:
+                connection.execute(
+                    "INSERT INTO workflow_configs (id, created_at, etag, body) VALUES (?, ?, ?, ?)",
+                    (config["id"], str(config.get("created_at")), etag, _stored(config))
+                )
+            except sqlite3.IntegrityError:
+                raise RepositoryError(f"Workflow config {config['id']} already exists")
+            return dict(config, _etag=etag)
+        return await self._write(insert)
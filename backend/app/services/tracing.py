@@ -0,0 +1,423 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID_HEADER = "X-Trace-Id"
+SERVICE_NAME = "panta-flows-api"
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    """
+    A timed operation in a trace. Attributes are set while it runs and exported with
+    it when it ends, if its trace is sampled.
+    """
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "sampled", "start_ns", "end_ns",
+                 "attributes", "error")
+
+    def __init__(self, name: str, kind: int, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {
+            key: value for key, value in (attributes or {}).items() if value is not None
+        }
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1):
+        """
+        Accumulate a count on the span, such as the retries or bytes of its calls.
+        """
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def fail(self, error: Any):
+        self.error = str(error) or type(error).__name__
+        if isinstance(error, BaseException):
+            self.attributes["exception.type"] = type(error).__name__
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error is not None else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Stands in for spans while tracing is off, so call sites never check."""
+
+    trace_id = None
+    sampled = False
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def add(self, key: str, amount: float = 1):
+        pass
+
+    def fail(self, error: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """
+    The trace ID, parent span ID and sampled flag of a W3C traceparent header.
+    """
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+def otlp_document(spans: List[Span]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "panta-flows"}, "spans": [span.to_otlp() for span in spans]}],
+        }]
+    }
+
+
+class FileExporter:
+    """
+    Appends each batch of spans to a file as one line of OTLP JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(otlp_document(spans), separators=(",", ":")) + "\n")
+
+
+class OtlpHttpExporter:
+    """
+    Posts each batch of spans as OTLP JSON to a collector's /v1/traces endpoint.
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans: List[Span]):
+        request = urllib.request.Request(
+            self.endpoint, data=json.dumps(otlp_document(spans)).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class Tracer:
+    """
+    Trace spans kept in a context variable, so nested spans find their parent across
+    awaits and the tasks they create, and W3C traceparent propagation in and out.
+
+    Finished spans of sampled traces are queued and exported in batches by a
+    background thread, so exporting never blocks a request. Without an exporter
+    tracing is off and spans cost a context manager call.
+    """
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0, export_interval: float = 2.0,
+                 max_batch: int = 512, max_queue: int = 10000):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.export_interval = export_interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"spans": 0, "exported": 0, "dropped": 0, "export_errors": 0}
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        kind = os.getenv("TRACE_EXPORTER", "none").lower()
+        if kind == "file":
+            exporter = FileExporter(os.getenv("TRACE_FILE", "traces.jsonl"))
+        elif kind == "otlp":
+            exporter = OtlpHttpExporter(os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"))
+        elif kind == "none":
+            exporter = None
+        else:
+            raise ValueError(f"Unknown TRACE_EXPORTER: {kind}")
+        return cls(
+            exporter=exporter,
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 1.0)),
+            export_interval=float(os.getenv("TRACE_EXPORT_INTERVAL_SECONDS", 2)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+
+    def start_span(self, name: str, kind: int = INTERNAL, parent: Optional[Tuple[str, str, bool]] = None,
+                   attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None) -> Span:
+        """
+        A span that is not made current, for the caller to end(). Its parent is the
+        given (trace ID, span ID, sampled) or else the current span; without either
+        it starts a new trace.
+        """
+        if parent is None:
+            current = _current_span.get()
+            if current is not None:
+                parent = (current.trace_id, current.span_id, current.sampled)
+        if parent is None:
+            return Span(name, kind, f"{random.getrandbits(128):032x}", None,
+                        random.random() < self.sample_rate, attributes, start_ns)
+        return Span(name, kind, parent[0], parent[1], parent[2], attributes, start_ns)
+
+    def end(self, span: Span, end_ns: Optional[int] = None):
+        span.end_ns = end_ns or time.time_ns()
+        if span.sampled:
+            self._enqueue(span)
+
+    @contextmanager
+    def span(self, name: str, kind: int = INTERNAL, **attributes: Any) -> Iterator[Span]:
+        """
+        Trace the block as a child of the current span: with tracer.span("page.fetch", url=url) as span: ...
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        span = self.start_span(name, kind, attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end(span)
+
+    def record_call(self, name: str, duration_s: float, attributes: Dict[str, Any], error: Optional[str] = None):
+        """
+        Add an already finished client call as a child of the current span. Calls
+        made outside of a traced request (startup, change feed polls) are not traced.
+        """
+        current = _current_span.get()
+        if current is None:
+            return
+        end_ns = time.time_ns()
+        span = self.start_span(name, CLIENT, attributes=attributes, start_ns=end_ns - int(duration_s * 1e9))
+        if error is not None:
+            span.fail(error)
+        self.end(span, end_ns)
+
+    def httpx_transport(self, service: str, **transport_options: Any) -> "TracedTransport":
+        """
+        Transport for an httpx client that traces each HTTP call, retries included,
+        and sends the traceparent of the call upstream. The options configure the
+        httpx.HTTPTransport it wraps, such as its connection limits.
+        """
+        import httpx
+        return TracedTransport(self, service, httpx.HTTPTransport(**transport_options))
+
+    def _enqueue(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self._stats["dropped"] += 1
+            return
+        self._stats["spans"] += 1
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None and not self._stopping.is_set():
+                    self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    def _export_loop(self):
+        while not self._stopping.wait(self.export_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        while True:
+            batch = []
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self.exporter.export(batch)
+                self._stats["exported"] += len(batch)
+            except Exception as e:
+                self._stats["export_errors"] += 1
+                self._stats["dropped"] += len(batch)
+                logger.warning(f"Failed to export {len(batch)} spans: {str(e)}")
+
+    def shutdown(self):
+        """
+        Export the spans still queued and stop the exporter thread.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.export_interval + 10)
+        elif self.exporter is not None:
+            self._flush()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["queued"] = self._queue.qsize()
+        stats["sample_rate"] = self.sample_rate
+        return stats
+
+
+class TracedTransport:
+    """
+    Wraps an httpx transport to trace its calls as client spans of the current span.
+
+    A call that fails without a response (connect error, timeout) ends its span with
+    the error, so the failed upstream calls are exported too. Calls made outside of a
+    traced request are not traced.
+    """
+
+    def __init__(self, tracer: Tracer, service: str, transport):
+        self.tracer = tracer
+        self.service = service
+        self.transport = transport
+
+    def handle_request(self, request):
+        current = _current_span.get()
+        if current is None:
+            return self.transport.handle_request(request)
+        span = self.tracer.start_span(f"{self.service} {request.method} {request.url.path}", CLIENT, attributes={
+            "http.method": request.method,
+            "http.url": str(request.url.copy_with(query=None)),
+            "http.request_bytes": int(request.headers.get("content-length", 0)) or None,
+        })
+        request.headers["traceparent"] = span.traceparent
+        current.add(f"{self.service}.calls")
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException as e:
+            span.fail(e)
+            self.tracer.end(span)
+            raise
+        span.set("http.status_code", response.status_code)
+        span.set("http.response_bytes", int(response.headers.get("content-length", 0)) or None)
+        if response.status_code >= 400:
+            span.fail(f"HTTP {response.status_code}")
+        self.tracer.end(span)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        self.transport.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.transport.__exit__(*exc_info)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens the server span of each HTTP request, continuing the
+    trace of an incoming traceparent header, and returns the trace ID in X-Trace-Id
+    so a slow response can be looked up.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = next((value.decode("latin-1") for key, value in scope["headers"] if key == b"traceparent"), None)
+        span = tracer.start_span(f"{scope['method']} {scope['path']}", SERVER, parent=parse_traceparent(traceparent),
+                                 attributes={"http.method": scope["method"], "http.target": scope["path"]})
+        token = _current_span.set(span)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                span.set("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.fail(f"HTTP {message['status']}")
+                if span.sampled:
+                    MutableHeaders(scope=message).append(TRACE_ID_HEADER, span.trace_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            span.fail(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            # The router stores the matched route in the scope, so spans group by path template
+            route = scope.get("route")
+            if route is not None:
+                span.name = f"{scope['method']} {route.path}"
+                span.set("http.route", route.path)
+            tracer.end(span)
+
+
+tracer = Tracer.from_env()
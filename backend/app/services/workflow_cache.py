@@ -0,0 +1,129 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UserWorkflows:
+    items: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # True once the full list of the user's workflows has been loaded
+    complete: bool = False
+    loaded_at: float = field(default_factory=time.time)
+
+
+class WorkflowCache:
+    """
+    In-process cache of workflow documents, grouped per user (the partition key).
+
+    Writes made through this process update or drop the cached documents directly.
+    The TTL bounds how long a change made by another worker can go unnoticed. The
+    least recently used users are evicted beyond max_users.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_users: int = 1000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users: "OrderedDict[str, UserWorkflows]" = OrderedDict()
+        self._stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def _entry(self, user_id: str) -> Optional[UserWorkflows]:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        if time.time() - entry.loaded_at >= self.ttl:
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return entry
+
+    def _ensure(self, user_id: str) -> UserWorkflows:
+        entry = self._entry(user_id)
+        if entry is None:
+            entry = self._users[user_id] = UserWorkflows()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self._stats["evictions"] += 1
+        return entry
+
+    def get_all(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        self._stats["lookups"] += 1
+        entry = self._entry(user_id)
+        if entry is None or not entry.complete:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return list(entry.items.values())
+
+    def set_all(self, user_id: str, workflows: List[Dict[str, Any]]):
+        self._users.pop(user_id, None)
+        entry = self._ensure(user_id)
+        entry.items = {workflow["id"]: workflow for workflow in workflows}
+        entry.complete = True
+
+    def get(self, user_id: str, workflow_id: str) -> Optional[Dict[str, Any]]:
+        self._stats["lookups"] += 1
+        entry = self._entry(user_id)
+        workflow = entry.items.get(workflow_id) if entry else None
+        self._stats["hits" if workflow is not None else "misses"] += 1
+        return workflow
+
+    def find(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """
+        A cached workflow of any user by its id.
+        """
+        self._stats["lookups"] += 1
+        for user_id in list(self._users):
+            entry = self._entry(user_id)
+            workflow = entry.items.get(workflow_id) if entry else None
+            if workflow is not None:
+                self._stats["hits"] += 1
+                return workflow
+        self._stats["misses"] += 1
+        return None
+
+    def put(self, workflow: Dict[str, Any]):
+        """
+        Store a workflow document read from or written to Cosmos DB.
+        """
+        self._ensure(workflow["user_id"]).items[workflow["id"]] = workflow
+
+    def invalidate(self, user_id: str, workflow_id: Optional[str] = None):
+        """
+        Drop one workflow of a user, or all of them when workflow_id is None.
+        """
+        if workflow_id is None:
+            self._users.pop(user_id, None)
+            return
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry.items.pop(workflow_id, None)
+
+    def etag(self, user_id: str, workflow_id: str) -> Optional[str]:
+        entry = self._users.get(user_id)
+        workflow = entry.items.get(workflow_id) if entry else None
+        return workflow.get("_etag") if workflow else None
+
+    def clear(self):
+        self._users.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["users"] = len(self._users)
+        return stats
+
+
+workflow_cache = WorkflowCache(
+    ttl=float(os.getenv("WORKFLOW_CACHE_TTL_SECONDS", 60)),
+    max_users=int(os.getenv("WORKFLOW_CACHE_MAX_USERS", 1000)),
+)
@@ -0,0 +1,304 @@
+"""
+Local stand-ins for the services the backend calls: Azure OpenAI (chat completions,
+files and vector stores), a DuckDuckGo-like search endpoint and a site of article pages.
+
+Each upstream answers with a configurable latency profile and fails or throttles a
+configurable share of requests, and every call is counted. Run it on its own with
+
+    python -m benchmarks.fakes --port 8765 --profile realistic
+
+GET /_stats returns the call counts, POST /_reset clears them.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+WORDS = (
+    "system data model latency cache request server network storage index query search "
+    "result page content user session workflow message token stream thread process memory "
+    "throughput benchmark analysis report market growth policy energy climate research "
+    "study team product design security update release version performance scale cloud"
+).split()
+
+SEARCH_TRIGGER = "search the web"
+
+
+@dataclass
+class UpstreamProfile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after_seconds: float = 0.0
+
+    async def delay(self, rng: random.Random):
+        latency = max(0.0, rng.gauss(self.latency_ms, self.jitter_ms)) if self.jitter_ms else self.latency_ms
+        if latency:
+            await asyncio.sleep(latency / 1000)
+
+
+PROFILES: Dict[str, Dict[str, UpstreamProfile]] = {
+    # No waiting at all, measures the backend's own overhead
+    "fast": {
+        "openai": UpstreamProfile(),
+        "search": UpstreamProfile(),
+        "pages": UpstreamProfile(),
+    },
+    "realistic": {
+        "openai": UpstreamProfile(latency_ms=600, jitter_ms=200, error_rate=0.005, throttle_rate=0.01),
+        "search": UpstreamProfile(latency_ms=350, jitter_ms=150, error_rate=0.02),
+        "pages": UpstreamProfile(latency_ms=120, jitter_ms=80, error_rate=0.03),
+    },
+    "degraded": {
+        "openai": UpstreamProfile(latency_ms=1500, jitter_ms=700, error_rate=0.05, throttle_rate=0.1),
+        "search": UpstreamProfile(latency_ms=1200, jitter_ms=900, error_rate=0.15),
+        "pages": UpstreamProfile(latency_ms=600, jitter_ms=500, error_rate=0.1),
+    },
+}
+
+
+def build_profile(name: str, overrides: List[str]) -> Dict[str, UpstreamProfile]:
+    """
+    A named profile with overrides like openai.latency_ms=200 applied.
+    """
+    profile = dict(PROFILES[name])
+    for override in overrides:
+        key, value = override.split("=", 1)
+        upstream, field = key.split(".", 1)
+        profile[upstream] = replace(profile[upstream], **{field: float(value)})
+    return profile
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def article_html(page_id: str, paragraphs: int) -> str:
+    """
+    A deterministic news-like article page with navigation, sidebar and footer boilerplate.
+    """
+    rng = random.Random(page_id)
+    title = sentence(rng, 6)
+    body = "\n".join(
+        f"<p>{' '.join(sentence(rng, rng.randint(8, 24)) for _ in range(rng.randint(2, 6)))}</p>"
+        for _ in range(paragraphs)
+    )
+    nav = "".join(f'<li><a href="/pages/{rng.randint(0, 999)}">{rng.choice(WORDS)}</a></li>' for _ in range(40))
+    return (
+        f"<!DOCTYPE html><html><head><title>{title}</title>"
+        f"<script>{'var x=1;' * 200}</script><style>{'.c{color:red}' * 200}</style></head>"
+        f"<body><nav><ul>{nav}</ul></nav><main><article><h1>{title}</h1>{body}</article></main>"
+        f"<aside>{sentence(rng, 30)}</aside><footer>{sentence(rng, 20)}</footer></body></html>"
+    )
+
+
+class FakeUpstreams:
+    def __init__(self, profile: Dict[str, UpstreamProfile], seed: int = 0, page_paragraphs: int = 60):
+        self.profile = profile
+        self.page_paragraphs = page_paragraphs
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.failures: Counter = Counter()
+        self._pages: Dict[str, bytes] = {}
+        self._files = 0
+
+    async def _upstream(self, upstream: str, route: str) -> Optional[web.Response]:
+        """
+        Count the call, wait out the latency and return an error response if this call
+        should fail or be throttled, None otherwise.
+        """
+        self.calls[route] += 1
+        profile = self.profile[upstream]
+        await profile.delay(self.rng)
+        if profile.throttle_rate and self.rng.random() < profile.throttle_rate:
+            self.failures[f"{route} 429"] += 1
+            return web.json_response(
+                {"error": {"code": "429", "message": "Rate limit exceeded"}}, status=429,
+                headers={"Retry-After": str(profile.retry_after_seconds)}
+            )
+        if profile.error_rate and self.rng.random() < profile.error_rate:
+            self.failures[f"{route} 500"] += 1
+            return web.json_response({"error": {"code": "500", "message": "Internal error"}}, status=500)
+        return None
+
+    # Azure OpenAI
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("openai", "openai chat.completions")
+        if failed is not None:
+            return failed
+        body = await request.json()
+        messages = body.get("messages", [])
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        has_tool_results = any(m.get("role") == "tool" for m in messages)
+
+        message = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+        if body.get("tools") and not has_tool_results and SEARCH_TRIGGER in last_user.lower():
+            query = last_user.lower().split(SEARCH_TRIGGER, 1)[1].strip(" :?.") or "news"
+            message["tool_calls"] = [{
+                "id": f"call_{self.rng.getrandbits(48):012x}",
+                "type": "function",
+                "function": {"name": "web_search", "arguments": json.dumps({"query": query, "max_results": 5})},
+            }]
+            finish_reason = "tool_calls"
+        else:
+            message["content"] = " ".join(sentence(self.rng, 12) for _ in range(8))
+
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+        return web.json_response({
+            "id": f"chatcmpl-{self.rng.getrandbits(64):016x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.match_info["deployment"],
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 120, "total_tokens": prompt_tokens + 120},
+        })
+
+    async def create_file(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("openai", "openai files.create")
+        if failed is not None:
+            return failed
+        size = 0
+        filename = "upload"
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == "file":
+                filename = part.filename or filename
+                while chunk := await part.read_chunk():
+                    size += len(chunk)
+        self._files += 1
+        return web.json_response({
+            "id": f"file-{self._files:08d}", "object": "file", "bytes": size, "created_at": int(time.time()),
+            "filename": filename, "purpose": "assistants", "status": "processed",
+        })
+
+    def _vector_store(self) -> dict:
+        return {
+            "id": "vs_bench", "object": "vector_store", "name": "chat-files", "status": "completed",
+            "created_at": 0, "last_active_at": 0, "usage_bytes": 0, "metadata": {},
+            "file_counts": {"in_progress": 0, "completed": self._files, "failed": 0, "cancelled": 0, "total": self._files},
+        }
+
+    async def list_vector_stores(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("openai", "openai vector_stores.list")
+        if failed is not None:
+            return failed
+        return web.json_response({"object": "list", "data": [self._vector_store()], "has_more": False})
+
+    async def create_vector_store(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("openai", "openai vector_stores.create")
+        if failed is not None:
+            return failed
+        return web.json_response(self._vector_store())
+
+    def _file_batch(self, batch_id: str, store_id: str, count: int) -> dict:
+        return {
+            "id": batch_id, "object": "vector_store.files_batch", "created_at": 0,
+            "status": "completed", "vector_store_id": store_id,
+            "file_counts": {"in_progress": 0, "completed": count, "failed": 0, "cancelled": 0, "total": count},
+        }
+
+    async def create_file_batch(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("openai", "openai file_batches.create")
+        if failed is not None:
+            return failed
+        body = await request.json()
+        batch_id = f"vsfb_{self.rng.getrandbits(48):012x}"
+        return web.json_response(self._file_batch(batch_id, request.match_info["store"], len(body.get("file_ids", []))))
+
+    async def get_file_batch(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("openai", "openai file_batches.retrieve")
+        if failed is not None:
+            return failed
+        return web.json_response(self._file_batch(request.match_info["batch"], request.match_info["store"], 1))
+
+    # Search and pages
+
+    async def search(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("search", "search")
+        if failed is not None:
+            return failed
+        query = request.query.get("q", "")
+        max_results = int(request.query.get("max_results", 5))
+        seed = int(hashlib.sha256(query.encode()).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        base = f"http://{request.host}"
+        return web.json_response([
+            {
+                "title": sentence(rng, 6),
+                "href": f"{base}/pages/{rng.randint(0, 499)}",
+                "body": f"{query} " + sentence(rng, 20),
+            }
+            for _ in range(max_results)
+        ])
+
+    async def page(self, request: web.Request) -> web.Response:
+        failed = await self._upstream("pages", "pages")
+        if failed is not None:
+            return failed
+        page_id = request.match_info["page"]
+        html = self._pages.get(page_id)
+        if html is None:
+            html = self._pages[page_id] = article_html(page_id, self.page_paragraphs).encode()
+        etag = f'"{hashlib.sha256(html).hexdigest()[:16]}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.calls["pages 304"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=html, content_type="text/html", charset="utf-8",
+                            headers={"ETag": etag, "Cache-Control": "max-age=300"})
+
+    # Control
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": dict(self.calls),
+            "failures": dict(self.failures),
+            "profile": {name: asdict(profile) for name, profile in self.profile.items()},
+        })
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.calls.clear()
+        self.failures.clear()
+        return web.json_response({"ok": True})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/openai/deployments/{deployment}/chat/completions", self.chat_completions)
+        app.router.add_post("/openai/files", self.create_file)
+        app.router.add_get("/openai/vector_stores", self.list_vector_stores)
+        app.router.add_post("/openai/vector_stores", self.create_vector_store)
+        app.router.add_post("/openai/vector_stores/{store}/file_batches", self.create_file_batch)
+        app.router.add_get("/openai/vector_stores/{store}/file_batches/{batch}", self.get_file_batch)
+        app.router.add_get("/search", self.search)
+        app.router.add_get("/pages/{page}", self.page)
+        app.router.add_get("/_stats", self.stats)
+        app.router.add_post("/_reset", self.reset)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake upstream services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--set", action="append", default=[], metavar="UPSTREAM.FIELD=VALUE",
+                        help="Override a profile value, e.g. openai.latency_ms=200")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--page-paragraphs", type=int, default=60)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(build_profile(args.profile, args.set), seed=args.seed, page_paragraphs=args.page_paragraphs)
+    web.run_app(upstreams.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
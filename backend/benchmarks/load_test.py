@@ -0,0 +1,349 @@
+"""
+End-to-end load test of the backend against local fakes of its upstream services.
+
+Starts benchmarks.fakes and benchmarks.serve as subprocesses, then runs a closed-loop
+load of virtual users, each repeatedly picking a scenario from the mix, for the given
+duration. Reports throughput and latency percentiles per scenario, the calls the
+backend made to each upstream, and saves everything as JSON under benchmarks/results.
+
+    cd backend
+    python -m benchmarks.load_test --profile realistic --users 32 --duration 60
+    python -m benchmarks.load_test --profile fast --compare benchmarks/results/load-fast-<...>.json
+
+Scenarios:
+    chat          stateless chat completion with a short history
+    chat_session  chat turn on a stored session (history loaded, turn persisted)
+    tools         chat that makes the model call web_search (search, page fetches, second completion)
+    search        web search with page fetching and analysis
+    upload        file upload to OpenAI files and the vector store
+    sessions      session traffic: create, append, list summaries, load history, read
+"""
+import argparse
+import asyncio
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from .report import compare, environment, exit_on_regressions, latency_summary, load_results, save_results
+
+DEFAULT_MIX = "chat=3,chat_session=3,tools=1,search=1,upload=0.5,sessions=4"
+
+QUERY_TOPICS = (
+    "solar panel efficiency", "python asyncio tutorial", "interest rate outlook", "electric vehicle sales",
+    "cosmos db partition keys", "marathon training plan", "sourdough starter", "quantum computing basics",
+    "remote work productivity", "climate policy europe", "fastapi deployment", "home espresso machines",
+    "kubernetes autoscaling", "world cup results", "mediterranean diet", "startup funding trends",
+)
+
+
+@dataclass
+class Sample:
+    scenario: str
+    started: float
+    latency_ms: float
+    ok: bool
+    status: int
+
+
+@dataclass
+class VirtualUser:
+    index: int
+    rng: random.Random
+    user_id: str
+    session_id: Optional[str] = None
+    history: List[Dict[str, str]] = field(default_factory=list)
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, float], seed: int, unique_queries: bool):
+        self.client = client
+        self.mix = mix
+        self.seed = seed
+        self.unique_queries = unique_queries
+        self.samples: List[Sample] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.scenarios: Dict[str, Callable[[VirtualUser], Awaitable[httpx.Response]]] = {
+            "chat": self.chat,
+            "chat_session": self.chat_session,
+            "tools": self.tools,
+            "search": self.search,
+            "upload": self.upload,
+            "sessions": self.sessions,
+        }
+        unknown = set(mix) - set(self.scenarios)
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    def query(self, user: VirtualUser) -> str:
+        # Popular topics are asked far more often than the rest, like real search traffic
+        topic = QUERY_TOPICS[min(int(user.rng.paretovariate(1.2)) - 1, len(QUERY_TOPICS) - 1)]
+        return f"{topic} {user.rng.getrandbits(32):08x}" if self.unique_queries else topic
+
+    async def ensure_session(self, user: VirtualUser) -> str:
+        if user.session_id is None:
+            response = await self.client.post("/api/cosmos/sessions", json={
+                "workflowId": "chat", "workflowTitle": "Chat Assistant", "userId": user.user_id,
+                "messages": [{"role": "system", "content": "You are a helpful assistant."}],
+            })
+            response.raise_for_status()
+            user.session_id = response.json()["id"]
+        return user.session_id
+
+    async def chat(self, user: VirtualUser) -> httpx.Response:
+        return await self.client.post("/api/chat/completions", json={"messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": f"Tell me about {self.query(user)}"},
+            {"role": "assistant", "content": "Sure, what would you like to know?"},
+            {"role": "user", "content": "Give me the key facts."},
+        ]})
+
+    async def chat_session(self, user: VirtualUser) -> httpx.Response:
+        session_id = await self.ensure_session(user)
+        return await self.client.post("/api/chat/completions", json={
+            "messages": [{"role": "user", "content": f"What's new with {self.query(user)}?"}],
+            "session_id": session_id,
+            "user_id": user.user_id,
+        })
+
+    async def tools(self, user: VirtualUser) -> httpx.Response:
+        return await self.client.post("/api/chat/completions", json={"messages": [
+            {"role": "user", "content": f"Search the web for {self.query(user)}"},
+        ]})
+
+    async def search(self, user: VirtualUser) -> httpx.Response:
+        return await self.client.post("/api/web-search/search", json={
+            "query": self.query(user), "max_results": 5, "fetch_content": True,
+        })
+
+    async def upload(self, user: VirtualUser) -> httpx.Response:
+        text = "\n".join(f"Line {i}: {self.query(user)}" for i in range(400))
+        return await self.client.post("/api/files/upload", files={"file": (f"notes-{user.index}.txt", text, "text/plain")})
+
+    async def sessions(self, user: VirtualUser) -> httpx.Response:
+        session_id = await self.ensure_session(user)
+        operation = user.rng.choices(["append", "list", "history", "read", "create"], weights=[4, 3, 2, 2, 1])[0]
+        if operation == "append":
+            return await self.client.post(f"/api/cosmos/sessions/{session_id}/{user.user_id}/messages/batch", json={
+                "messages": [
+                    {"role": "user", "content": f"Question about {self.query(user)}"},
+                    {"role": "assistant", "content": "An answer. " * 40},
+                ]
+            })
+        if operation == "list":
+            return await self.client.get(f"/api/cosmos/users/{user.user_id}/sessions", params={"limit": 20})
+        if operation == "history":
+            return await self.client.get(f"/api/cosmos/sessions/{user.user_id}", params={"limit": 20})
+        if operation == "read":
+            return await self.client.get(f"/api/cosmos/sessions/{session_id}/{user.user_id}")
+        user.session_id = None
+        await self.ensure_session(user)
+        return await self.client.get(f"/api/cosmos/sessions/{user.session_id}/{user.user_id}")
+
+    async def run_user(self, user: VirtualUser, deadline: float, record_after: float):
+        names, weights = list(self.mix), list(self.mix.values())
+        while time.perf_counter() < deadline:
+            scenario = user.rng.choices(names, weights=weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await self.scenarios[scenario](user)
+                ok, status = response.status_code < 400, response.status_code
+            except Exception as e:
+                ok, status = False, 0
+                self.errors[f"{scenario}: {type(e).__name__}"] += 1
+            latency_ms = (time.perf_counter() - started) * 1000
+            if started >= record_after:
+                self.samples.append(Sample(scenario, started, latency_ms, ok, status))
+
+    async def run(self, users: int, duration: float, warmup: float) -> float:
+        start = time.perf_counter()
+        record_after = start + warmup
+        deadline = record_after + duration
+        await asyncio.gather(*(
+            self.run_user(VirtualUser(i, random.Random(self.seed * 100003 + i), f"bench-user-{i}"), deadline, record_after)
+            for i in range(users)
+        ))
+        # Requests still running at the deadline finish, so measure up to the last completion
+        return max(duration, max((s.started + s.latency_ms / 1000 for s in self.samples), default=deadline) - record_after)
+
+    def summary(self, elapsed: float) -> Dict[str, Dict[str, Any]]:
+        by_scenario: Dict[str, List[Sample]] = defaultdict(list)
+        for sample in self.samples:
+            by_scenario[sample.scenario].append(sample)
+        by_scenario["overall"] = list(self.samples)
+
+        results = {}
+        for scenario, samples in by_scenario.items():
+            statuses: Dict[str, int] = defaultdict(int)
+            for sample in samples:
+                statuses[str(sample.status)] += 1
+            results[scenario] = {
+                "requests": len(samples),
+                "errors": sum(1 for sample in samples if not sample.ok),
+                "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                "statuses": dict(statuses),
+                # Percentiles over successful requests, failures are often fast and would flatter them
+                **latency_summary([sample.latency_ms for sample in samples if sample.ok]),
+            }
+        return results
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def start_process(module: str, *args: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", module, *args])
+
+
+async def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url, timeout=2)
+                return
+            except httpx.TransportError:
+                if time.perf_counter() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+                await asyncio.sleep(0.2)
+
+
+async def fetch_json(client: httpx.AsyncClient, url: str) -> Any:
+    try:
+        response = await client.get(url, timeout=10)
+        return response.json()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def print_summary(results: Dict[str, Any]):
+    print(f"\n{'scenario':<14} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for scenario, row in sorted(results["scenarios"].items(), key=lambda item: item[0] == "overall"):
+        def ms(key: str) -> str:
+            return f"{row[key]:.1f}" if row[key] is not None else "-"
+        print(f"{scenario:<14} {row['requests']:>9} {row['errors']:>7} {row['rps']:>8.1f} {ms('p50_ms'):>9} {ms('p95_ms'):>9} {ms('p99_ms'):>9}")
+    print("\nupstream calls:")
+    for route, count in sorted(results["upstream"].get("calls", {}).items()):
+        print(f"  {route:<32} {count:>8}")
+    for route, count in sorted(results["upstream"].get("failures", {}).items()):
+        print(f"  {route:<32} {count:>8} (injected)")
+    if results["client_errors"]:
+        print("\nclient errors:")
+        for error, count in sorted(results["client_errors"].items()):
+            print(f"  {error:<32} {count:>8}")
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    fakes_url = f"http://127.0.0.1:{args.fakes_port}"
+    processes = [start_process(
+        "benchmarks.fakes", "--port", str(args.fakes_port), "--profile", args.profile, "--seed", str(args.seed),
+        *[option for override in args.set for option in ("--set", override)]
+    )]
+    try:
+        await wait_until_up(f"{fakes_url}/_stats")
+        url = args.url
+        if url is None:
+            processes.append(start_process("benchmarks.serve", "--fakes-url", fakes_url, "--port", str(args.app_port)))
+            url = f"http://127.0.0.1:{args.app_port}"
+        await wait_until_up(f"{url}/health")
+
+        limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+        async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+            load_test = LoadTest(client, parse_mix(args.mix), args.seed, args.unique_queries)
+            print(f"Running {args.users} users for {args.duration:.0f}s (+{args.warmup:.0f}s warmup) against {url}, profile {args.profile}")
+            # Upstream calls made during the warmup don't count
+            warmup = asyncio.create_task(asyncio.sleep(args.warmup))
+            run = asyncio.create_task(load_test.run(args.users, args.duration, args.warmup))
+            await warmup
+            async with httpx.AsyncClient() as control:
+                await control.post(f"{fakes_url}/_reset")
+            elapsed = await run
+
+            async with httpx.AsyncClient() as control:
+                upstream = await fetch_json(control, f"{fakes_url}/_stats")
+            app_stats = {
+                "health": await fetch_json(client, "/health"),
+                "search_cache": await fetch_json(client, "/api/web-search/cache/stats"),
+                "search_backends": await fetch_json(client, "/api/web-search/backends/stats"),
+            }
+
+        return {
+            "meta": {
+                **environment(),
+                "label": args.label or args.profile,
+                "profile": args.profile,
+                "overrides": args.set,
+                "users": args.users,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "mix": parse_mix(args.mix),
+                "unique_queries": args.unique_queries,
+                "seed": args.seed,
+                "elapsed_s": round(elapsed, 3),
+            },
+            "scenarios": load_test.summary(elapsed),
+            "upstream": upstream,
+            "client_errors": dict(load_test.errors),
+            "app": app_stats,
+        }
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend against local fakes of its upstreams")
+    parser.add_argument("--profile", default="realistic", help="Upstream profile: fast, realistic or degraded")
+    parser.add_argument("--set", action="append", default=[], metavar="UPSTREAM.FIELD=VALUE",
+                        help="Override a profile value, e.g. openai.error_rate=0.1")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=16, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--unique-queries", action="store_true", help="Never repeat a query, so the caches don't help")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", default=None, help="Test a running benchmarks.serve instead of starting one")
+    parser.add_argument("--fakes-port", type=int, default=8765)
+    parser.add_argument("--app-port", type=int, default=8766)
+    parser.add_argument("--label", default=None, help="Name of the run in the results file name")
+    parser.add_argument("--output", default=None, help="Results file (default benchmarks/results/load-<label>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Results file of a baseline run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Fail when a p95 latency grows or throughput drops by more than this fraction")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print_summary(results)
+    path = save_results("load", results["meta"]["label"], results, args.output)
+    print(f"\nSaved results to {path}")
+
+    if args.compare:
+        baseline = load_results(args.compare)["scenarios"]
+        # Compare throughput as seconds per request, so higher is worse like the latencies
+        def normalized(scenarios: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+            return {
+                name: dict(row, s_per_request=1 / row["rps"] if row.get("rps") else None)
+                for name, row in scenarios.items()
+            }
+        exit_on_regressions(compare(normalized(baseline), normalized(results["scenarios"]),
+                                    ["p50_ms", "p95_ms", "s_per_request"], args.max_regression))
+
+
+if __name__ == "__main__":
+    main()
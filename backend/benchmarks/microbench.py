@@ -0,0 +1,277 @@
+"""
+Microbenchmarks of the pure-Python work the backend does per request: page analysis,
+HTML extraction, converting OpenAI responses, building tool results and Pydantic
+validation of the API models.
+
+Every benchmark runs on fixed, realistic fixtures (large article pages, long session
+histories, responses with many tool calls) and reports the time per call and the memory
+it allocates: the peak traced by tracemalloc during a call and what is still held after
+it. Results are saved as JSON under benchmarks/results and can be compared with a
+baseline run.
+
+    cd backend
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --filter extract --repeat 10
+    python -m benchmarks.microbench --compare benchmarks/results/micro-<...>.json
+"""
+import argparse
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from .fakes import WORDS, article_html, sentence
+from .report import compare, environment, exit_on_regressions, load_results, save_results
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[[], Any]
+    description: str
+
+
+def build_fixtures() -> Dict[str, Any]:
+    """
+    Deterministic inputs sized like what the backend sees in production.
+    """
+    from app.services.html_extract import extract_text
+
+    rng = random.Random(48)
+    pages_html = [article_html(f"micro-{i}", 80) for i in range(5)]
+    long_message = " ".join(sentence(rng, rng.randint(8, 24)) for _ in range(40))
+
+    tool_calls = [
+        {
+            "id": f"call_{i:04d}",
+            "type": "function",
+            "function": {"name": "web_search", "arguments": f'{{"query": "{sentence(rng, 6)}"}}'},
+        }
+        for i in range(16)
+    ]
+    completion = {
+        "id": "chatcmpl-micro",
+        "object": "chat.completion",
+        "created": 1700000000,
+        "model": "benchmark-model",
+        "choices": [
+            {"index": 0, "finish_reason": "tool_calls",
+             "message": {"role": "assistant", "content": None, "tool_calls": tool_calls}},
+            {"index": 1, "finish_reason": "stop",
+             "message": {"role": "assistant", "content": long_message}},
+        ],
+        "usage": {"prompt_tokens": 3200, "completion_tokens": 900, "total_tokens": 4100},
+    }
+
+    search_results = [
+        {
+            "title": sentence(rng, 8),
+            "url": f"https://example.com/pages/{i}",
+            "snippet": sentence(rng, 30),
+            "content_summary": " ".join(sentence(rng, 18) for _ in range(3)),
+            "key_points": [sentence(rng, 16) for _ in range(5)],
+        }
+        for i in range(10)
+    ]
+    file_search = {
+        "content": " ".join(sentence(rng, 20) for _ in range(20)),
+        "file_citations": [{"file_id": f"file-{i:04d}", "quote": sentence(rng, 25)} for i in range(20)],
+    }
+
+    def session_message(i: int) -> Dict[str, Any]:
+        return {
+            "id": f"msg-{i}",
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(sentence(rng, rng.randint(8, 24)) for _ in range(rng.randint(1, 12))),
+            "timestamp": f"2024-05-01T12:{i // 60 % 60:02d}:{i % 60:02d}",
+            "workflowId": "workflow-micro",
+            "workflowTitle": "Research assistant",
+            "userId": "user-micro",
+        }
+
+    return {
+        "pages_html": pages_html,
+        "page_texts": [extract_text(html)[0] for html in pages_html],
+        "large_html": article_html("micro-large", 400),
+        "query": " ".join(rng.sample(WORDS, 4)),
+        "completion": completion,
+        "search_results": search_results,
+        "file_search": file_search,
+        "session": {
+            "id": "session-micro",
+            "workflowId": "workflow-micro",
+            "workflowTitle": "Research assistant",
+            "userId": "user-micro",
+            "createdAt": "2024-05-01T12:00:00",
+            "updatedAt": "2024-05-01T14:00:00",
+            "messages": [session_message(i) for i in range(400)],
+        },
+        "chat_request": {
+            "messages": [
+                {"role": "system", "content": long_message},
+                *({"role": m["role"], "content": m["content"]} for m in (session_message(i) for i in range(200))),
+            ],
+            "temperature": 0.7,
+            "max_tokens": 800,
+        },
+    }
+
+
+def build_benchmarks(fixtures: Dict[str, Any]) -> List[Benchmark]:
+    from openai.types.chat import ChatCompletion
+
+    from app.routers.chat import (ChatRequest, ChatResponse, convert_openai_response_to_dict,
+                                  format_file_search_results, format_web_search_results)
+    from app.routers.cosmos import ChatSession
+    from app.services.html_extract import extract_text
+    from app.services.relevance import analyze_pages
+
+    query = fixtures["query"]
+    completion = ChatCompletion.model_validate(fixtures["completion"])
+    response_dict = convert_openai_response_to_dict(completion)
+    response_dict["choices"][0]["message"]["content"] = ""
+    session = ChatSession.model_validate(fixtures["session"])
+
+    benchmarks = [
+        Benchmark("analyze_content", lambda: analyze_pages(fixtures["page_texts"][:1], query),
+                  "sentence scoring of one fetched page"),
+        Benchmark("analyze_pages", lambda: analyze_pages(fixtures["page_texts"], query),
+                  "sentence and page scoring of the five pages of a search"),
+        Benchmark("extract_text.html_parser", lambda: extract_text(fixtures["large_html"], "html.parser"),
+                  f"main text of a {len(fixtures['large_html']) // 1024} KB page with html.parser"),
+        Benchmark("convert_openai_response", lambda: convert_openai_response_to_dict(completion),
+                  "completion with 16 tool calls and a long answer to a dict"),
+        Benchmark("format_web_search_results", lambda: format_web_search_results(fixtures["search_results"]),
+                  "tool message of 10 analyzed search results"),
+        Benchmark("format_file_search_results", lambda: format_file_search_results(fixtures["file_search"]),
+                  "tool message of a file search answer with 20 citations"),
+        Benchmark("ChatResponse.validate", lambda: ChatResponse.model_validate(response_dict),
+                  "response model of a tool-calling completion"),
+        Benchmark("ChatRequest.validate", lambda: ChatRequest.model_validate(fixtures["chat_request"]),
+                  "chat request with a 200-message history"),
+        Benchmark("ChatSession.validate", lambda: ChatSession.model_validate(fixtures["session"]),
+                  "session with 400 messages"),
+        Benchmark("ChatSession.dump", lambda: session.model_dump(),
+                  "session with 400 messages back to a dict"),
+    ]
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        benchmarks.insert(3, Benchmark(
+            "extract_text.lxml", lambda: extract_text(fixtures["large_html"], "lxml"),
+            f"main text of a {len(fixtures['large_html']) // 1024} KB page with lxml"
+        ))
+    return benchmarks
+
+
+def time_per_call(func: Callable[[], Any], repeat: int, min_time: float) -> List[float]:
+    """
+    Seconds per call of repeat samples. Like timeit, each sample loops enough calls to
+    take at least min_time, but the garbage collector stays on: collecting the garbage
+    a function makes is part of its cost.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def allocations(func: Callable[[], Any], calls: int = 3) -> Dict[str, float]:
+    """
+    Peak memory traced during a call and memory still held after it, in KB, as the
+    median of a few calls. The result of the call is kept alive while measuring, as
+    callers would keep it.
+    """
+    peaks, retained = [], []
+    func()  # Warm up caches (compiled regexes, model validators) outside the measurement
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            gc.collect()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = func()
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+            del result
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kb": round(statistics.median(peaks) / 1024, 1),
+        "retained_kb": round(statistics.median(retained) / 1024, 1),
+    }
+
+
+def run(benchmarks: List[Benchmark], repeat: int, min_time: float) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for benchmark in benchmarks:
+        samples = time_per_call(benchmark.func, repeat, min_time)
+        results[benchmark.name] = {
+            "description": benchmark.description,
+            "median_us": round(statistics.median(samples) * 1e6, 2),
+            "min_us": round(min(samples) * 1e6, 2),
+            "stdev_us": round(statistics.stdev(samples) * 1e6, 2) if len(samples) > 1 else 0.0,
+            **allocations(benchmark.func),
+        }
+        row = results[benchmark.name]
+        print(f"{benchmark.name:<32} {row['median_us']:>12.1f} {row['min_us']:>12.1f} "
+              f"{row['peak_kb']:>10.1f} {row['retained_kb']:>12.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the backend's per-request Python work")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7, help="Timing samples per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timing sample")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    parser.add_argument("--label", default="local", help="Name of the run in the results file name")
+    parser.add_argument("--output", default=None, help="Results file (default benchmarks/results/micro-<label>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Results file of a baseline run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="Fail when the median time or peak memory of a benchmark grows by more than this fraction")
+    args = parser.parse_args()
+
+    benchmarks = build_benchmarks(build_fixtures())
+    if args.filter:
+        benchmarks = [benchmark for benchmark in benchmarks if args.filter in benchmark.name]
+    if args.list:
+        for benchmark in benchmarks:
+            print(f"{benchmark.name:<32} {benchmark.description}")
+        return
+
+    print(f"{'benchmark':<32} {'median (us)':>12} {'min (us)':>12} {'peak (KB)':>10} {'retained (KB)':>12}")
+    results = {
+        "meta": {**environment(), "label": args.label, "repeat": args.repeat, "min_time_s": args.min_time},
+        "benchmarks": run(benchmarks, args.repeat, args.min_time),
+    }
+    path = save_results("micro", args.label, results, args.output)
+    print(f"\nSaved results to {path}")
+
+    if args.compare:
+        baseline = load_results(args.compare)["benchmarks"]
+        exit_on_regressions(compare(baseline, results["benchmarks"], ["median_us", "peak_kb"], args.max_regression))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of values, q between 0 and 1.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def latency_summary(latencies_ms: Sequence[float]) -> Dict[str, Optional[float]]:
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return round(value, 3) if value is not None else None
+
+    return {
+        "mean_ms": rounded(sum(latencies_ms) / len(latencies_ms)) if latencies_ms else None,
+        "p50_ms": rounded(percentile(latencies_ms, 0.50)),
+        "p95_ms": rounded(percentile(latencies_ms, 0.95)),
+        "p99_ms": rounded(percentile(latencies_ms, 0.99)),
+        "max_ms": rounded(max(latencies_ms)) if latencies_ms else None,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """
+    What the results were measured on, so runs on different machines or commits aren't
+    compared by mistake.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).parent
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save_results(kind: str, label: str, results: Dict[str, Any], output: Optional[str] = None) -> Path:
+    """
+    Write results as JSON, by default to benchmarks/results/<kind>-<label>-<timestamp>.json.
+    """
+    path = Path(output) if output else RESULTS_DIR / f"{kind}-{label}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, sort_keys=True))
+    return path
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text())
+
+
+def compare(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]], metrics: List[str],
+            max_regression: float) -> List[str]:
+    """
+    Print the change of each metric per benchmark against a baseline run and return the
+    ones that got worse by more than max_regression (a fraction, higher is worse for all
+    metrics compared).
+    """
+    regressions = []
+    print(f"\n{'benchmark':<32} {'metric':<14} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name in sorted(set(baseline) & set(current)):
+        for metric in metrics:
+            before, after = baseline[name].get(metric), current[name].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            flag = " !" if change > max_regression else ""
+            print(f"{name:<32} {metric:<14} {before:>12.3f} {after:>12.3f} {change:>+8.1%}{flag}")
+            if change > max_regression:
+                regressions.append(f"{name} {metric} {change:+.1%}")
+    return regressions
+
+
+def exit_on_regressions(regressions: List[str]):
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): " + ", ".join(regressions), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,76 @@
+"""
+Serve the backend against the fake upstreams of benchmarks.fakes instead of Azure
+OpenAI, DuckDuckGo, the web and Cosmos DB (sessions and workflows go to a SQLite file).
+
+    python -m benchmarks.serve --fakes-url http://127.0.0.1:8765 --port 8766
+
+The load test starts this itself unless it is pointed at a running server with --url.
+"""
+import argparse
+import os
+import tempfile
+from typing import List
+
+import aiohttp
+
+
+def configure(fakes_url: str, data_dir: str):
+    """
+    Point the app's settings at the fakes. Must run before the app is imported.
+    """
+    os.environ.setdefault("AZURE_ENDPOINT", fakes_url)
+    os.environ.setdefault("AZURE_API_KEY", "benchmark")
+    os.environ.setdefault("AZURE_DEPLOYMENT_NAME", "benchmark-model")
+    os.environ.setdefault("PERSISTENCE_BACKEND", "sqlite")
+    os.environ.setdefault("SQLITE_PATH", os.path.join(data_dir, "benchmark.db"))
+    os.environ.setdefault("BENCHMARK_FAKES_URL", fakes_url)
+
+
+def fake_search_backend(fakes_url: str):
+    """
+    A search backend for the AdaptiveSearcher that queries the fake search endpoint.
+    """
+    session = None
+
+    async def search(query: str, max_results: int) -> List[dict]:
+        nonlocal session
+        if session is None or session.closed:
+            session = aiohttp.ClientSession()
+        async with session.get(f"{fakes_url}/search", params={"q": query, "max_results": max_results}) as response:
+            response.raise_for_status()
+            return await response.json()
+    return search
+
+
+def create_app():
+    from app.main import app
+    from app.services.search_backends import BackendStats, search_backend
+
+    fakes_url = os.environ["BENCHMARK_FAKES_URL"]
+    search_backend.backends = {"fake": fake_search_backend(fakes_url)}
+    search_backend.stats_by_backend = {"fake": BackendStats()}
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the backend against the fake upstreams")
+    parser.add_argument("--fakes-url", default="http://127.0.0.1:8765")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--data-dir", default=None, help="Where the SQLite database goes (a new temp dir by default)")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    configure(args.fakes_url, args.data_dir or tempfile.mkdtemp(prefix="panta-bench-"))
+
+    import logging
+    import uvicorn
+
+    app = create_app()
+    # The app configures logging for LOG_LEVEL on import, keep it out of the profile
+    logging.getLogger().setLevel(args.log_level.upper())
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level, access_log=False)
+
+
+if __name__ == "__main__":
+    main()
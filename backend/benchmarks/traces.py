@@ -0,0 +1,111 @@
+"""
+Print the waterfall of traces the backend exported to a file (TRACE_EXPORTER=file).
+
+    cd backend
+    TRACE_EXPORTER=file TRACE_FILE=traces.jsonl python -m benchmarks.serve ...
+    python -m benchmarks.traces traces.jsonl                      # the 5 slowest requests
+    python -m benchmarks.traces traces.jsonl --root "POST /api/chat/completions" --slowest 3
+    python -m benchmarks.traces traces.jsonl --trace <X-Trace-Id of a response>
+
+Each line shows when a span started relative to the start of its trace, a bar over
+the trace's timeline, its duration, name and attributes, indented under its parent.
+"""
+import argparse
+import json
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+BAR_WIDTH = 40
+
+
+def load_spans(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    The spans of every trace in an OTLP JSON lines file, by trace ID.
+    """
+    traces: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        traces[span["traceId"]].append(span)
+    return traces
+
+
+def attribute_value(value: Dict[str, Any]) -> Any:
+    for key in ("stringValue", "intValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return value
+
+
+def root_span(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ids = {span["spanId"] for span in spans}
+    roots = [span for span in spans if span.get("parentSpanId") not in ids]
+    return min(roots or spans, key=lambda span: int(span["startTimeUnixNano"]))
+
+
+def duration_ms(span: Dict[str, Any]) -> float:
+    return (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+
+
+def print_waterfall(trace_id: str, spans: List[Dict[str, Any]]):
+    root = root_span(spans)
+    start = min(int(span["startTimeUnixNano"]) for span in spans)
+    end = max(int(span["endTimeUnixNano"]) for span in spans)
+    total = max(end - start, 1)
+    children: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+    ids = {span["spanId"] for span in spans}
+    for span in spans:
+        parent = span.get("parentSpanId")
+        children[parent if parent in ids else None].append(span)
+
+    print(f"\ntrace {trace_id}  {root['name']}  {duration_ms(root):.1f} ms  ({len(spans)} spans)")
+
+    def show(span: Dict[str, Any], depth: int):
+        offset = int(span["startTimeUnixNano"]) - start
+        left = int(offset / total * BAR_WIDTH)
+        width = max(1, int((int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / total * BAR_WIDTH))
+        bar = " " * left + "#" * min(width, BAR_WIDTH - left)
+        attributes = " ".join(
+            f"{attribute['key']}={attribute_value(attribute['value'])}" for attribute in span.get("attributes", [])
+        )
+        error = " ERROR " + span["status"].get("message", "") if span.get("status", {}).get("code") == 2 else ""
+        print(f"{offset / 1e6:>9.1f} {bar:<{BAR_WIDTH}} {duration_ms(span):>9.1f} ms  "
+              f"{'  ' * depth}{span['name']}{error}  {attributes}")
+        for child in sorted(children[span["spanId"]], key=lambda child: int(child["startTimeUnixNano"])):
+            show(child, depth + 1)
+
+    for top in sorted(children[None], key=lambda span: int(span["startTimeUnixNano"])):
+        show(top, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print waterfalls of exported traces")
+    parser.add_argument("file", help="OTLP JSON lines file written by TRACE_EXPORTER=file")
+    parser.add_argument("--trace", default=None, help="Show this trace ID only")
+    parser.add_argument("--root", default=None, help="Only traces whose root span has this name, e.g. 'POST /api/chat/completions'")
+    parser.add_argument("--slowest", type=int, default=5, help="Show the N slowest traces")
+    args = parser.parse_args()
+
+    traces = load_spans(args.file)
+    if args.trace:
+        if args.trace not in traces:
+            parser.error(f"Trace {args.trace} not found in {args.file}")
+        print_waterfall(args.trace, traces[args.trace])
+        return
+
+    candidates = [
+        (trace_id, spans) for trace_id, spans in traces.items()
+        if args.root is None or root_span(spans)["name"] == args.root
+    ]
+    candidates.sort(key=lambda item: -duration_ms(root_span(item[1])))
+    print(f"{len(candidates)} trace(s) in {args.file}, showing the {min(args.slowest, len(candidates))} slowest")
+    for trace_id, spans in candidates[:args.slowest]:
+        print_waterfall(trace_id, spans)
+
+
+if __name__ == "__main__":
+    main()
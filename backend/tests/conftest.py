@@ -0,0 +1,74 @@
+import asyncio
+import os
+import tempfile
+import threading
+
+os.environ["PERSISTENCE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "tests.db")
+# Tests never reach Azure OpenAI: its clients fail to start and tests replace them
+for name in ("AZURE_API_KEY", "AZURE_ENDPOINT", "AZURE_OPENAI_API_KEY", "AZURE_OPENAI_ENDPOINT", "OPENAI_API_KEY"):
+    os.environ.pop(name, None)
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+
+class AppClient:
+    """
+    Requests against the app from synchronous tests.
+
+    The app's resources (the SQLite repository, worker pools) can only be started and
+    stopped once per process, so one lifespan stays open on a background event loop for
+    the whole test session and every request runs on that loop.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._lifespan = app.router.lifespan_context(app)
+        self.client = None
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=60)
+
+    async def _open(self):
+        await self._lifespan.__aenter__()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+    async def _close(self):
+        await self.client.aclose()
+        await self._lifespan.__aexit__(None, None, None)
+
+    def start(self):
+        self._thread.start()
+        self.run(self._open())
+
+    def stop(self):
+        self.run(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self.run(self.client.request(method, url, **kwargs))
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("PATCH", url, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def api():
+    client = AppClient()
+    client.start()
+    yield client
+    client.stop()
@@ -0,0 +1,109 @@
+from typing import Any, Dict, List
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from app.routers import chat
+
+USER_ID = "user-history"
+SYSTEM_PROMPT = {"role": "system", "content": "You answer in one sentence."}
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls: List[List[Dict[str, Any]]] = []
+
+    def create(self, messages, **kwargs) -> ChatCompletion:
+        self.calls.append(list(messages))
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-{len(self.calls)}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "test",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"Answer {len(self.calls)}"},
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+        })
+
+
+class FakeClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": FakeCompletions()})()
+
+
+@pytest.fixture
+def completions(monkeypatch) -> FakeCompletions:
+    client = FakeClient()
+    monkeypatch.setattr(chat, "get_client", lambda: client)
+    return client.chat.completions
+
+
+@pytest.fixture
+def session_id(api) -> str:
+    created = api.post("/api/cosmos/sessions", json={
+        "workflowId": "workflow-1", "workflowTitle": "Chat Assistant", "userId": USER_ID,
+    })
+    assert created.status_code == 200
+    return created.json()["id"]
+
+
+def send(api, session_id: str, text: str, **fields):
+    response = api.post("/api/chat/completions", json={
+        "messages": [SYSTEM_PROMPT, {"role": "user", "content": text}],
+        "session_id": session_id,
+        "user_id": USER_ID,
+        **fields,
+    })
+    assert response.status_code == 200
+    return response
+
+
+def test_turns_are_saved_without_system_prompts(api, completions, session_id):
+    send(api, session_id, "First question")
+    send(api, session_id, "Second question")
+
+    session = api.get(f"/api/cosmos/sessions/{session_id}/{USER_ID}").json()
+    assert [(message["role"], message["content"]) for message in session["messages"]] == [
+        ("user", "First question"),
+        ("assistant", "Answer 1"),
+        ("user", "Second question"),
+        ("assistant", "Answer 2"),
+    ]
+    # The second turn sees the first one, and only the system prompt it was sent with
+    assert completions.calls[1] == [
+        {"role": "user", "content": "First question"},
+        {"role": "assistant", "content": "Answer 1"},
+        SYSTEM_PROMPT,
+        {"role": "user", "content": "Second question"},
+    ]
+
+
+def test_history_limit(api, completions, session_id):
+    send(api, session_id, "First question")
+    send(api, session_id, "Second question")
+
+    send(api, session_id, "Third question", history_limit=0)
+    assert completions.calls[-1] == [SYSTEM_PROMPT, {"role": "user", "content": "Third question"}]
+
+    send(api, session_id, "Fourth question", history_limit=2)
+    assert completions.calls[-1][:2] == [
+        {"role": "user", "content": "Third question"},
+        {"role": "assistant", "content": "Answer 3"},
+    ]
+
+    send(api, session_id, "Fifth question", history_limit=None)
+    assert len(completions.calls[-1]) == 8 + 2
+
+
+def test_negative_history_limit_is_rejected(api, completions, session_id):
+    response = api.post("/api/chat/completions", json={
+        "messages": [{"role": "user", "content": "Hello"}],
+        "session_id": session_id,
+        "user_id": USER_ID,
+        "history_limit": -1,
+    })
+    assert response.status_code == 422
+    assert completions.calls == []
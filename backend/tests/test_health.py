@@ -0,0 +1,39 @@
+import asyncio
+
+from app.services.resources import ResourceRegistry
+
+
+def test_health_reports_failed_resource(api):
+    # Tests run without Azure OpenAI settings, so its clients fail to start
+    health = api.get("/health")
+    assert health.status_code == 503
+    report = health.json()
+    assert report["status"] == "degraded"
+    assert report["resources"]["openai_chat"]["status"] == "failed"
+    assert report["resources"]["openai_chat"]["error"]
+    assert report["resources"]["sqlite"]["status"] == "ok"
+    assert report["resources"]["default_workflows"]["status"] == "ok"
+
+
+def test_failed_resource_skips_its_dependents():
+    async def fail():
+        raise ConnectionError("unreachable")
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    registry = ResourceRegistry(default_timeout=5)
+    registry.register("database", start=fail)
+    registry.register("schema", start=lambda: asyncio.sleep(0), depends_on=("database",))
+    registry.register("search", start=hang, timeout=0.05)
+    registry.register("cache", start=lambda: asyncio.sleep(0))
+    asyncio.run(registry.start_all())
+
+    resources = registry.report()["resources"]
+    assert resources["database"]["status"] == "failed"
+    assert resources["database"]["error"] == "unreachable"
+    assert resources["schema"]["status"] == "skipped"
+    assert resources["schema"]["error"] == "database is unavailable"
+    assert resources["search"]["status"] == "timeout"
+    assert resources["cache"]["status"] == "ok"
+    assert not registry.healthy()
@@ -0,0 +1,38 @@
+import asyncio
+import gc
+
+from app.services.search_backends import AdaptiveSearcher
+
+
+def test_failures_finishing_with_the_winner_are_recorded(caplog):
+    answered = None
+
+    async def found(query: str, max_results: int):
+        await answered.wait()
+        return [{"title": query}]
+
+    async def failed(query: str, max_results: int):
+        await answered.wait()
+        raise ConnectionError("reset by peer")
+
+    async def search() -> list:
+        nonlocal answered
+        answered = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.05, answered.set)
+        return await searcher.search("python", 5)
+
+    # Both backends run (the second one as a hedge) and finish together, in either order
+    searcher = AdaptiveSearcher({"found": found, "failed": failed}, default_hedge_delay=0.01)
+    for _ in range(10):
+        # Keep the ranking and hedge delay of the first round
+        searcher.stats_by_backend["found"].latencies.clear()
+        searcher.stats_by_backend["failed"].latencies.clear()
+        searcher.stats_by_backend["failed"].error_rate = 0.0
+        assert asyncio.run(search()) == [{"title": "python"}]
+    gc.collect()
+
+    stats = searcher.stats()
+    assert stats["found"]["wins"] == 10
+    assert stats["failed"]["calls"] == 10
+    assert stats["failed"]["errors"] == 10
+    assert "never retrieved" not in caplog.text
@@ -0,0 +1,61 @@
+import os
+from typing import Dict, List
+
+import pytest
+
+
+@pytest.fixture
+def user_id(api) -> str:
+    user_id = f"user-{os.urandom(4).hex()}"
+    for day in range(1, 6):
+        response = api.post("/api/cosmos/sessions", json={
+            "id": f"session-{day}",
+            "workflowId": "workflow-1",
+            "workflowTitle": f"Chat {day}",
+            "userId": user_id,
+            "createdAt": f"2026-01-0{day}T09:00:00",
+            "updatedAt": f"2026-01-0{day}T09:00:00",
+        })
+        assert response.status_code == 200
+    return user_id
+
+
+def list_pages(api, user_id: str, limit: int) -> List[Dict]:
+    pages = []
+    continuation = None
+    while True:
+        params = {"limit": limit}
+        if continuation is not None:
+            params["continuation"] = continuation
+        response = api.get(f"/api/cosmos/users/{user_id}/sessions", params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        continuation = pages[-1]["continuation"]
+        if continuation is None:
+            return pages
+
+
+def test_pages_follow_the_continuation_newest_first(api, user_id):
+    pages = list_pages(api, user_id, limit=2)
+
+    assert [len(page["items"]) for page in pages] == [2, 2, 1]
+    assert [item["id"] for page in pages for item in page["items"]] == [
+        "session-5", "session-4", "session-3", "session-2", "session-1"
+    ]
+    assert all(item["messageCount"] == 0 for page in pages for item in page["items"])
+
+
+def test_a_new_message_moves_its_session_to_the_first_page(api, user_id):
+    response = api.post(f"/api/cosmos/sessions/session-1/{user_id}/messages", json={
+        "role": "user", "content": "Hello again"
+    })
+    assert response.status_code == 200
+
+    [first, *_] = list_pages(api, user_id, limit=2)
+    assert [item["id"] for item in first["items"]] == ["session-1", "session-5"]
+    assert first["items"][0]["messageCount"] == 1
+
+
+def test_an_invalid_continuation_is_rejected(api, user_id):
+    response = api.get(f"/api/cosmos/users/{user_id}/sessions", params={"continuation": "not-a-token"})
+    assert response.status_code == 400
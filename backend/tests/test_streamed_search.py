@@ -0,0 +1,78 @@
+import asyncio
+import json
+from typing import Dict, List
+
+import pytest
+
+from app.routers import web_search
+from app.services.relevance import analyze_pages
+from app.services.search_cache import search_cache
+
+PAGES = {
+    "https://example.com/asyncio": "Asyncio runs coroutines on an event loop. Tasks wrap coroutines. Python asyncio is cooperative.",
+    "https://example.com/threads": "Threads run in parallel. The GIL limits Python threads. Asyncio avoids threads.",
+    "https://example.com/cooking": "Boil the pasta. Add salt to the water. Serve with sauce.",
+}
+
+
+@pytest.fixture
+def searches(monkeypatch) -> List[str]:
+    queries = []
+
+    async def search_hits(query: str, max_results: int, max_retries: int = 3) -> List[dict]:
+        queries.append(query)
+        await asyncio.sleep(0.05)
+        return [
+            web_search.to_search_result({"title": url, "href": url, "body": url})
+            for url in list(PAGES)[:max_results]
+        ]
+
+    async def fetch_page_content(url: str, timeout: int = 10) -> str:
+        await asyncio.sleep(0.01)
+        return PAGES[url]
+
+    monkeypatch.setattr(web_search, "search_hits", search_hits)
+    monkeypatch.setattr(web_search, "fetch_page_content", fetch_page_content)
+    return queries
+
+
+async def stream(api, query: str, requests: int = 1):
+    return await asyncio.gather(*(
+        api.client.post("/api/web-search/search", json={"query": query, "stream": True})
+        for _ in range(requests)
+    ))
+
+
+def events(response) -> List[Dict]:
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_concurrent_streams_share_one_search(api, searches):
+    before = search_cache.stats()
+    first, second = api.run(stream(api, "python asyncio", requests=2))
+    after = search_cache.stats()
+
+    assert searches == ["python asyncio"]
+    assert after["misses"] - before["misses"] == 1
+    assert after["coalesced"] - before["coalesced"] == 1
+    for response in (first, second):
+        streamed = events(response)
+        assert [event["type"] for event in streamed].count("result") == len(PAGES)
+        assert [event["type"] for event in streamed].count("analysis") == len(PAGES)
+        assert streamed[-1] == {"type": "done", "count": len(PAGES)}
+
+
+def test_streamed_search_caches_batch_scores(api, searches):
+    events(api.run(stream(api, "python threads"))[0])
+
+    # A search without streaming is now a cache hit, scored like an uncached one
+    before = search_cache.stats()
+    cached = api.post("/api/web-search/search", json={"query": "python threads"})
+    assert search_cache.stats()["hits"] - before["hits"] == 1
+    assert searches == ["python threads"]
+    analyses = analyze_pages(list(PAGES.values()), "python threads")
+    assert [result["relevance_score"] for result in cached.json()] == [
+        analysis["relevance_score"] for analysis in analyses
+    ]
+    assert [result["key_points"] for result in cached.json()] == [analysis["key_points"] for analysis in analyses]
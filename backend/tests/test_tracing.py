@@ -0,0 +1,70 @@
+from typing import List
+
+import httpx
+import pytest
+
+from app.services.tracing import SERVER, Span, TracedTransport, Tracer, _current_span
+
+
+class RecordingTracer(Tracer):
+    """Keeps the ended spans instead of exporting them."""
+
+    def __init__(self):
+        super().__init__(exporter=object())
+        self.ended: List[Span] = []
+
+    def end(self, span: Span, end_ns=None):
+        span.end_ns = end_ns or 1
+        self.ended.append(span)
+
+
+@pytest.fixture
+def tracer():
+    return RecordingTracer()
+
+
+def post(tracer: Tracer, handler) -> Span:
+    """POST to an upstream answered by handler within a traced request, returning its server span."""
+    server = tracer.start_span("POST /api/chat", SERVER)
+    token = _current_span.set(server)
+    try:
+        with httpx.Client(transport=TracedTransport(tracer, "openai", httpx.MockTransport(handler))) as client:
+            client.post("https://example.openai.azure.com/chat/completions", json={})
+    finally:
+        _current_span.reset(token)
+    return server
+
+
+def test_traced_call_sends_its_traceparent(tracer):
+    sent = []
+
+    def handler(request):
+        sent.append(request.headers["traceparent"])
+        return httpx.Response(429)
+
+    server = post(tracer, handler)
+    [span] = tracer.ended
+    assert sent == [span.traceparent]
+    assert span.parent_id == server.span_id
+    assert span.attributes["http.status_code"] == 429
+    assert span.error == "HTTP 429"
+    assert server.attributes["openai.calls"] == 1
+
+
+def test_call_failing_without_a_response_ends_its_span(tracer):
+    def handler(request):
+        raise httpx.ConnectTimeout("timed out", request=request)
+
+    with pytest.raises(httpx.ConnectTimeout):
+        post(tracer, handler)
+    [span] = tracer.ended
+    assert span.error == "timed out"
+    assert span.attributes["exception.type"] == "ConnectTimeout"
+    assert "http.status_code" not in span.attributes
+
+
+def test_calls_outside_a_traced_request_are_not_traced(tracer):
+    transport = TracedTransport(tracer, "openai", httpx.MockTransport(lambda request: httpx.Response(200)))
+    with httpx.Client(transport=transport) as client:
+        assert "traceparent" not in client.get("https://example.com").request.headers
+    assert tracer.ended == []
@@ -0,0 +1,43 @@
+import pytest
+
+WORKFLOW = {
+    "title": "Release notes",
+    "description": "Drafts release notes from a changelog",
+    "system_prompt": "You write concise release notes.",
+    "icon_name": "FileText",
+    "color": "#F59E0B",
+    "user_id": "user-configs",
+    "conversation_starters": [{"id": "1", "text": "Summarize this changelog"}],
+}
+
+
+@pytest.fixture(scope="module")
+def workflow(api):
+    created = api.post("/api/workflows", json=WORKFLOW)
+    assert created.status_code == 200
+    return created.json()
+
+
+def test_config_of_user_workflow(api, workflow):
+    config = api.get(f"/api/configs/{workflow['id']}")
+    assert config.status_code == 200
+    assert config.json()["id"] == workflow["id"]
+    assert config.json()["title"] == WORKFLOW["title"]
+    assert config.json()["system_prompt"] == WORKFLOW["system_prompt"]
+    assert config.json()["conversation_starters"] == WORKFLOW["conversation_starters"]
+
+
+def test_config_of_unknown_workflow_falls_back(api):
+    # Ids that are neither a config nor a workflow still get the generic config
+    config = api.get("/api/configs/workflow-missing")
+    assert config.status_code == 200
+    assert config.json()["id"] == "workflow-missing"
+    assert config.json()["title"] == "Chat Assistant"
+
+
+def test_update_workflow_rejects_invalid_body(api, workflow):
+    update = api.put(
+        f"/api/workflows/{workflow['id']}", params={"user_id": WORKFLOW["user_id"]},
+        json={"conversation_starters": "not a list"}
+    )
+    assert update.status_code == 422
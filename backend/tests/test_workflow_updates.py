@@ -0,0 +1,51 @@
+import pytest
+
+USER_ID = "user-updates"
+
+
+@pytest.fixture
+def workflow_id(api) -> str:
+    created = api.post("/api/workflows", json={
+        "title": "Meeting notes",
+        "description": "Turns a transcript into notes",
+        "system_prompt": "You write meeting notes.",
+        "icon_name": "FileText",
+        "color": "#10B981",
+        "user_id": USER_ID,
+        "conversation_starters": [],
+    })
+    assert created.status_code == 200
+    return created.json()["id"]
+
+
+def test_update_with_current_etag(api, workflow_id):
+    read = api.get(f"/api/workflows/{workflow_id}", params={"user_id": USER_ID})
+    assert read.status_code == 200
+    assert read.headers.get("ETag")
+
+    updated = api.patch(
+        f"/api/workflows/{workflow_id}", params={"user_id": USER_ID},
+        json={"title": "Standup notes"}, headers={"If-Match": read.headers["ETag"]}
+    )
+    assert updated.status_code == 200
+    assert updated.json()["title"] == "Standup notes"
+    assert updated.json()["description"] == "Turns a transcript into notes"
+    assert updated.headers["ETag"] != read.headers["ETag"]
+
+
+def test_update_with_stale_etag_fails(api, workflow_id):
+    stale = api.get(f"/api/workflows/{workflow_id}", params={"user_id": USER_ID}).headers["ETag"]
+    first = api.patch(
+        f"/api/workflows/{workflow_id}", params={"user_id": USER_ID},
+        json={"title": "First edit"}, headers={"If-Match": stale}
+    )
+    assert first.status_code == 200
+
+    second = api.patch(
+        f"/api/workflows/{workflow_id}", params={"user_id": USER_ID},
+        json={"title": "Second edit"}, headers={"If-Match": stale}
+    )
+    assert second.status_code == 412
+    current = api.get(f"/api/workflows/{workflow_id}", params={"user_id": USER_ID})
+    assert current.json()["title"] == "First edit"
+    assert current.headers["ETag"] == first.headers["ETag"]
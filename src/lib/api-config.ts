@@ -5,6 +5,7 @@ export const API_CONFIG = {
     sessions: '/api/cosmos/sessions',
     session: (sessionId: string, userId: string) => `/api/cosmos/sessions/${sessionId}/${userId}`,
     messages: (sessionId: string, userId: string) => `/api/cosmos/sessions/${sessionId}/${userId}/messages`,
+    messagesBatch: (sessionId: string, userId: string) => `/api/cosmos/sessions/${sessionId}/${userId}/messages/batch`,
     files: {
       upload: '/api/files/upload',
       list: '/api/files/list',
@@ -20,6 +20,10 @@ export interface ChatCompletionRequest {
   max_tokens?: number;
   use_web_search?: boolean;
   file_ids?: string[];
+  // Send only the new turn; the backend loads the history and saves the turn
+  session_id?: string;
+  user_id?: string;
+  history_limit?: number;
 }
 
 export interface ChatCompletionResponse {
@@ -114,6 +118,8 @@ interface WorkflowConfig {
 export class ApiService {
   private static instance: ApiService;
   private baseUrl: string;
+  // ETag of the version of each workflow last read or written, sent as If-Match on updates
+  private workflowEtags = new Map<string, string>();
 
   private constructor() {
     this.baseUrl = 'http://localhost:8000';
@@ -307,6 +313,31 @@ export class ApiService {
     }
   }
 
+  public async addMessages(sessionId: string, userId: string, messages: Omit<ChatMessage, 'id'>[]): Promise<ChatMessage[]> {
+    try {
+      const messagesData = messages.map(message => ({
+        ...message,
+        timestamp: new Date().toISOString(),
+        userId: userId
+      }));
+      
+      const response = await fetch(`${this.baseUrl}${API_CONFIG.endpoints.messagesBatch(sessionId, userId)}`, {
+        method: 'POST',
+        headers: API_HEADERS,
+        body: JSON.stringify({ messages: messagesData }),
+      });
+
+      if (!response.ok) {
+        throw new Error('Failed to add messages');
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error('Error adding messages:', error);
+      throw error;
+    }
+  }
+
   // File operations
   public async uploadFile(file: File): Promise<FileInfo> {
     try {
@@ -417,49 +448,59 @@ export class ApiService {
     try {
       console.log('Sending message with data:', JSON.stringify(data, null, 2));
       
-      // First, save the user message to the database
-      const userMessage = await this.addMessage(data.sessionId, data.userId, {
+      const userMessage: Omit<ChatMessage, 'id'> = {
         role: 'user',
         content: data.message,
         file_ids: data.fileIds || []
-      });
-      console.log('User message saved:', userMessage);
+      };
 
       // Get AI response
-      const response = await fetch(`${this.baseUrl}${API_CONFIG.endpoints.chat}`, {
-        method: 'POST',
-        headers: API_HEADERS,
-        body: JSON.stringify({
-          messages: [
-            ...(data.systemPrompt ? [{
-              role: 'system',
-              content: data.systemPrompt
-            }] : []),
-            {
-              role: 'user',
-              content: data.message
-            }
-          ],
-          file_ids: data.fileIds || []
-        }),
-      });
-
-      if (!response.ok) {
-        const errorText = await response.text();
-        console.error('Message sending failed:', errorText);
-        throw new Error(`HTTP error! status: ${response.status} - ${errorText}`);
+      let responseData;
+      try {
+        const response = await fetch(`${this.baseUrl}${API_CONFIG.endpoints.chat}`, {
+          method: 'POST',
+          headers: API_HEADERS,
+          body: JSON.stringify({
+            messages: [
+              ...(data.systemPrompt ? [{
+                role: 'system',
+                content: data.systemPrompt
+              }] : []),
+              {
+                role: 'user',
+                content: data.message
+              }
+            ],
+            file_ids: data.fileIds || []
+          }),
+        });
+
+        if (!response.ok) {
+          const errorText = await response.text();
+          console.error('Message sending failed:', errorText);
+          throw new Error(`HTTP error! status: ${response.status} - ${errorText}`);
+        }
+
+        responseData = await response.json();
+        console.log('Message response:', JSON.stringify(responseData, null, 2));
+      } catch (error) {
+        // Keep the user's message in the session even without a reply
+        await this.addMessage(data.sessionId, data.userId, userMessage).catch(saveError =>
+          console.error('Error saving user message:', saveError)
+        );
+        throw error;
       }
 
-      const responseData = await response.json();
-      console.log('Message response:', JSON.stringify(responseData, null, 2));
-      
-      // Save the AI response to the database
-      const assistantMessage = await this.addMessage(data.sessionId, data.userId, {
-        role: 'assistant',
-        content: responseData.choices[0].message.content,
-        file_ids: data.fileIds || []
-      });
-      console.log('Assistant message saved:', assistantMessage);
+      // Save the turn, the user message and the AI response, in one request
+      const savedMessages = await this.addMessages(data.sessionId, data.userId, [
+        userMessage,
+        {
+          role: 'assistant',
+          content: responseData.choices[0].message.content,
+          file_ids: data.fileIds || []
+        }
+      ]);
+      console.log('Messages saved:', savedMessages);
       
       return { content: responseData.choices[0].message.content };
     } catch (error) {
@@ -501,6 +542,7 @@ export class ApiService {
         throw new Error(`API error: ${response.statusText} - ${errorText}`);
       }
 
+      this.rememberWorkflowEtag(workflowId, response);
       return await response.json();
     } catch (error) {
       console.error('Error getting workflow:', error);
@@ -508,20 +550,35 @@ export class ApiService {
     }
   }
 
+  private rememberWorkflowEtag(workflowId: string, response: Response) {
+    const etag = response.headers.get('ETag');
+    if (etag) {
+      this.workflowEtags.set(workflowId, etag);
+    }
+  }
+
+  // Fails if the workflow changed since it was last read with getWorkflow
   public async updateWorkflow(workflowId: string, workflowData: Partial<Workflow>, userId: string): Promise<Workflow> {
     try {
+      const etag = this.workflowEtags.get(workflowId);
       const response = await fetch(`${this.baseUrl}${API_CONFIG.endpoints.workflows.update(workflowId)}?user_id=${userId}`, {
-        method: 'PUT',
-        headers: API_HEADERS,
+        method: 'PATCH',
+        headers: etag ? { ...API_HEADERS, 'If-Match': etag } : API_HEADERS,
         body: JSON.stringify(workflowData),
       });
 
+      if (response.status === 412) {
+        this.workflowEtags.delete(workflowId);
+        throw new Error('This workflow was changed elsewhere. Reload it and try again.');
+      }
+
       if (!response.ok) {
         const errorText = await response.text();
         console.error('Failed to update workflow:', errorText);
         throw new Error(`API error: ${response.statusText} - ${errorText}`);
       }
 
+      this.rememberWorkflowEtag(workflowId, response);
       return await response.json();
     } catch (error) {
       console.error('Error updating workflow:', error);
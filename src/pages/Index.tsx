@@ -27,7 +27,7 @@ import { useNavigate } from "react-router-dom";
 import { useTheme } from "@/contexts/ThemeContext";
 import { useLanguage } from "@/contexts/LanguageContext";
 import LanguageSelector from "@/components/LanguageSelector";
-import { apiService, ChatSession } from "@/lib/api-service";
+import { apiService, ChatSession, Workflow } from "@/lib/api-service";
 import { WorkflowDialog } from "@/components/WorkflowDialog";
 
 interface HistoryItemSession extends ChatSession {
@@ -206,6 +206,8 @@ const Index = () => {
   const [workflowColors, setWorkflowColors] = useState<Record<string, string>>({});
   const [workflowIcons, setWorkflowIcons] = useState<Record<string, LucideIcon>>({});
   const [editingWorkflow, setEditingWorkflow] = useState<FrontendWorkflow | null>(null);
+  // The stored workflow as it was when editing started; saving fails if it changed since
+  const [editingBase, setEditingBase] = useState<Workflow | null>(null);
   const [isWorkflowDialogOpen, setIsWorkflowDialogOpen] = useState(false);
   
   const handleSearchSubmit = (text: string, files: File[]) => {
@@ -257,6 +259,8 @@ const Index = () => {
         toast.error('Workflow configuration not found');
         return;
       }
+
+      setEditingBase(await apiService.getWorkflow(workflow.id, 'default-user'));
       
       // Convert API config to frontend workflow format
       const frontendWorkflow: FrontendWorkflow = {
@@ -285,8 +289,8 @@ const Index = () => {
       setError(null);
 
       if (editingWorkflow) {
-        // Get the existing workflow to ensure we have all fields
-        const existingWorkflow = await apiService.getWorkflow(editingWorkflow.id, 'default-user');
+        // The workflow read when editing started, so edits made elsewhere since then are detected
+        const existingWorkflow = editingBase ?? await apiService.getWorkflow(editingWorkflow.id, 'default-user');
         
         // Prepare the update data with all required fields
         const updateData = {
@@ -331,6 +335,7 @@ const Index = () => {
       // Close dialog and reset state
       setShowNewWorkflowDialog(false);
       setEditingWorkflow(null);
+      setEditingBase(null);
     } catch (err) {
       console.error('Error saving workflow:', err);
       setError(err instanceof Error ? err.message : 'Failed to save workflow');
@@ -650,6 +655,7 @@ const Index = () => {
         onClose={() => {
           setShowNewWorkflowDialog(false);
           setEditingWorkflow(null);
+          setEditingBase(null);
         }}
         onCreateWorkflow={handleCreateWorkflow}
         workflow={editingWorkflow}